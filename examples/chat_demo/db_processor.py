@@ -28,6 +28,7 @@ import sys
 from remembr.captioners.vila_captioner import VILACaptioner
 from remembr.memory.memory import MemoryItem
 from remembr.memory.milvus_memory import MilvusMemory
+from remembr.memory.embedding_batcher import BatchedEmbedder
 from PIL import Image as im
 
 import concurrent
@@ -118,7 +119,9 @@ class ROSMemoryBuilder(Node):
         self.counter = 0
 
         self.captioner = VILACaptioner(args)
-        self.memory = MilvusMemory(collection_name, db_ip=db_ip)
+        # the executor threads insert concurrently, so coalesce their embedding calls
+        self.embedder = BatchedEmbedder()
+        self.memory = MilvusMemory(collection_name, db_ip=db_ip, embedder=self.embedder)
 
     def spin(self):
         print("STARTING SPIN")
@@ -8,7 +8,6 @@ import json
 from pymilvus import MilvusClient
 from remembr.memory.milvus_memory import MilvusMemory
 from remembr.agents.remembr_agent import ReMEmbRAgent
-from langchain_core.messages import AIMessage
 
 
 class SimpleChatDemo:
@@ -79,10 +78,7 @@ class SimpleChatDemo:
         log_lines = []
         
         try:
-            # Prepare inputs
-            inputs = {"messages": [("user", message)]}
-            
-            print(f"[DEBUG] About to stream graph...")
+            print(f"[DEBUG] About to stream query...")
             log_lines.append("------------")
             log_lines.append("Starting graph execution...")
             
@@ -90,65 +86,43 @@ class SimpleChatDemo:
             current_log = "\n".join(log_lines)
             yield loading_history, "", current_log
             
-            # Use stream() to get real-time updates
-            generate_response = None
-            for output in self.agent.graph.stream(inputs):
-                for key, value in output.items():
-                    log_lines.append(f"------------")
-                    log_lines.append(f"Output from node '{key}':")
-                    
-                    if 'messages' in value:
-                        for msg_obj in value['messages']:
-                            if isinstance(msg_obj, AIMessage):
-                                if hasattr(msg_obj, 'content'):
-                                    content = str(msg_obj.content)
-                                    # Limit content length for display
-                                    if len(content) > 500:
-                                        content = content[:500] + "..."
-                                    log_lines.append(content)
-                                if hasattr(msg_obj, 'tool_calls') and msg_obj.tool_calls:
-                                    log_lines.append(f"Tool calls: {len(msg_obj.tool_calls)}")
-                            elif isinstance(msg_obj, str):
-                                log_lines.append(msg_obj)
-                    
-                    # Store generate node output
-                    if key == 'generate' and 'messages' in value and len(value['messages']) > 0:
-                        generate_response = value['messages'][-1]
-                    
-                    # Update log in real-time
-                    current_log = "\n".join(log_lines)
-                    yield loading_history, "", current_log
+            # stream_query yields tool calls, tool results and the answer text while it is generated
+            response_text = None
+            for event in self.agent.stream_query(message):
+                if event.type == 'tool_start':
+                    log_lines.append("------------")
+                    log_lines.append(f"Calling {event.content['name']} with {event.content['args']}")
+                elif event.type == 'tool_result':
+                    content = str(event.content['content'])
+                    # Limit content length for display
+                    if len(content) > 500:
+                        content = content[:500] + "..."
+                    log_lines.append(f"Output from '{event.content['name']}':")
+                    log_lines.append(content)
+                elif event.type == 'node':
+                    log_lines.append(f"Node '{event.node}' finished")
+                elif event.type == 'answer_delta':
+                    if event.content.get('text'):
+                        response_text = str(event.content['text'])
+                        yield history + [(message, response_text)], "", "\n".join(log_lines)
+                    continue
+                elif event.type == 'answer':
+                    if event.content.text:
+                        response_text = str(event.content.text)
+                elif event.type == 'error':
+                    raise event.content
+                else:
+                    # individual tokens are too noisy for the log
+                    continue
+                
+                # Update log in real-time
+                current_log = "\n".join(log_lines)
+                shown_history = history + [(message, response_text)] if response_text else loading_history
+                yield shown_history, "", current_log
             
             print(f"[DEBUG] Graph stream completed")
             
-            # Extract response from generate node or final message
-            if generate_response:
-                response_msg = generate_response
-            else:
-                # Fallback: get from final state
-                final_state = self.agent.graph.invoke(inputs)
-                if 'messages' in final_state and len(final_state['messages']) > 0:
-                    response_msg = final_state['messages'][-1]
-                else:
-                    response_msg = None
-            
-            if response_msg:
-                # Extract content
-                if hasattr(response_msg, 'content'):
-                    response_content = response_msg.content
-                else:
-                    response_content = str(response_msg)
-                
-                # Parse JSON response
-                try:
-                    response_dict = json.loads(response_content)
-                    if 'text' in response_dict and response_dict['text']:
-                        response_text = response_dict['text']
-                    else:
-                        response_text = response_content
-                except (json.JSONDecodeError, TypeError):
-                    response_text = response_content
-                
+            if response_text:
                 history.append((message, response_text))
                 print(f"[DEBUG] Response extracted: {response_text[:50]}...")
             else:
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 import inspect
 
 @dataclass
@@ -10,6 +11,8 @@ class AgentOutput:
     orientation: float
     duration: float
     time: float
+    # per-query statistics (LLM calls, agent iterations, latency breakdown), not part of the answer
+    stats: Optional[dict] = field(default=None, compare=False)
 
     @classmethod
     def from_dict(cls, dict_input):      
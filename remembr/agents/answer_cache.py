@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from remembr.agents.agent import AgentOutput
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.object_extractor import extract_objects
+
+
+# answers to these questions can change with any new memory, wherever it is
+RECENCY_RE = re.compile(r"\b(last|latest|recent|recently|now|currently|still|ago|just|today|so far)\b", re.IGNORECASE)
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    embedding: np.ndarray
+    output: AgentOutput
+    positions: Optional[np.ndarray]     # evidence positions, None if the answer depends on all memories
+    time_range: Optional[Tuple[float, float]]
+    objects: FrozenSet[str]             # objects the question asks about, a new sighting changes the answer
+    created: float
+    hits: int = 0
+
+
+def evidence_extent(items: list, time_offset: float = 0.0):
+    """
+    Positions and time range of the memories an answer was based on.
+
+    Accepts MemoryItems and retrieved Documents (whose metadata time is stored
+    minus time_offset, as in MilvusMemory). Returns (None, None) if nothing usable.
+    """
+    positions = []
+    times = []
+    for item in items:
+        if isinstance(item, MemoryItem):
+            positions.append(item.position)
+            times.append(item.time)
+        elif hasattr(item, 'metadata') and 'position' in item.metadata:
+            positions.append(item.metadata['position'])
+            if 'time' in item.metadata:
+                times.append(float(np.atleast_1d(item.metadata['time'])[0]) + time_offset)
+    if not positions:
+        return None, None
+    time_range = (min(times), max(times)) if times else None
+    return np.asarray(positions, dtype=np.float64).reshape(len(positions), -1)[:, :3], time_range
+
+
+class AnswerCache(MemoryIndex):
+    """
+    Caches agent answers by question embedding.
+
+    A question whose embedding is within threshold cosine similarity of a cached
+    question gets the cached AgentOutput back without running the agent. The
+    cache is registered as an index on the memory, so it sees every new memory
+    and drops the entries it affects:
+    - entries without evidence (e.g. NonAgent answers over the whole history)
+      and recency questions ('where did you last see ...') on any new memory
+    - entries whose question mentions an object the new memory's caption
+      mentions ('where did you see the charger' once the charger is seen again)
+    - other entries when the new memory is within radius meters of an evidence
+      or answer position, or falls inside the evidence time range
+    Answers with a relative time ('5 minutes ago') are not cached.
+    """
+
+    needs_embeddings = False
+    # entries are only invalidated by memories that arrive after they were cached
+    needs_backfill = False
+
+    def __init__(self, embedder, threshold: float = 0.95, radius: float = 5.0, max_entries: int = 256,
+                 max_age: Optional[float] = None):
+        """
+        Args:
+            embedder: Embeddings used for the questions
+            threshold: Minimum cosine similarity between questions for a hit
+            radius: New memories within this many meters of an answer's evidence invalidate it
+            max_entries: Oldest entries are dropped beyond this size
+            max_age: Optional time to live of an entry in seconds
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.radius = radius
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.entries: List[CachedAnswer] = []
+        # the memory whose inserts invalidate the entries
+        self.memory = None
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_invalidations = 0
+
+    def reset(self):
+        with self._lock:
+            self.num_invalidations += len(self.entries)
+            self.entries = []
+
+    def attach(self, memory):
+        """
+        Start receiving the memory's inserts instead of those of the memory attached
+        before. Memories without derived indexes only support exact lookups.
+        """
+        if self.memory is not None and self.memory is not memory and hasattr(self.memory, 'remove_index'):
+            self.memory.remove_index(self)
+        self.reset()
+        self.memory = memory
+        if hasattr(memory, 'add_index'):
+            memory.add_index(self)
+
+    ### Invalidation
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        position = np.asarray(item.position, dtype=np.float64)[:3]
+        objects = None
+        with self._lock:
+            if any(entry.objects for entry in self.entries):
+                objects = {obj for obj, _ in extract_objects(item.caption)}
+            kept = [entry for entry in self.entries if not self._affected(entry, position, item.time, objects)]
+            self.num_invalidations += len(self.entries) - len(kept)
+            self.entries = kept
+
+    def _affected(self, entry: CachedAnswer, position: np.ndarray, t: float, objects: Optional[set]) -> bool:
+        if entry.positions is None:
+            return True
+        if objects and not entry.objects.isdisjoint(objects):
+            return True
+        if entry.time_range is not None and entry.time_range[0] <= t <= entry.time_range[1]:
+            return True
+        return bool(np.any(np.linalg.norm(entry.positions - position, axis=1) <= self.radius))
+
+    ### Lookup
+
+    def embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        return embedding / max(np.linalg.norm(embedding), 1e-12)
+
+    def lookup(self, question: str, embedding: Optional[np.ndarray] = None) -> Tuple[Optional[AgentOutput], np.ndarray]:
+        """
+        Returns:
+            (cached output or None, question embedding to pass on to store())
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+
+        with self._lock:
+            if self.max_age is not None:
+                now = time.time()
+                self.entries = [entry for entry in self.entries if now - entry.created <= self.max_age]
+
+            if self.entries:
+                sims = np.stack([entry.embedding for entry in self.entries]) @ embedding
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry = self.entries[best]
+                    entry.hits += 1
+                    self.num_hits += 1
+                    # the stats of the query that produced the answer do not apply to this one
+                    return replace(entry.output, stats={'cache_hit': True}), embedding
+
+            self.num_misses += 1
+            return None, embedding
+
+    def store(self, question: str, embedding: np.ndarray, output: AgentOutput, evidence: Optional[list] = None,
+              time_offset: float = 0.0):
+        """
+        Cache output for question.
+
+        Args:
+            evidence: The memories the answer was based on, None if it depends on all of them
+            time_offset: Time offset of Documents in evidence (see evidence_extent)
+        """
+        if output.time is not None:
+            return
+
+        positions, time_range = (None, None)
+        if evidence is not None and not RECENCY_RE.search(question):
+            positions, time_range = evidence_extent(evidence, time_offset)
+            answer_position = _as_position(output.position)
+            if answer_position is not None:
+                positions = answer_position[None] if positions is None else np.vstack([positions, answer_position])
+
+        with self._lock:
+            self.entries.append(CachedAnswer(
+                question=question,
+                embedding=embedding,
+                output=output,
+                positions=positions,
+                time_range=time_range,
+                objects=frozenset(obj for obj, _ in extract_objects(question)),
+                created=time.time(),
+            ))
+            if len(self.entries) > self.max_entries:
+                self.entries = self.entries[-self.max_entries:]
+
+    def metrics(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'hits': self.num_hits,
+            'misses': self.num_misses,
+            'invalidations': self.num_invalidations,
+        }
+
+
+def _as_position(position) -> Optional[np.ndarray]:
+    try:
+        position = np.asarray(position, dtype=np.float64).reshape(-1)
+    except (TypeError, ValueError):
+        return None
+    return position[:3] if len(position) >= 3 else None
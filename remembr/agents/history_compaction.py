@@ -0,0 +1,100 @@
+import re
+from typing import List, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+
+# one rendered memory (see remembr.memory.formatting.MemoryFormatter), up to the blank line that ends it
+_MEMORY_RE = re.compile(r"At time=[^\n]*?The robot saw the following: .*?(?:\n\n|\Z)", re.DOTALL)
+
+EVIDENCE_HEADER = "These are the memories I have retrieved so far, cited by their label in the results below:\n"
+
+
+def split_memories(text: str) -> List[Tuple[bool, str]]:
+    """Split a tool output into (is_memory, text) segments, in order."""
+    segments = []
+    end = 0
+    for match in _MEMORY_RE.finditer(text):
+        if match.start() > end:
+            segments.append((False, text[end:match.start()]))
+        segments.append((True, match.group(0)))
+        end = match.end()
+    if end < len(text):
+        segments.append((False, text[end:]))
+    return segments
+
+
+def _is_tool_result(message: BaseMessage) -> bool:
+    # ToolMessages are turned into AIMessages for Ollama, those are the AIMessages without tool calls
+    return isinstance(message, ToolMessage) or (isinstance(message, AIMessage) and not message.tool_calls)
+
+
+def compact_history(messages: List[BaseMessage], keep_recent_steps: int = 1) -> List[BaseMessage]:
+    """
+    Compact the agent's message history before it is sent to the LLM again.
+
+    Every memory in the tool outputs gets a label ([M1], [M2], ...) the first
+    time it appears and is replaced with that citation afterwards. The outputs
+    of all but the last keep_recent_steps agent steps are squashed into their
+    citations; the full text of their memories moves to one running evidence
+    list right after the question. So every memory is sent once per prompt
+    however often it was retrieved. The messages are not modified.
+
+    Args:
+        messages: The question followed by the agent's tool calls and their results
+        keep_recent_steps: Number of latest agent steps whose outputs are kept in full
+
+    Returns:
+        the compacted messages
+    """
+    if len(messages) < 2:
+        return list(messages)
+
+    # tool results after this index belong to the steps that are kept in full
+    step_starts = [i for i, m in enumerate(messages) if isinstance(m, AIMessage) and m.tool_calls]
+    recent_start = step_starts[-keep_recent_steps] if len(step_starts) >= keep_recent_steps > 0 else len(messages)
+
+    labels = {}
+    evidence = []
+    compacted = []
+    for i, message in enumerate(messages[1:], start=1):
+        if not _is_tool_result(message) or not isinstance(message.content, str):
+            compacted.append(message)
+            continue
+
+        older = i < recent_start
+        parts = []
+        citations = []
+        for is_memory, text in split_memories(message.content):
+            if not is_memory:
+                if text.strip():
+                    parts.append(text.strip() + "\n\n")
+                continue
+
+            key = text.strip()
+            label = labels.get(key)
+            if label is None:
+                label = labels[key] = f"M{len(labels) + 1}"
+                if older:
+                    evidence.append(f"[{label}] {key}")
+                else:
+                    parts.append(f"[{label}] {key}\n\n")
+                    continue
+            citations.append(f"[{label}]")
+            if not older:
+                parts.append(f"[{label}] (see above)\n\n")
+
+        if older:
+            name = getattr(message, 'name', None) or "tool"
+            content = "".join(parts)
+            if citations:
+                content += f"The {name} results were the memories {', '.join(citations)}."
+            if not content:
+                content = f"The {name} call returned nothing new."
+        else:
+            content = "".join(parts)
+        compacted.append(message.copy(update={"content": content}))
+
+    if evidence:
+        compacted.insert(0, AIMessage(content=EVIDENCE_HEADER + "\n\n".join(evidence)))
+    return [messages[0]] + compacted
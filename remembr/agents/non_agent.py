@@ -1,7 +1,8 @@
+import contextvars
 import json
 import numpy as np
 import sys, os
-import re
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain_community.chat_models import ChatOllama
 from langchain_core.prompts import PromptTemplate
@@ -12,35 +13,100 @@ from remembr.utils.util import file_to_string
 
 from remembr.agents.agent import Agent, AgentOutput
 from remembr.memory.memory import Memory
+from remembr.memory.context_packing import ContextPacker
+from remembr.memory.formatting import default_formatter, format_timestamps
+from remembr.utils.tracing import token_usage, tracer
+from remembr.utils.partial_json import parse_answer, text_answer
+from remembr.utils.llm_calls import invoke_until_parsed, track_llm_calls
 
 
-def parse_json(string):
-    parsed = re.search(r"```json(.*?)```", string, re.DOTALL| re.IGNORECASE).group(1).strip()
-    parsed = json.loads(parsed)
-    return parsed
-
 class NonAgent(Agent):
-    def __init__(self, llm_type='llama3', num_ctx=8192, temperature=0):
+    def __init__(self, llm_type='llama3', num_ctx=8192, temperature=0, context_tokens=None, token_len=None,
+                 mode='single', chunk_tokens=6000, max_workers=4, answer_cache=None, max_attempts=3):
+        """
+        Args:
+            llm_type: Ollama model name
+            num_ctx: Context length of the LLM
+            temperature: Sampling temperature
+            context_tokens: Optional token budget for the packed caption history
+            token_len: Optional tokenizer length function used for budgeting
+            mode: 'single' puts the whole history in one prompt. 'map_reduce' asks the
+                question over time-ordered chunks concurrently and then reduces the answers.
+            chunk_tokens: Token budget of one chunk in map_reduce mode
+            max_workers: Number of concurrent chunk queries in map_reduce mode
+            answer_cache: Optional AnswerCache consulted before asking the LLM
+            max_attempts: LLM calls per answer before an unparsable response is kept as a text answer
+        """
         
         self.llm_type = llm_type
+        self.mode = mode
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max_workers
+        self.answer_cache = answer_cache
+        self.max_attempts = max_attempts
+
+        # optionally pack the caption history into a token budget instead of passing all of it
+        self.packer = None
+        if context_tokens is not None:
+            self.packer = ContextPacker(context_tokens, token_len=token_len)
+        self.token_len = token_len if token_len is not None else default_formatter.token_len
 
         if llm_type == 'gpt-4o':
             # TODO: ADD OpenAI key here!
             pass
         else:
-            self.chain = ChatOllama(model=llm_type, num_ctx=num_ctx, temperature=temperature)
-        self.prompt = file_to_string(str(os.path.dirname(__file__)) + '/../' + 'prompts/non_agent_system_prompt.txt')
+            # JSON mode keeps the output parsable
+            self.chain = ChatOllama(model=llm_type, format="json", num_ctx=num_ctx, temperature=temperature)
+        top_level_path = str(os.path.dirname(__file__)) + '/../'
+        self.prompt = file_to_string(top_level_path + 'prompts/non_agent_system_prompt.txt')
+        self.reduce_prompt = file_to_string(top_level_path + 'prompts/non_agent_reduce_system_prompt.txt')
 
 
     def set_memory(self, memory: Memory):
         self.memory = memory
-        pass
+        if self.answer_cache is not None:
+            self.answer_cache.attach(memory)
 
 
     def query(self, question: str) -> AgentOutput:
 
+        with tracer.span("query", question=question) as span, track_llm_calls() as llm_calls:
+            response = self._cached_query(question)
+            if response.stats is None:
+                # LLM calls of this query, and how many of them were wasted on unparsable output
+                response.stats = {'llm_calls': llm_calls.as_dict()}
+                span.set(**response.stats['llm_calls'])
+            return response
+
+    def _cached_query(self, question: str) -> AgentOutput:
+
+        if self.answer_cache is None:
+            return self._query(question)
+
+        cached, question_embedding = self.answer_cache.lookup(question)
+        if cached is not None:
+            return cached
+        response = self._query(question)
+        # the answer depends on the whole history, so any new memory invalidates it
+        self.answer_cache.store(question, question_embedding, response, evidence=None)
+        return response
+
+    def _query(self, question: str) -> AgentOutput:
+
+        working_memory = self.memory.get_working_memory()
+        if self.mode == 'map_reduce' and not isinstance(working_memory, str):
+            return self.query_map_reduce(question, working_memory)
+
+        if self.packer is not None:
+            context = self.packer.pack(working_memory)
+        else:
+            context = self.memory.memory_to_string(working_memory)
+
+        return AgentOutput.from_dict(self._answer(question, context))
 
 
+    def _answer(self, question: str, context: str) -> dict:
+
         response_example = """{"reasoning", "-input your reasoning in here for the type of question, then the answer-", 
                                 "type": "-input the type of answer that is expected based only on the question: position, binary, time, or text. Be sure to then fill in that selected category.",
                                 "text: "--a text answer here--",
@@ -58,34 +124,74 @@ class NonAgent(Agent):
             template=self.prompt,
             input_variables=["context", "question"],
         )
-        filled_prompt = prompt.invoke({'context': self.memory.memory_to_string(self.memory.get_working_memory()), 'question':question, 'output_format':output_format})
-        inputs = filled_prompt.text
+        filled_prompt = prompt.invoke({'context': context, 'question':question, 'output_format':output_format})
+        return self._invoke_and_parse(filled_prompt.text)
 
-        while True:
 
-            response = self.chain.invoke(inputs)
-            response = ''.join(response.content.splitlines())
-            try:
-                if '```json' not in response:
-                    # try parsing on its own since we cannot always trust llms
-                    parsed = json.loads(response) 
-                else:
-                    parsed = parse_json(response)
+    def _invoke_and_parse(self, inputs: str) -> dict:
 
-                # then check it has all the required keys
-                keys_to_check_for = ["time", "text", "binary", "position"]
-                for key in keys_to_check_for:
-                    if key not in parsed:
-                        raise ValueError("Missing all the required keys during generate. Retrying...")
-                response = AgentOutput.from_dict(parsed)
+        def invoke() -> str:
+            with tracer.span("llm", model=self.llm_type, prompt_chars=len(inputs)) as span:
+                response = self.chain.invoke(inputs)
+                span.set(**token_usage(response))
+            return ''.join(response.content.splitlines())
 
-            except Exception as e:
-                print(response)
-                print(e)
-                print("Generate call failed. Retrying...")
-                continue
+        parsed, response = invoke_until_parsed(invoke, parse_answer, self.max_attempts)
+        if parsed is None:
+            print(f"Generate call failed {self.max_attempts} times, using the response as a text answer")
+            parsed = text_answer(response)
+        return parsed
 
-            break
 
+    ### Map-reduce over long histories
 
-        return response
\ No newline at end of file
+    def split_into_chunks(self, items: list) -> list:
+        """Split a chronological history into consecutive chunks of at most chunk_tokens."""
+        lines = default_formatter.lines(
+            [item.time for item in items],
+            [item.position for item in items],
+            [item.caption for item in items],
+            thetas=[item.theta for item in items],
+        )
+        lengths = np.array([self.token_len(line) for line in lines])
+
+        chunks = []
+        start = 0
+        used = 0
+        for i, n in enumerate(lengths):
+            if i > start and used + n > self.chunk_tokens:
+                chunks.append(items[start:i])
+                start = i
+                used = 0
+            used += n
+        if start < len(items):
+            chunks.append(items[start:])
+        return chunks
+
+
+    def query_map_reduce(self, question: str, items: list) -> AgentOutput:
+
+        chunks = self.split_into_chunks(items)
+        if len(chunks) == 1:
+            return AgentOutput.from_dict(self._answer(question, self.memory.memory_to_string(chunks[0])))
+
+        # map: answer the question over every chunk, a bounded number at a time. Each chunk runs
+        # in a copy of the caller's context, so its LLM calls and spans count towards this query
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(contextvars.copy_context().run,
+                                   lambda chunk=chunk: self._answer(question, self.memory.memory_to_string(chunk)))
+                       for chunk in chunks]
+            candidates = [future.result() for future in futures]
+
+        # reduce: pick or combine the per-chunk answers
+        candidate_string = ""
+        for i, (chunk, candidate) in enumerate(zip(chunks, candidates)):
+            start, end = format_timestamps([chunk[0].time, chunk[-1].time])
+            candidate_string += f"Candidate {i} from memories between {start} and {end}: {json.dumps(candidate)}\n\n"
+
+        prompt = PromptTemplate(
+            template=self.reduce_prompt,
+            input_variables=["candidates", "question"],
+        )
+        filled_prompt = prompt.invoke({'candidates': candidate_string, 'question': question})
+        return AgentOutput.from_dict(self._invoke_and_parse(filled_prompt.text))
@@ -0,0 +1,239 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from remembr.memory.object_extractor import ING_ED_NOUNS
+
+
+ANSWER_TYPES = ["position", "time", "duration", "binary", "text"]
+
+# a few questions of every answer type, the embedding classifier compares against them
+TYPE_EXAMPLES = {
+    "position": [
+        "Where is the elevator?",
+        "Where did you last see the red backpack?",
+        "Where can I find a place to sit?",
+        "Take me to the vending machine.",
+    ],
+    "time": [
+        "When did you last see the dog?",
+        "When was the last time you saw a bike?",
+        "How long ago did you pass the fountain?",
+        "At what time did you see people playing soccer?",
+    ],
+    "duration": [
+        "How long did you stay in the lobby?",
+        "How long were you in the parking lot?",
+        "How much time did you spend near the construction site?",
+        "How long did it take to cross the bridge?",
+    ],
+    "binary": [
+        "Did you see a dog?",
+        "Have you seen any bicycles today?",
+        "Was the door open?",
+        "Is there a bench near the entrance?",
+    ],
+    "text": [
+        "What did you see at 10:05?",
+        "What happened between 13:00 and 14:00?",
+        "How many times did you see a bus?",
+        "Describe what was at the intersection.",
+    ],
+}
+
+_TIME = r"(\d{1,2}:\d{2}(?::\d{2})?)"
+_POSITION = r"\(?\[?\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\]?\)?"
+_ARTICLE = r"(?:the |a |an |any |some )?"
+_YOU = r"(?:you|we|i)"
+
+# words that make a question need more than one retrieval (comparisons, sequences, conditions)
+MULTI_HOP_RE = re.compile(
+    r"\b(after|before|then|while|when|closest|nearest|farthest|furthest|between|and|or|most|least|than|"
+    r"since|until|again|first|second|third|other|also|both)\b",
+    re.IGNORECASE,
+)
+
+# trailing words that are not part of the object
+_TRAILING_RE = re.compile(r"\s+(today|earlier|recently|so far|before|around here|here)$", re.IGNORECASE)
+
+# trailing verbs after the object ("where did you see the car go", "where is the kitchen located")
+_TRAILING_VERB_RE = re.compile(
+    r"\s+(go|goes|went|gone|going|be|is|was|were|are|located|parked|placed|kept|left|stored|put|"
+    r"sitting|standing|lying|leaning|hanging|stop|stopped)$",
+    re.IGNORECASE,
+)
+
+# objects that are not things to look up: pronouns, and times that need the agent to resolve them
+_NOT_OBJECT_RE = re.compile(
+    r"\d|\b(i|me|my|you|we|us|it|they|them|he|she|him|her|this|that|ago|earlier|later|now|yesterday|"
+    r"seconds?|minutes?|hours?|days?)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Route:
+    """A question that can be answered with a single retrieval."""
+    answer_type: str
+    tool: str
+    query: Any
+    rule: str
+    confidence: float = 1.0
+
+
+def _hms(time_string: str) -> str:
+    parts = [int(p) for p in time_string.split(":")]
+    while len(parts) < 3:
+        parts.append(0)
+    return "{:02d}:{:02d}:{:02d}".format(*parts)
+
+
+def _is_verb_like(word: str) -> bool:
+    word = word.lower()
+    if word in ING_ED_NOUNS:
+        return False
+    return (word.endswith("ing") and len(word) > 5) or (word.endswith("ed") and len(word) > 4)
+
+
+def _object(match: re.Match) -> Optional[str]:
+    phrase = _TRAILING_RE.sub("", match.group("x").strip(" ?.!,\"'"))
+    phrase = _TRAILING_VERB_RE.sub("", _TRAILING_VERB_RE.sub("", phrase))
+    if not phrase or MULTI_HOP_RE.search(phrase) or _NOT_OBJECT_RE.search(phrase) or len(phrase.split()) > 4:
+        return None
+    # the head noun is the last word, a participle there is a clause the agent has to read
+    if _is_verb_like(phrase.split()[-1]):
+        return None
+    return phrase
+
+
+# (name, pattern, answer type, tool, query from the match); a query of None means no route
+RULES: List[Tuple[str, re.Pattern, str, str, Callable[[re.Match], Any]]] = [
+    ("time_range",
+     re.compile(rf"^what (?:happened|did {_YOU} (?:see|do))\s+(?:between|from)\s+{_TIME}\s+(?:and|to|-)\s+{_TIME}\W*$", re.IGNORECASE),
+     "text", "retrieve_timeline", lambda m: f"{_hms(m.group(1))} - {_hms(m.group(2))}"),
+    ("at_time",
+     re.compile(rf"^what (?:did {_YOU} see|was happening|happened|was there)\s+(?:at|around)\s+{_TIME}\W*$", re.IGNORECASE),
+     "text", "retrieve_from_time", lambda m: _hms(m.group(1))),
+    ("position_at_time",
+     re.compile(rf"^where (?:were|was) {_YOU}\s+(?:at|around)\s+{_TIME}\W*$", re.IGNORECASE),
+     "position", "retrieve_from_time", lambda m: _hms(m.group(1))),
+    ("at_position",
+     re.compile(rf"^what (?:did {_YOU} see|was there|is there)\s+(?:at|near)\s+(?:position\s+)?{_POSITION}\W*$", re.IGNORECASE),
+     "text", "retrieve_from_position", lambda m: tuple(float(m.group(i)) for i in (1, 2, 3))),
+    ("object_count",
+     re.compile(rf"^how many times (?:did|have) {_YOU} (?:see|seen|pass|passed) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "text", "retrieve_object_sightings", _object),
+    ("object_last_position",
+     re.compile(rf"^where did {_YOU} (?:last |most recently )?(?:see|spot|notice) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "position", "retrieve_object_sightings", _object),
+    ("object_time",
+     re.compile(rf"^when did {_YOU} (?:last |most recently )?(?:see|spot|notice) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "time", "retrieve_object_sightings", _object),
+    ("visit_duration",
+     re.compile(rf"^how long (?:did {_YOU} (?:stay|spend|remain|wait)|were {_YOU}|was {_YOU})\s+(?:at|in|inside|near) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "duration", "retrieve_visits", _object),
+    ("where_is",
+     re.compile(rf"^where (?:is|are|was|were|can {_YOU} find|could {_YOU} find) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "position", "retrieve_from_text", _object),
+    ("did_you_see",
+     re.compile(rf"^(?:did|have) {_YOU} (?:ever )?(?:see|seen|pass|passed|notice|noticed) {_ARTICLE}(?P<x>.+)$", re.IGNORECASE),
+     "binary", "retrieve_from_text", _object),
+]
+
+
+def last_question(text: str) -> str:
+    """The asked question, without preambles such as the current time and position."""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s.strip()]
+    if not sentences:
+        return ""
+    questions = [s for s in sentences if s.endswith("?")]
+    return questions[-1] if questions else sentences[-1]
+
+
+class QuestionRouter:
+    """
+    Sends simple single-hop questions past the agent's tool loop.
+
+    Rules recognize questions that one retrieval answers ('where did you last
+    see the bike', 'what did you see at 10:05', 'how long were you in the lobby')
+    and extract the query. An optional embedding classifier checks the answer
+    type the rule implies against example questions of every type; only when
+    both agree is the question routed. Everything else returns None and goes
+    through the full agent graph.
+    """
+
+    def __init__(self, embedder=None, min_margin: float = 0.02, examples: Dict[str, List[str]] = TYPE_EXAMPLES):
+        """
+        Args:
+            embedder: Optional Embeddings for the answer type classifier, rules only if None
+            min_margin: Minimum similarity margin of the rule's answer type over the other types
+            examples: Example questions per answer type
+        """
+        self.embedder = embedder
+        self.min_margin = min_margin
+        self.examples = examples
+        self._example_embeddings = None
+        self._example_types = None
+        self._lock = threading.Lock()
+        self.num_routed = 0
+        self.num_fallbacks = 0
+
+    def _embedded_examples(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._example_embeddings is None:
+                types = [t for t, questions in self.examples.items() for _ in questions]
+                texts = [q for questions in self.examples.values() for q in questions]
+                embeddings = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+                self._example_embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+                self._example_types = np.array(types)
+            return self._example_embeddings, self._example_types
+
+    def classify(self, question: str) -> Dict[str, float]:
+        """
+        Returns:
+            the highest cosine similarity to the example questions of every answer type
+        """
+        embeddings, types = self._embedded_examples()
+        query = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        sims = embeddings @ (query / max(np.linalg.norm(query), 1e-12))
+        return {t: float(sims[types == t].max()) for t in self.examples}
+
+    def match(self, question: str) -> Optional[Route]:
+        """The first rule matching the question, without the classifier check."""
+        question = last_question(question)
+        for name, pattern, answer_type, tool, make_query in RULES:
+            match = pattern.match(question)
+            if match is None:
+                continue
+            query = make_query(match)
+            if query is None:
+                return None
+            return Route(answer_type=answer_type, tool=tool, query=query, rule=name)
+        return None
+
+    def route(self, question: str) -> Optional[Route]:
+        """
+        Returns:
+            the Route of a single-hop question, None if it needs the full agent
+        """
+        route = self.match(question)
+        if route is not None and self.embedder is not None:
+            scores = self.classify(last_question(question))
+            others = max(score for t, score in scores.items() if t != route.answer_type)
+            route.confidence = scores[route.answer_type] - others
+            if route.confidence < self.min_margin:
+                route = None
+
+        with self._lock:
+            if route is None:
+                self.num_fallbacks += 1
+            else:
+                self.num_routed += 1
+        return route
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {'routed': self.num_routed, 'fallbacks': self.num_fallbacks}
@@ -1,6 +1,11 @@
-from typing import Annotated, Literal, Sequence, TypedDict
+from typing import Annotated, List, Literal, Optional, Sequence, TypedDict, Union
 import traceback
 import sys, re
+import queue
+import threading
+import contextvars
+import uuid
+from contextlib import contextmanager
 
 # from langchain_openai import OpenAIEmbeddings
 from langchain_huggingface import HuggingFaceEmbeddings
@@ -30,10 +35,18 @@ sys.path.append(sys.path[0] + '/..')
 from remembr.utils.util import file_to_string
 from remembr.tools.tools import *
 from remembr.tools.functions_wrapper import FunctionsWrapper
+from remembr.tools.tool_cache import ToolCallCache
+from remembr.tools.tool_executor import ParallelToolExecutor
 
-from remembr.memory.memory import Memory
+from remembr.memory.memory import Memory, parse_position
 
 from remembr.agents.agent import Agent, AgentOutput
+from remembr.utils.streaming import StreamEvent, TokenQueueHandler
+from remembr.agents.saturation import iteration_stats, retrieval_progress
+from remembr.agents.history_compaction import compact_history
+from remembr.utils.partial_json import StreamingAnswerParser, parse_answer, text_answer
+from remembr.utils.llm_calls import track_llm_calls
+from remembr.utils.tracing import tracer
 
 
 
@@ -61,10 +74,28 @@ def parse_json(string):
     parsed = re.search(r"```json(.*?)```", string, re.DOTALL| re.IGNORECASE).group(1).strip()
     return eval(parsed)
 
+PREVIOUS_TOOL_REQUESTS = "These are the tools I have previously used so far: \n"
+
+
 class AgentState(TypedDict):
     # The add_messages function defines how an update should be processed
     # Default is to replace. add_messages says "append"
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # per-query state lives here rather than on the agent, so one agent can serve concurrent queries
+    previous_tool_requests: str
+    agent_call_count: int
+    digest: str
+    # memory id (or aggregate tool output line) -> best score retrieved so far
+    retrieved: dict
+    # consecutive agent steps whose tool calls retrieved nothing new or better
+    stale_steps: int
+    saturated: bool
+    # answer type the router expects for the question, None if it was not routed
+    answer_type: Optional[str]
+
+
+# tool call cache of the query running in the current context
+_request_tool_cache = contextvars.ContextVar("remembr_request_tool_cache", default=None)
 
 
 # Define the function that determines whether to continue or not
@@ -76,26 +107,22 @@ def should_continue(state: AgentState):
     tool_calls = getattr(last_message, 'tool_calls', None)
     
     if not tool_calls:
-        print(f"[DEBUG] should_continue: No tool_calls, returning 'end'")
         return "end"
     
     # Check if any tool call is __conversational_response - if so, end
     for tool_call in tool_calls:
         if isinstance(tool_call, dict) and tool_call.get('name') == '__conversational_response':
-            print(f"[DEBUG] should_continue: Found __conversational_response, returning 'end'")
             return "end"
         elif hasattr(tool_call, 'name') and tool_call.name == '__conversational_response':
-            print(f"[DEBUG] should_continue: Found __conversational_response, returning 'end'")
             return "end"
     
     # Check for max iterations to prevent infinite loops
     # Count how many times we've been through the agent node
     agent_call_count = sum(1 for msg in messages if isinstance(msg, AIMessage) and getattr(msg, 'tool_calls', None))
     if agent_call_count >= 5:  # Max 5 tool call iterations
-        print(f"[DEBUG] should_continue: Max iterations reached ({agent_call_count}), forcing 'end'")
+        tracer.current_span().set(max_iterations_reached=True)
         return "end"
     
-    print(f"[DEBUG] should_continue: Found {len(tool_calls)} tool_calls (not __conversational_response), returning 'continue'")
     return "continue"
     
 
@@ -104,12 +131,8 @@ def try_except_continue(state, func):
     max_retries = 3
     while retry_count < max_retries:
         try:
-            print(f"[DEBUG] try_except_continue: Calling {func.__name__ if hasattr(func, '__name__') else func} (attempt {retry_count + 1}/{max_retries})")
-            import sys
-            sys.stdout.flush()
             ret = func(state)
-            print(f"[DEBUG] try_except_continue: {func.__name__ if hasattr(func, '__name__') else func} completed successfully")
-            sys.stdout.flush()
+            tracer.current_span().set(attempts=retry_count + 1)
             return ret
         except Exception as e:
             retry_count += 1
@@ -119,13 +142,14 @@ def try_except_continue(state, func):
             traceback.print_exception(*sys.exc_info())
             if retry_count >= max_retries:
                 print(f"[ERROR] try_except_continue: Max retries ({max_retries}) reached, raising exception")
-                sys.stdout.flush()
                 raise
             continue
 
 class ReMEmbRAgent(Agent):
 
-    def __init__(self, llm_type='gpt-4o', num_ctx=8192, temperature=0):
+    def __init__(self, llm_type='gpt-4o', num_ctx=8192, temperature=0, embeddings=None, max_tool_workers=4, tool_timeout=30.0,
+                 answer_cache=None, router=None, saturation_patience=2, min_score_improvement=1e-3,
+                 history_compaction=True, keep_recent_steps=1):
 
         # Wrapper that handles everything
         llm = self.llm_selector(llm_type, temperature, num_ctx)
@@ -134,10 +158,24 @@ class ReMEmbRAgent(Agent):
         self.num_ctx = num_ctx
         self.temperature = temperature
 
+        # tool calls of one agent step run concurrently, each within tool_timeout seconds
+        self.max_tool_workers = max_tool_workers
+        self.tool_timeout = tool_timeout
+
+        # stop searching after this many consecutive agent steps without new or better results (None to disable)
+        self.saturation_patience = saturation_patience
+        self.min_score_improvement = min_score_improvement
+
+        # send every retrieved memory once per prompt, older tool outputs as citations of a running evidence list
+        self.history_compaction = history_compaction
+        self.keep_recent_steps = keep_recent_steps
+
         self.chat = chat
         self.llm_type = llm_type
         ### Load vectorstore
-        self.embeddings = HuggingFaceEmbeddings(model_name='mixedbread-ai/mxbai-embed-large-v1')
+        if embeddings is None:
+            embeddings = HuggingFaceEmbeddings(model_name='mixedbread-ai/mxbai-embed-large-v1')
+        self.embeddings = embeddings
 
         # self.update_for_instance() # ref_time is None this time
         top_level_path = str(os.path.dirname(__file__)) + '/../'
@@ -145,8 +183,13 @@ class ReMEmbRAgent(Agent):
         self.generate_prompt = file_to_string(top_level_path+'prompts/generate_system_prompt.txt')
         self.agent_gen_only_prompt = file_to_string(top_level_path+'prompts/agent_gen_system_prompt.txt')
 
-        self.previous_tool_requests = "These are the tools I have previously used so far: \n"
-        self.agent_call_count = 0
+        # used when the graph is run directly, queries get their own cache (see request_context)
+        self.tool_cache = ToolCallCache()
+
+        # optional AnswerCache, consulted before running the graph
+        self.answer_cache = answer_cache
+        # optional QuestionRouter, single-hop questions skip the agent's tool loop
+        self.router = router
 
         self.chat_history = ChatMessageHistory()
 
@@ -178,9 +221,79 @@ class ReMEmbRAgent(Agent):
         return llm
 
 
+    def digest_prompt(self, digest: str) -> str:
+        """The memory statistics digest as a section of the question message."""
+        if not digest:
+            return ""
+        return "These are aggregate statistics about all of your memories. Use them directly to answer questions " \
+               "about how long you have been running, when you started, how far you travelled or where you usually are, " \
+               "without calling any tools:\n" + digest + "\n"
+
+    def current_tool_cache(self) -> ToolCallCache:
+        """The tool call cache of the query running in the current context."""
+        cache = _request_tool_cache.get()
+        return self.tool_cache if cache is None else cache
+
+    @contextmanager
+    def request_context(self):
+        """
+        Per-request state that is not part of the graph state: a fresh tool call
+        cache and a working memory session. Everything run in this context,
+        including threads that copy it, sees only this request's state.
+
+        Returns:
+            the working memory list of the request
+        """
+        token = _request_tool_cache.set(ToolCallCache())
+        try:
+            with self.memory.session() as working_memory:
+                yield working_memory
+        finally:
+            _request_tool_cache.reset(token)
+
+    def compile_prompts(self):
+        """
+        Build the prompt templates and tool bindings once per agent.
+
+        Messages are ordered from static to dynamic: the system prompt first, then
+        the question, the growing history, and the tool requests that change every
+        step last. The long static prefix stays byte-identical across steps and
+        questions, so prompt and KV caches of Ollama and NIM can reuse it.
+        """
+        def agent_template(prompt):
+            return ChatPromptTemplate.from_messages(
+                [
+                    ("ai", prompt),
+                    ("human", "{question}"),
+                    MessagesPlaceholder("chat_history"),
+                    ("human", "{previous_tool_requests}"),
+                ]
+            )
+
+        self.agent_model = agent_template(self.agent_prompt) | self.chat.bind_tools(tools=self.tool_definitions)
+        self.agent_gen_only_model = agent_template(self.agent_gen_only_prompt) | self.chat
+
+        # the generate prompt is a template for the question that is itself templated again,
+        # so fill it once and keep {question} as a variable of the chat template
+        generate_system = PromptTemplate(
+            template=self.generate_prompt,
+            input_variables=["question"],
+        ).format(question="{question}")
+        gen_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", generate_system),
+                MessagesPlaceholder("chat_history"),
+                ("human", "{question}"),
+            ]
+        )
+        self.generate_model = gen_prompt | self.chat
+
     def set_memory(self, memory: Memory):
         self.memory = memory
+        if self.answer_cache is not None:
+            self.answer_cache.attach(memory)
         self.create_tools(memory)
+        self.compile_prompts()
         self.build_graph()
 
 
@@ -192,16 +305,17 @@ class ReMEmbRAgent(Agent):
 
 
         class TextRetrieverInput(BaseModel):
-            x: str = Field(description="The query that will be searched by the vector similarity-based retriever.\
+            x: Union[str, List[str]] = Field(description="The query that will be searched by the vector similarity-based retriever.\
                                 Text embeddings of this description are used. There should always be text in here as a response! \
                                 Based on the question and your context, decide what text to search for in the database. \
                                 This query argument should be a phrase such as 'a crowd gathering' or 'a green car driving down the road'.\
+                                It can also be a list of phrases such as ['staircase', 'elevator'], which are all searched at once.\
                                 The query will then search your memories for you.")
 
         self.retriever_tool = StructuredTool.from_function(
-            func=lambda x: memory.search_by_text(x),
+            func=lambda x: self.current_tool_cache().call("retrieve_from_text", x, memory.search_by_text),
             name="retrieve_from_text",
-            description="Search and return information from your video memory in the form of captions",
+            description="Search and return information from your video memory in the form of captions. Accepts one query or a list of queries",
             args_schema=TextRetrieverInput
             # coroutine= ... <- you can specify an async method if desired as well
         )
@@ -214,7 +328,7 @@ class ReMEmbRAgent(Agent):
                                 The query will then search your memories for you.")
         # position-based tool
         self.position_retriever_tool = StructuredTool.from_function(
-            func=lambda x: memory.search_by_position(x),
+            func=lambda x: self.current_tool_cache().call("retrieve_from_position", x, memory.search_by_position),
             name="retrieve_from_position",
             description="Search and return information from your video memory by using a position array such as (x,y,z)",
             args_schema=PositionRetrieverInput
@@ -230,18 +344,85 @@ class ReMEmbRAgent(Agent):
 
         # position-based tool
         self.time_retriever_tool = StructuredTool.from_function(
-            func=lambda x: memory.search_by_time(x),
+            func=lambda x: self.current_tool_cache().call("retrieve_from_time", x, memory.search_by_time),
             name="retrieve_from_time",
             description="Search and return information from your video memory by using an H:M:S time.",
             args_schema=TimeRetrieverInput
             # coroutine= ... <- you can specify an async method if desired as well
         )
 
-        self.tool_list = [self.retriever_tool, self.position_retriever_tool, self.time_retriever_tool]
+        class VisitRetrieverInput(BaseModel):
+            x: Union[str, tuple] = Field(description="The place whose visits you want to look up. \
+                                Either an (x,y,z) position such as (0.5, 0.2, 0.1), or a short description of the place such as 'the building lobby'. \
+                                The query returns every stay at that place with its start and end time and duration, \
+                                plus the total time spent there and when it was first and last entered.")
+
+        self.visit_retriever_tool = StructuredTool.from_function(
+            func=lambda x: self.current_tool_cache().call("retrieve_visits", x, memory.search_visits),
+            name="retrieve_visits",
+            description="Look up when and for how long you stayed at a place. Use this for 'how long' and 'when did you last enter' questions.",
+            args_schema=VisitRetrieverInput
+        )
+
+        class PlaceRetrieverInput(BaseModel):
+            x: str = Field(description="A description of the kind of place or activity to look for, such as 'a place to sit' or 'a kitchen'. \
+                                The query is matched against whole places the robot has been to, each summarizing many memories, \
+                                and returns the best places with how often they were visited and their most relevant memories.")
+
+        self.place_retriever_tool = StructuredTool.from_function(
+            func=lambda x: self.current_tool_cache().call("retrieve_from_places", x, memory.search_places),
+            name="retrieve_from_places",
+            description="Search over places (clusters of memories) instead of single memories. Use this for questions about where things usually are or happen.",
+            args_schema=PlaceRetrieverInput
+        )
+
+        class ObjectSightingInput(BaseModel):
+            x: str = Field(description="The object to look up, as a short noun phrase such as 'bike', 'dog' or 'orange cone'. \
+                                The query returns when and where the object was first and last seen, \
+                                and how many separate times it was seen.")
+
+        self.object_retriever_tool = StructuredTool.from_function(
+            func=lambda x: self.current_tool_cache().call("retrieve_object_sightings", x, memory.search_objects),
+            name="retrieve_object_sightings",
+            description="Look up when and where you first and last saw an object, and how many times you saw it. Use this for 'where did you last see' and 'how many times' questions.",
+            args_schema=ObjectSightingInput
+        )
+
+        class TimelineRetrieverInput(BaseModel):
+            x: str = Field(description="Either a time range in H:M:S format such as '13:00:00 - 17:30:00', \
+                                or a description of an activity or period such as 'walking through the parking lot'. \
+                                A time range returns summaries of everything that happened in it. \
+                                A description returns the best matching hour, then the best 10 minutes and minutes within it.")
+
+        self.timeline_retriever_tool = StructuredTool.from_function(
+            func=lambda x: self.current_tool_cache().call("retrieve_timeline", x, memory.search_timeline),
+            name="retrieve_timeline",
+            description="Search summaries of whole minutes, 10 minutes and hours instead of single memories. Use this for questions about long periods such as 'what happened this afternoon'.",
+            args_schema=TimelineRetrieverInput
+        )
+
+        self.tool_list = [self.retriever_tool, self.position_retriever_tool, self.time_retriever_tool, self.visit_retriever_tool,
+                          self.place_retriever_tool, self.object_retriever_tool, self.timeline_retriever_tool]
         self.tool_definitions = [convert_to_openai_function(t) for t in self.tool_list]
 
     ### Nodes
 
+    def _convert_tool_messages(self, messages: list):
+        # Convert all ToolMessages into AI Messages since Ollama cann't handle ToolMessage
+        if ('gpt-4' not in self.llm_type) and ('nim' not in self.llm_type):
+            for i in range(len(messages)):
+                if type(messages[i]) == ToolMessage:
+                    messages[i] = AIMessage(id=messages[i].id, content=messages[i].content) # ignore tool_call_id
+
+    def _chat_history(self, messages: list) -> list:
+        """The message history as sent to the LLM, compacted unless history_compaction is off."""
+        if not self.history_compaction:
+            return messages[:]
+        history = compact_history(messages, self.keep_recent_steps)
+        tracer.current_span().set(history_chars=sum(len(str(m.content)) for m in messages),
+                                  compacted_chars=sum(len(str(m.content)) for m in history))
+        return history
+
     def agent(self, state):
         """
         Invokes the agent model to generate a response based on the current state. Given
@@ -254,64 +435,34 @@ class ReMEmbRAgent(Agent):
             dict: The updated state with the agent response appended to messages
         """
         messages = state["messages"]
-
-        model = self.chat
-
+        agent_call_count = state.get("agent_call_count", 0)
+        previous_tool_requests = state.get("previous_tool_requests", PREVIOUS_TOOL_REQUESTS)
 
         # limit to 5 tool calls.
-        if self.agent_call_count < 5:
-            model = model.bind_tools(tools=self.tool_definitions)
-            prompt = self.agent_prompt
+        if agent_call_count < 5:
+            model = self.agent_model
         else:
-            prompt = self.agent_gen_only_prompt
-
-
-        agent_prompt = ChatPromptTemplate.from_messages(
-            [
-                # ("system", prompt),
-                MessagesPlaceholder("chat_history"),
-                (("human"), self.previous_tool_requests),
-                ("ai", prompt),
-                ("human", "{question}"),
-
-            ]
-        )
-
-
-        model = agent_prompt | model
+            model = self.agent_gen_only_model
 
-        question = f"The question is: {messages[0]}"
+        question = self.digest_prompt(state.get("digest", "")) + f"The question is: {messages[0]}"
 
-        # Convert all ToolMessages into AI Messages since Ollama cann't handle ToolMessage
-        if ('gpt-4' not in self.llm_type) and ('nim' not in self.llm_type):
-            for i in range(len(messages)):
-                if type(messages[i]) == ToolMessage:
-                    messages[i] = AIMessage(id=messages[i].id, content=messages[i].content) # ignore tool_call_id
+        self._convert_tool_messages(messages)
 
 
-        response = model.invoke({"question": question, "chat_history": messages[:]})
+        response = model.invoke({"question": question, "chat_history": self._chat_history(messages),
+                                 "previous_tool_requests": previous_tool_requests})
 
-        print(f"[DEBUG] agent: Response type: {type(response)}")
-        print(f"[DEBUG] agent: Response has tool_calls attribute: {hasattr(response, 'tool_calls')}")
-        tool_calls = getattr(response, 'tool_calls', None)
-        print(f"[DEBUG] agent: tool_calls value: {tool_calls}")
-        print(f"[DEBUG] agent: tool_calls type: {type(tool_calls)}")
-        if tool_calls:
-            print(f"[DEBUG] agent: tool_calls length: {len(tool_calls)}")
-        import sys
-        sys.stdout.flush()
+        tool_calls = getattr(response, 'tool_calls', None) or []
+        tracer.current_span().set(num_tool_calls=len(tool_calls), tools=",".join(t['name'] for t in tool_calls))
 
         if response.tool_calls:
             for tool_call in response.tool_calls:
                 if tool_call['name'] != "__conversational_response":
                     args = re.sub("\{.*?\}", "", str(tool_call['args'])) # remove curly braces
-                    self.previous_tool_requests += f"I previously used the {tool_call['name']} tool with the arguments: {args}.\n"
-
-        self.agent_call_count += 1
+                    previous_tool_requests += f"I previously used the {tool_call['name']} tool with the arguments: {args}.\n"
 
-        print(f"[DEBUG] agent: Returning state with {len([response])} messages")
-        sys.stdout.flush()
-        return {"messages": [response]}
+        return {"messages": [response], "previous_tool_requests": previous_tool_requests,
+                "agent_call_count": agent_call_count + 1}
 
 
     def generate(self, state):
@@ -324,138 +475,46 @@ class ReMEmbRAgent(Agent):
         Returns:
             dict: The updated state with re-phrased question
         """
-        print(f"[DEBUG] generate: Starting generate function")
-        import sys
-        sys.stdout.flush()
-        
         messages = state["messages"]
+        # the tool results are the last messages when the agent stopped early
+        self._convert_tool_messages(messages)
         question = messages[0].content \
                 + "\n Please responsed in the desired format."
+        answer_type = state.get("answer_type")
+        if answer_type:
+            question += f"\n The answer type is {answer_type}, be sure to fill in the {answer_type} field."
         last_message = messages[-1]
 
-        print(f"[DEBUG] generate: Got {len(messages)} messages, last message type: {type(last_message)}")
-        sys.stdout.flush()
-
         docs = last_message.content
-        print(f"[DEBUG] generate: Docs length: {len(str(docs))} chars")
-        sys.stdout.flush()
-
-        prompt = PromptTemplate(
-            template=self.generate_prompt,
-            input_variables=["context", "question"],
-        )
-        filled_prompt = prompt.invoke({'question':question})
-
-        gen_prompt = ChatPromptTemplate.from_messages(
-            [
-                # ("human", "What do you do?"),
-                ("system", filled_prompt.text),
-                MessagesPlaceholder("chat_history"),
-                # ("ai", filled_prompt.text),
-                ("human", "{question}"),
+        tracer.current_span().set(num_messages=len(messages), context_chars=len(str(docs)))
 
-            ]
-        )
+        model = self.generate_model
 
-        model = gen_prompt | self.chat
-
-        print(f"[DEBUG] generate: About to invoke model with codestral")
-        sys.stdout.flush()
-        
         try:
-            response = model.invoke({"question": question, "chat_history": messages[1:]})
-            print(f"[DEBUG] generate: Model invoke completed, response type: {type(response)}")
-            sys.stdout.flush()
+            response = model.invoke({"question": question, "chat_history": self._chat_history(messages)[1:]})
         except Exception as e:
             print(f"[ERROR] generate: Exception during model.invoke: {e}")
-            import traceback
             traceback.print_exc()
-            sys.stdout.flush()
             raise
 
         # let us parse and check the output is a dictionary. raise error otherwise
         response = ''.join(response.content.splitlines())
-        print(f"[DEBUG] generate: Response content length: {len(response)} chars")
-        print(f"[DEBUG] generate: Response preview: {response[:200]}")
-        sys.stdout.flush()
-
-        try:
-            import json
-            import ast
-            
-            if '```json' in response:
-                parsed = parse_json(response)
-            elif '```' in response:
-                # Try to extract any code block
-                match = re.search(r'```(?:json)?\s*(.*?)```', response, re.DOTALL | re.IGNORECASE)
-                if match:
-                    json_str = match.group(1).strip()
-                    try:
-                        parsed = json.loads(json_str)
-                    except:
-                        parsed = ast.literal_eval(json_str)
-                else:
-                    raise ValueError("Could not extract JSON from code block")
-            else:
-                # Try parsing as direct JSON first
-                try:
-                    parsed = json.loads(response)
-                except json.JSONDecodeError:
-                    # Fallback to ast.literal_eval for Python literals
-                    try:
-                        parsed = ast.literal_eval(response)
-                    except (ValueError, SyntaxError):
-                        # If it's plain text, wrap it in the expected format
-                        parsed = {
-                            "time": None,
-                            "text": response,
-                            "binary": None,
-                            "position": None,
-                            "duration": None
-                        }
-
-            # Unwrap nested structure if present
-            if "tool_input" in parsed and isinstance(parsed.get("tool_input"), dict):
-                if "response" in parsed["tool_input"]:
-                    parsed = parsed["tool_input"]["response"]
-            elif "tool" in parsed and parsed.get("tool") == "__conversational_response":
-                # Handle case where response might be at top level
-                if "response" in parsed:
-                    parsed = parsed["response"]
-
-            # then check it has all the required keys
-            keys_to_check_for = ["time", "text", "binary", "position", "duration"]
-
-            for key in keys_to_check_for:
-                if key not in parsed:
-                    # Fill missing keys with None instead of raising error
-                    parsed[key] = None
-                    print(f"Warning: Missing key '{key}' in response, filling with None")
-            
-            if type(parsed['position']) == str:
-                try:
-                    parsed['position'] = ast.literal_eval(parsed['position'])
-                except:
-                    parsed['position'] = None
-            
-            if (parsed['position'] is not None) and len(parsed['position']) != 3:
+        tracer.current_span().set(response_chars=len(response))
+
+        # missing answer fields are filled in, an unparsable answer is kept as text rather than re-generated
+        parsed = parse_answer(response, required=())
+        if parsed is None:
+            print(f"Warning: could not parse the response, using it as a text answer: {response[:200]}")
+            parsed = text_answer(response)
+        if answer_type and not parsed.get('type'):
+            parsed['type'] = answer_type
+
+        if parsed['position'] is not None:
+            position = parse_position(parsed['position'])
+            if position is None:
                 print(f"Warning: Position shape incorrect: {parsed['position']}, setting to None")
-                parsed['position'] = None
+            parsed['position'] = position
 
-        except Exception as e:
-            print(f"Error parsing response: {e}")
-            print(f"Response was: {response[:200]}")
-            # Instead of retrying forever, wrap the response
-            parsed = {
-                "time": None,
-                "text": str(response),
-                "binary": None,
-                "position": None,
-                "duration": None
-            }
-
-        self.previous_tool_requests = "These are the tools I have previously used so far: \n"
-        self.agent_call_count = 0
         # Convert dict to JSON string and wrap in AIMessage for LangGraph
         import json
         response_str = json.dumps(parsed)
@@ -466,26 +525,36 @@ class ReMEmbRAgent(Agent):
     def build_graph(self):
 
         from langgraph.graph import END, StateGraph
-        from langgraph.prebuilt import ToolNode
 
         # Define a new graph
         workflow = StateGraph(AgentState)
 
         # Define the nodes we will cycle between
-        workflow.add_node("agent", lambda state: try_except_continue(state, self.agent))  # agent
+        def agent_wrapper(state):
+            with tracer.span("node.agent", step=state.get("agent_call_count", 0)):
+                return try_except_continue(state, self.agent)
+
+        workflow.add_node("agent", agent_wrapper)  # agent
         # retrieve = ToolNode([self.retriever_tool])
-        tool_node = ToolNode(self.tool_list)
+        if getattr(self, 'tool_executor', None) is not None:
+            self.tool_executor.shutdown()
+        self.tool_executor = ParallelToolExecutor(self.tool_list, max_workers=self.max_tool_workers, timeout=self.tool_timeout)
+        tool_node = self.tool_executor
         
         def action_wrapper(state):
-            print("[DEBUG] ========== ACTION NODE (ToolNode) CALLED ==========")
-            import sys
-            sys.stdout.flush()
-            print(f"[DEBUG] action: State has {len(state.get('messages', []))} messages")
-            sys.stdout.flush()
-            result = tool_node.invoke(state)
-            print(f"[DEBUG] action: ToolNode completed, returning {len(result.get('messages', []))} messages")
-            sys.stdout.flush()
-            return result
+            with tracer.span("node.action") as span:
+                working_memory = self.memory.session_working_memory()
+                start = len(working_memory) if working_memory is not None else 0
+
+                result = tool_node.invoke(state)
+
+                docs = working_memory[start:] if working_memory is not None else []
+                retrieved, progress = retrieval_progress(state.get("retrieved", {}), docs, result["messages"],
+                                                         self.min_score_improvement)
+                stale_steps = 0 if progress > 0 else state.get("stale_steps", 0) + 1
+                saturated = self.saturation_patience is not None and stale_steps >= self.saturation_patience
+                span.set(num_tool_calls=len(result['messages']), new_results=progress, saturated=saturated)
+                return {**result, "retrieved": retrieved, "stale_steps": stale_steps, "saturated": saturated}
         
         workflow.add_node("action", action_wrapper)
         # workflow.add_node("action", lambda state: try_except_continue(state, tool_node))
@@ -494,10 +563,8 @@ class ReMEmbRAgent(Agent):
         # workflow.add_node("action", self.call_tool)
 
         def generate_wrapper(state):
-            print("[DEBUG] ========== GENERATE NODE WRAPPER CALLED ==========")
-            import sys
-            sys.stdout.flush()
-            return try_except_continue(state, self.generate)
+            with tracer.span("node.generate"):
+                return try_except_continue(state, self.generate)
         
         workflow.add_node(
             "generate", generate_wrapper
@@ -520,36 +587,252 @@ class ReMEmbRAgent(Agent):
         )
 
 
-        workflow.add_edge('action', 'agent')
+        # once retrieval saturates, answer with what was found instead of asking the agent again
+        workflow.add_conditional_edges(
+            "action",
+            lambda state: "end" if state.get("saturated") else "continue",
+            {
+                "continue": "agent",
+                "end": "generate",
+            },
+        )
 
         workflow.add_edge("generate", END)
 
         # Compile
         self.graph = workflow.compile()
 
+        # routed questions already have their retrieval, they only need the generate step
+        fast_path = StateGraph(AgentState)
+        fast_path.add_node("generate", generate_wrapper)
+        fast_path.set_entry_point("generate")
+        fast_path.add_edge("generate", END)
+        self.fast_path_graph = fast_path.compile()
 
-    def query(self, question: str):
+
+    def _start_query(self, question: str) -> dict:
 
         inputs = { "messages": [
                                 (("user", question)),
-            ]
+            ],
+            "previous_tool_requests": PREVIOUS_TOOL_REQUESTS,
+            "agent_call_count": 0,
+            # the digest is refreshed once per question, it only changes as new memories arrive
+            "digest": self.memory.get_digest(),
+            "retrieved": {},
+            "stale_steps": 0,
+            "saturated": False,
+            "answer_type": None,
         }
+        return inputs
 
-        out = self.graph.invoke(inputs)
-        response = out['messages'][-1]
-        response = ''.join(response.content.splitlines())
+    def _route(self, question: str, inputs: dict):
+        """
+        Run the retrieval of a routed question directly.
 
-        if '```json' not in response:
-            # try parsing on its own since we cannot always trust llms
-            parsed = eval(response) 
-        else:
-            parsed = parse_json(response)
+        Returns:
+            (graph, inputs, messages) to answer with: the fast path graph with the tool
+            call and its result added to the inputs (also returned as messages), or the
+            full graph, the unchanged inputs and no messages if the question is not routed
+        """
+        if self.router is None:
+            return self.graph, inputs, []
+
+        with tracer.span("router") as span:
+            route = self.router.route(question)
+            span.set(routed=route is not None)
+            if route is None:
+                return self.graph, inputs, []
+            span.set(rule=route.rule, answer_type=route.answer_type, tool=route.tool)
+
+            # the tools describe a miss in words, so check the indexes before committing to the route
+            try:
+                found = self._has_evidence(route)
+            except Exception as e:
+                print(f"[ERROR] router: checking {route.tool} failed ({e!r}), falling back to the agent")
+                return self.graph, inputs, []
+            span.set(found=found)
+            if not found:
+                return self.graph, inputs, []
+
+            tool_call = {'name': route.tool, 'args': {'x': route.query}, 'id': f"call_{uuid.uuid4().hex}"}
+            try:
+                content = self.tool_executor.call(tool_call)
+            except Exception as e:
+                print(f"[ERROR] router: {route.tool} failed ({e!r}), falling back to the agent")
+                return self.graph, inputs, []
+            if not content.strip():
+                return self.graph, inputs, []
+
+        messages = [AIMessage(content="", tool_calls=[tool_call]),
+                    ToolMessage(content=content, name=route.tool, tool_call_id=tool_call['id'])]
+        history = list(messages)
+        self._convert_tool_messages(history)
+        return self.fast_path_graph, {**inputs, "messages": inputs["messages"] + history, "answer_type": route.answer_type}, messages
+
+    def _has_evidence(self, route) -> bool:
+        """Whether the routed retrieval finds anything; tools without a cheap check count as found."""
+        if route.tool == "retrieve_object_sightings" and hasattr(self.memory, 'object_count'):
+            return self.memory.object_count(route.query)['num_memories'] > 0
+        if route.tool == "retrieve_visits" and hasattr(self.memory, 'find_visits'):
+            return len(self.memory.find_visits(route.query)) > 0
+        if route.tool == "retrieve_timeline" and hasattr(self.memory, 'find_timeline_summaries'):
+            return len(self.memory.find_timeline_summaries(route.query)) > 0
+        return True
+
+    def _parse_output(self, message) -> AgentOutput:
+        response = ''.join(message.content.splitlines())
+
+        parsed = parse_answer(response, required=())
+        if parsed is None:
+            parsed = text_answer(response)
+
+        return AgentOutput.from_dict(parsed)
+
+    def _cache_answer(self, question: str, question_embedding, response: AgentOutput, evidence: list):
+        # the documents retrieved for this question are the evidence the answer depends on
+        self.answer_cache.store(question, question_embedding, response, evidence=evidence,
+                                time_offset=getattr(self.memory, 'time_offset', 0.0))
+
+    def _query_stats(self, state: dict, llm_calls) -> dict:
+        """
+        Statistics of a finished query, returned as AgentOutput.stats and added to its trace:
+        iteration counts (see remembr.agents.saturation.iteration_stats) and LLM calls,
+        including those wasted on unusable output.
+        """
+        stats = {'iterations': iteration_stats(state), 'llm_calls': llm_calls.as_dict()}
+        tracer.current_span().set(**stats['iterations'], **stats['llm_calls'])
+        return stats
 
-        response = AgentOutput.from_dict(parsed)
+    def _add_latency(self, stats: dict, span):
+        """Add the latency breakdown of the query traced in span (only while tracing is enabled)."""
+        if tracer.enabled:
+            stats['latency'] = tracer.latency_breakdown(span.trace_id)
 
+    def query(self, question: str):
+
+        with tracer.span("query", question=question) as span:
+            response = self._query(question)
+        self._add_latency(response.stats, span)
+        return response
+
+    def _query(self, question: str):
+
+        question_embedding = None
+        if self.answer_cache is not None:
+            cached, question_embedding = self.answer_cache.lookup(question)
+            tracer.current_span().set(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
+        with self.request_context() as working_memory, track_llm_calls() as llm_calls:
+            inputs = self._start_query(question)
+            graph, inputs, _ = self._route(question, inputs)
+
+            out = graph.invoke(inputs)
+            stats = self._query_stats(out, llm_calls)
+            response = self._parse_output(out['messages'][-1])
+            response.stats = stats
+
+        if self.answer_cache is not None:
+            self._cache_answer(question, question_embedding, response, working_memory)
 
         return response
 
+    def stream_query(self, question: str):
+        """
+        Like query, but yields StreamEvents while the graph runs: LLM tokens, tool
+        calls and their results, and the answer fields as soon as they are parsed
+        from the streaming generate response. The last event is the final
+        'answer' (an AgentOutput), or an 'error'. If the caller stops iterating,
+        the graph stops after the node that is running.
+        """
+        question_embedding = None
+        if self.answer_cache is not None:
+            cached, question_embedding = self.answer_cache.lookup(question)
+            if cached is not None:
+                yield StreamEvent(type='answer', node='cache', content=cached)
+                return
+
+        events = queue.Queue()
+        done = object()
+        working_memory = []
+        query_stats = {}
+        # set when the consumer stops iterating, the graph thread checks it after every node
+        cancelled = threading.Event()
+
+        def run_graph():
+            # the root span and the request context live in the graph thread,
+            # a generator cannot hold them across yields
+            try:
+                with tracer.span("query", question=question, streaming=True) as span, \
+                        self.request_context() as request_memory, track_llm_calls() as llm_calls:
+                    inputs = self._start_query(question)
+                    graph, inputs, routed_messages = self._route(question, inputs)
+                    if routed_messages:
+                        events.put({'router': {'messages': routed_messages}})
+                    final_state = dict(inputs)
+                    for update in graph.stream(inputs, config={"callbacks": [TokenQueueHandler(events)]}):
+                        if cancelled.is_set():
+                            span.set(cancelled=True)
+                            return
+                        for node_update in update.values():
+                            final_state.update({k: v for k, v in node_update.items() if k != 'messages'})
+                        events.put(update)
+                    query_stats.update(self._query_stats(final_state, llm_calls))
+                    working_memory.extend(request_memory)
+                self._add_latency(query_stats, span)
+            except Exception as e:
+                events.put(StreamEvent(type='error', content=e))
+            finally:
+                events.put(done)
+
+        threading.Thread(target=run_graph, daemon=True).start()
+
+        try:
+            answer_parser = StreamingAnswerParser()
+            final_message = None
+            while True:
+                event = events.get()
+                if event is done:
+                    break
+
+                if isinstance(event, StreamEvent):
+                    yield event
+                    if event.type == 'llm_start' and event.node == 'generate':
+                        answer_parser = StreamingAnswerParser()
+                    elif event.type == 'token' and event.node == 'generate':
+                        changed = answer_parser.feed(event.content)
+                        if changed:
+                            yield StreamEvent(type='answer_delta', node='generate', content=changed)
+                    continue
+
+                # a graph update, {node name: state update}
+                for node, update in event.items():
+                    messages = update.get('messages', [])
+                    for message in messages:
+                        if isinstance(message, ToolMessage):
+                            yield StreamEvent(type='tool_result', node=node, content={'name': message.name, 'content': message.content})
+                        else:
+                            for tool_call in (getattr(message, 'tool_calls', None) or []):
+                                yield StreamEvent(type='tool_start', node=node, content={'name': tool_call['name'], 'args': tool_call['args']})
+                    if node == 'generate' and messages:
+                        final_message = messages[-1]
+                    yield StreamEvent(type='node', node=node, content=update)
+
+            if final_message is not None:
+                try:
+                    response = self._parse_output(final_message)
+                except Exception as e:
+                    yield StreamEvent(type='error', node='generate', content=e)
+                    return
+                response.stats = query_stats
+                if self.answer_cache is not None:
+                    self._cache_answer(question, question_embedding, response, working_memory)
+                yield StreamEvent(type='answer', node='generate', content=response)
+        finally:
+            cancelled.set()
+
 if __name__ == "__main__":
 
     from memory.milvus_memory import MilvusMemory
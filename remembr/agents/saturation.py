@@ -0,0 +1,80 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from remembr.tools.tool_cache import REPEAT_TEMPLATE
+from remembr.tools.tool_executor import ERROR_TEMPLATE, TIMEOUT_TEMPLATE
+
+
+# tools whose results are memories added to the working memory, with an id and a score
+DOCUMENT_TOOLS = ("retrieve_from_text", "retrieve_from_position", "retrieve_from_time")
+
+
+def _template_regex(template: str) -> re.Pattern:
+    parts = re.split(r"\{[^}]*\}", template)
+    return re.compile(".*?".join(re.escape(part) for part in parts), re.DOTALL)
+
+
+# tool messages that are not results: repeated calls, timeouts and errors
+_NOT_RESULTS = [_template_regex(t) for t in (REPEAT_TEMPLATE, TIMEOUT_TEMPLATE, ERROR_TEMPLATE)]
+
+
+def retrieval_progress(retrieved: Dict[str, Optional[float]], docs: list, tool_messages: list,
+                       min_improvement: float = 1e-3) -> Tuple[Dict[str, Optional[float]], int]:
+    """
+    What an agent step's tool calls added to what the query has retrieved so far.
+
+    Memories are tracked by id with their best (smallest) distance score: a
+    memory counts as progress if it is new, or if it came back with a score
+    that is better by at least min_improvement. Tools that return aggregates
+    instead of memories (visits, places, object sightings, timeline) are
+    tracked by their output lines.
+
+    Args:
+        retrieved: Memory id (or tool output line) -> best score so far, from the agent state
+        docs: The Documents the step added to the working memory
+        tool_messages: The ToolMessages of the step
+        min_improvement: Score improvement that counts as a better result
+
+    Returns:
+        (updated retrieved map, number of new or improved results)
+    """
+    retrieved = dict(retrieved)
+    progress = 0
+
+    for doc in docs:
+        metadata = getattr(doc, 'metadata', {}) or {}
+        key = str(metadata.get('id', getattr(doc, 'page_content', doc)))
+        score = metadata.get('score')
+        score = float(score) if score is not None else None
+        if key not in retrieved:
+            retrieved[key] = score
+            progress += 1
+        elif score is not None and (retrieved[key] is None or score < retrieved[key] - min_improvement):
+            retrieved[key] = score
+            progress += 1
+
+    for message in tool_messages:
+        if getattr(message, 'name', None) in DOCUMENT_TOOLS:
+            continue
+        if any(pattern.match(str(message.content)) for pattern in _NOT_RESULTS):
+            continue
+        for line in str(message.content).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            key = f"{message.name}:{line}"
+            if key not in retrieved:
+                retrieved[key] = None
+                progress += 1
+
+    return retrieved, progress
+
+
+def iteration_stats(state: dict) -> dict:
+    """Per-query iteration counts from a final agent state."""
+    return {
+        'agent_steps': state.get('agent_call_count', 0),
+        'stale_steps': state.get('stale_steps', 0),
+        'stopped_early': state.get('saturated', False),
+        'unique_results': len(state.get('retrieved', {})),
+    }
@@ -1,7 +1,5 @@
-import json
 import numpy as np
 import sys, os
-import re
 import base64, io
 from PIL import Image
 from time import strftime, localtime
@@ -17,13 +15,10 @@ from utils.util import file_to_string
 from remembr.agents.agent import Agent, AgentOutput
 from remembr.memory.memory import Memory
 from remembr.memory.video_memory import VideoMemory, ImageMemoryItem
+from remembr.utils.partial_json import parse_answer, text_answer
+from remembr.utils.llm_calls import invoke_until_parsed, track_llm_calls
 
 
-def parse_json(string):
-    parsed = re.search(r"```json(.*?)```", string, re.DOTALL| re.IGNORECASE).group(1).strip()
-    parsed = json.loads(parsed)
-    return parsed
-
 def np_image_to_base64(image):
 
     image = Image.fromarray(np.uint8(image))
@@ -70,9 +65,11 @@ def construct_messages_from_memory(memory_items: ImageMemoryItem):
 
 
 class VLMNonAgent(Agent):
-    def __init__(self, llm_type='llama3', num_ctx=8192, temperature=0):
+    def __init__(self, llm_type='llama3', num_ctx=8192, temperature=0, max_attempts=3):
         
         self.llm_type = llm_type
+        # LLM calls per answer before an unparsable response is kept as a text answer
+        self.max_attempts = max_attempts
 
         if 'gpt-4' in 'llm_type':
             # TODO: ADD OpenAI here
@@ -118,32 +115,16 @@ class VLMNonAgent(Agent):
             HumanMessage(content=question_message)
         ]
 
-        while True:
-
+        def invoke() -> str:
             response = self.chain.invoke(inputs)
-            response = ''.join(response.content.splitlines())
-            print(response)
-            try:
-                if '```json' not in response:
-                    # try parsing on its own since we cannot always trust llms
-                    parsed = json.loads(response) 
-                else:
-                    parsed = parse_json(response)
-
-                # then check it has all the required keys
-                keys_to_check_for = ["time", "text", "binary", "position"]
-                for key in keys_to_check_for:
-                    if key not in parsed:
-                        raise ValueError("Missing all the required keys during generate. Retrying...")
-                response = AgentOutput.from_dict(parsed)
-
-            except Exception as e:
-                print(response)
-                print(e)
-                print("Generate call failed. Retrying...")
-                continue
-
-            break
-
-
-        return response
\ No newline at end of file
+            return ''.join(response.content.splitlines())
+
+        with track_llm_calls() as llm_calls:
+            parsed, response = invoke_until_parsed(invoke, parse_answer, self.max_attempts)
+        if parsed is None:
+            print(f"Generate call failed {self.max_attempts} times, using the response as a text answer")
+            parsed = text_answer(response)
+
+        output = AgentOutput.from_dict(parsed)
+        output.stats = {'llm_calls': llm_calls.as_dict()}
+        return output
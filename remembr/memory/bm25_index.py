@@ -0,0 +1,180 @@
+import json
+import os
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an the and or but of to in on at by for with from into onto over under is are was were be been being
+this that these those there here it its they them their he she his her you your we our i me my
+as if then than so such very can could would should will just also some any each few more most other
+which who whom what when where while how all both no not only own same too up down out off again
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms, keeping things like '2.204' or "kid's" together."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index(MemoryIndex):
+    """
+    In-process BM25 inverted index over captions.
+
+    Postings are kept per term as growing arrays of (document index, term
+    frequency), i.e. one sparse column per term, so a query only touches the
+    postings of its own terms and scores them with a few vectorized numpy ops.
+    Catches exact names, signs and colours ("Starbucks", "room 2.204", "orange
+    cone") that dense embeddings tend to miss.
+    """
+
+    needs_embeddings = False
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.reset()
+
+    def reset(self):
+        self.ids: List[str] = []
+        self._doc_lengths: List[int] = []
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._compiled: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._length_array = None
+        # number of documents already written by save
+        self._saved = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        self.add_text(memory_id, item.caption)
+
+    def add_text(self, memory_id: str, text: str):
+        counts: Dict[str, int] = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        self.add_counts(memory_id, counts)
+
+    def add_counts(self, memory_id: str, counts: Dict[str, int]):
+        """Add a document given its term frequencies."""
+        doc = len(self.ids)
+        self.ids.append(memory_id)
+        self._doc_lengths.append(sum(counts.values()))
+        self._length_array = None
+
+        for term, tf in counts.items():
+            docs, tfs = self._postings.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(tf)
+            self._compiled.pop(term, None)
+
+    def _posting_arrays(self, term: str):
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            docs, tfs = self._postings[term]
+            compiled = (np.array(docs, dtype=np.int64), np.array(tfs, dtype=np.float32))
+            self._compiled[term] = compiled
+        return compiled
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (memory id, BM25 score) pairs, best first."""
+        terms = [t for t in set(tokenize(query)) if t in self._postings]
+        n = len(self.ids)
+        if not terms or n == 0:
+            return []
+
+        if self._length_array is None:
+            self._length_array = np.asarray(self._doc_lengths, dtype=np.float32)
+        doc_lengths = self._length_array
+        avg_length = max(doc_lengths.mean(), 1e-6)
+        scores = np.zeros(n, dtype=np.float32)
+
+        for term in terms:
+            docs, tfs = self._posting_arrays(term)
+            idf = np.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[docs] / avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    ### Persistence
+
+    def unsaved_documents(self, everything: bool = False) -> Tuple[int, List[Tuple[str, Dict[str, int]]]]:
+        """
+        The documents added since the last call, as (memory id, term frequencies), and marks them saved.
+
+        Args:
+            everything: Return all documents instead, to rewrite the saved index
+
+        Returns:
+            (index of the first returned document, documents)
+        """
+        start = 0 if everything else self._saved
+        docs = [(self.ids[d], {}) for d in range(start, len(self.ids))]
+        if docs:
+            for term, (doc_list, tfs) in self._postings.items():
+                for i in range(bisect_left(doc_list, start), len(doc_list)):
+                    docs[doc_list[i] - start][1][term] = tfs[i]
+        self._saved = len(self.ids)
+        return start, docs
+
+    def write(self, path: str, start: int, docs: List[Tuple[str, Dict[str, int]]]):
+        """
+        Write documents from unsaved_documents to path, one JSON line each.
+
+        start=0 rewrites the file; otherwise the documents are appended, so
+        saving regularly only writes what was inserted in between.
+        """
+        if start > 0 and not docs:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a' if start > 0 else 'w') as f:
+            if start == 0:
+                f.write(json.dumps({'k1': self.k1, 'b': self.b}) + "\n")
+            for memory_id, counts in docs:
+                f.write(json.dumps({'id': memory_id, 'terms': counts}) + "\n")
+
+    def save(self, path: str):
+        self.write(path, *self.unsaved_documents(everything=True))
+
+    def load(self, path: str) -> bool:
+        """Load a saved index. Returns False if there is none or it is unreadable."""
+        if not os.path.exists(path):
+            return False
+        self.reset()
+        try:
+            with open(path, 'r') as f:
+                header = json.loads(f.readline())
+                self.k1 = header['k1']
+                self.b = header['b']
+                for line in f:
+                    doc = json.loads(line)
+                    self.add_counts(doc['id'], doc['terms'])
+        except (ValueError, KeyError):
+            # e.g. a line cut short by a crash while appending
+            self.reset()
+            return False
+        self._saved = len(self.ids)
+        return True
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, memory_id in enumerate(ranking):
+            scores[memory_id] = scores.get(memory_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda memory_id: -scores[memory_id])
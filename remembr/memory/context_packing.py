@@ -0,0 +1,165 @@
+import re
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from remembr.memory.memory import MemoryItem
+from remembr.memory.formatting import MemoryFormatter, default_formatter, format_timestamps
+
+
+LOW_INFORMATION_CAPTIONS = ("no caption generated",)
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _words(caption: str) -> set:
+    return set(_WORD_RE.findall(caption.lower()))
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _first_sentence(caption: str) -> str:
+    return _SENTENCE_RE.split(caption.strip(), maxsplit=1)[0]
+
+
+class ContextPacker:
+    """
+    Fits a chronological caption history into a token budget.
+
+    Packing is deterministic and runs in stages, each only if the previous
+    one was not enough:
+    1. drop low-information captions (empty, failed, or very short ones)
+    2. merge adjacent near-duplicate captions into one segment
+    3. compress older captions to their first sentence, oldest first
+    4. thin out the older half of the history
+    The most recent part of the history is kept verbatim as long as possible.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        token_len: Optional[Callable[[str], int]] = None,
+        formatter: MemoryFormatter = default_formatter,
+        duplicate_threshold: float = 0.7,
+        min_caption_words: int = 4,
+    ):
+        """
+        Args:
+            max_tokens: Token budget of the packed context
+            token_len: Tokenizer length function. Defaults to the formatter's estimate.
+            formatter: Formatter used to render memories
+            duplicate_threshold: Word Jaccard similarity above which adjacent captions are merged
+            min_caption_words: Captions with fewer words are dropped
+        """
+        self.max_tokens = max_tokens
+        self.formatter = formatter
+        self.token_len = token_len if token_len is not None else formatter.token_len
+        self.duplicate_threshold = duplicate_threshold
+        self.min_caption_words = min_caption_words
+
+    def _lengths(self, items: List[MemoryItem]) -> np.ndarray:
+        lines = self.formatter.lines(
+            [item.time for item in items],
+            [item.position for item in items],
+            [item.caption for item in items],
+            thetas=[item.theta for item in items],
+        )
+        return np.array([self.token_len(line) for line in lines], dtype=np.int64)
+
+    def drop_low_information(self, items: List[MemoryItem]) -> List[MemoryItem]:
+        kept = []
+        for item in items:
+            caption = item.caption.strip()
+            if caption.lower().startswith(LOW_INFORMATION_CAPTIONS):
+                continue
+            if len(_WORD_RE.findall(caption.lower())) < self.min_caption_words:
+                continue
+            kept.append(item)
+        return kept
+
+    def merge_duplicates(self, items: List[MemoryItem]) -> List[MemoryItem]:
+        merged = []
+        group = []
+        group_words = None
+
+        def close_group():
+            if len(group) == 1:
+                merged.append(group[0])
+                return
+            # keep the most detailed caption, and the average pose over the group
+            best = max(group, key=lambda item: len(item.caption))
+            end = format_timestamps([group[-1].time])[0]
+            merged.append(MemoryItem(
+                caption=f"{best.caption} (This stayed the same until {end}.)",
+                time=group[0].time,
+                position=np.mean([item.position for item in group], axis=0).tolist(),
+                theta=float(np.mean([item.theta for item in group])),
+            ))
+
+        for item in items:
+            words = _words(item.caption)
+            if group and _jaccard(group_words, words) >= self.duplicate_threshold:
+                group.append(item)
+                continue
+            if group:
+                close_group()
+            group = [item]
+            group_words = words
+        if group:
+            close_group()
+
+        return merged
+
+    def pack(self, items: List[MemoryItem]) -> str:
+        """Render items (in chronological order) within max_tokens."""
+        if isinstance(items, str):
+            return items
+
+        items = list(items)
+        lengths = self._lengths(items)
+
+        # each stage only runs while the history is still over budget
+        for stage in (self.drop_low_information, self.merge_duplicates):
+            if lengths.sum() <= self.max_tokens:
+                break
+            items = stage(items)
+            lengths = self._lengths(items)
+
+        # compress older captions, oldest first, until the history fits
+        if lengths.sum() > self.max_tokens:
+            num_older = len(items) // 2
+            compressed = [MemoryItem(caption=_first_sentence(item.caption), time=item.time,
+                                     position=item.position, theta=item.theta)
+                          for item in items[:num_older]]
+            savings = lengths[:num_older] - self._lengths(compressed)
+            # smallest prefix of compressions that brings us under budget
+            needed = lengths.sum() - self.max_tokens
+            n = int(np.searchsorted(np.cumsum(savings), needed)) + 1
+            n = min(n, num_older)
+            items = compressed[:n] + items[n:]
+            lengths = self._lengths(items)
+
+        # thin out the older half, keeping every other item, until it fits
+        while lengths.sum() > self.max_tokens and len(items) > 1:
+            num_older = max(len(items) // 2, 1)
+            items = items[:num_older][1::2] + items[num_older:]
+            lengths = self._lengths(items)
+            if num_older == 1:
+                break
+
+        return self.formatter.format(
+            [item.time for item in items],
+            [item.position for item in items],
+            [item.caption for item in items],
+            thetas=[item.theta for item in items],
+            max_tokens=self.max_tokens,
+        )
+
+
+def pack_memory(items: List[MemoryItem], max_tokens: int, **kwargs) -> str:
+    return ContextPacker(max_tokens, **kwargs).pack(items)
@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+
+class _Request:
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+        self.enqueue_time = time.perf_counter()
+
+
+class BatchedEmbedder(Embeddings):
+    """
+    Micro-batching embedding executor shared by several threads.
+
+    Concurrent embed_query / embed_documents calls are queued and coalesced
+    into a single forward pass of the underlying embedder. A batch is flushed
+    once max_wait_ms has passed since its first request arrived, or as soon as
+    max_batch_size texts are pending, whichever happens first.
+
+    Since this is a langchain Embeddings, it can be passed anywhere the plain
+    HuggingFaceEmbeddings was used (MilvusMemory, ReMEmbRAgent, Milvus stores).
+    Queries and documents share one forward pass, which matches the default
+    mxbai setup where embed_query is embed_documents on a single text.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embeddings] = None,
+        model_name: str = 'mixedbread-ai/mxbai-embed-large-v1',
+        max_wait_ms: float = 5.0,
+        max_batch_size: int = 32,
+    ):
+        """
+        Args:
+            embedder: Embeddings to batch calls for. Loaded from model_name if None.
+            model_name: HuggingFace model to load when no embedder is given.
+            max_wait_ms: How long the first request of a batch may wait for others.
+            max_batch_size: Maximum number of texts in one forward pass.
+        """
+        if embedder is None:
+            embedder = HuggingFaceEmbeddings(model_name=model_name)
+        self.embedder = embedder
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._metrics_lock = threading.Lock()
+        self.reset_metrics()
+
+        self._worker = threading.Thread(target=self._run, name='BatchedEmbedder', daemon=True)
+        self._worker.start()
+
+    ### Public API
+
+    def submit_query(self, text: str) -> Future:
+        """Queue a single query and return a future resolving to its embedding."""
+        return self._submit([text])
+
+    def submit_documents(self, texts: List[str]) -> Future:
+        """Queue a list of documents and return a future resolving to their embeddings."""
+        return self._submit(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit_query(text).result()[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) == 0:
+            return []
+        return self.submit_documents(texts).result()
+
+    def close(self):
+        """Stop the worker thread once the queue has drained."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    ### Metrics
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self._num_batches = 0
+            self._num_texts = 0
+            self._num_requests = 0
+            self._max_batch = 0
+            self._total_queue_wait = 0.0
+            self._max_queue_wait = 0.0
+            self._total_forward_time = 0.0
+
+    def metrics(self) -> dict:
+        """Batch-size and queue-wait statistics since the last reset (times in ms)."""
+        with self._metrics_lock:
+            num_batches = max(self._num_batches, 1)
+            num_requests = max(self._num_requests, 1)
+            return {
+                'num_batches': self._num_batches,
+                'num_requests': self._num_requests,
+                'num_texts': self._num_texts,
+                'mean_batch_size': self._num_texts / num_batches,
+                'max_batch_size': self._max_batch,
+                'mean_queue_wait_ms': 1000 * self._total_queue_wait / num_requests,
+                'max_queue_wait_ms': 1000 * self._max_queue_wait,
+                'mean_forward_ms': 1000 * self._total_forward_time / num_batches,
+            }
+
+    ### Worker
+
+    def _submit(self, texts: List[str]) -> Future:
+        request = _Request(texts)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchedEmbedder has been closed")
+            self._queue.append(request)
+            self._cond.notify()
+        return request.future
+
+    def _pending_texts(self) -> int:
+        return sum(len(r.texts) for r in self._queue)
+
+    def _next_batch(self) -> List[_Request]:
+        """The next batch of requests, marked running. Empty once closed and drained."""
+        with self._cond:
+            while True:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return []
+
+                # wait until the window of the oldest request closes or the batch is full
+                deadline = self._queue[0].enqueue_time + self.max_wait
+                while self._pending_texts() < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = []
+                num_texts = 0
+                while self._queue:
+                    request = self._queue[0]
+                    # always take at least one request, even if it alone exceeds the batch size
+                    if batch and num_texts + len(request.texts) > self.max_batch_size:
+                        break
+                    self._queue.popleft()
+                    # callers may cancel their future while it is queued, those are dropped
+                    if not request.future.set_running_or_notify_cancel():
+                        continue
+                    batch.append(request)
+                    num_texts += len(request.texts)
+                if batch:
+                    return batch
+
+    @staticmethod
+    def _resolve(request: _Request, result=None, exception: Optional[BaseException] = None):
+        # a future that is already resolved must not take the worker thread down
+        try:
+            if exception is not None:
+                request.future.set_exception(exception)
+            else:
+                request.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.embedder.embed_documents(texts)
+            except Exception as e:
+                for request in batch:
+                    self._resolve(request, exception=e)
+                continue
+            end = time.perf_counter()
+
+            offset = 0
+            for request in batch:
+                n = len(request.texts)
+                self._resolve(request, result=embeddings[offset:offset + n])
+                offset += n
+
+            with self._metrics_lock:
+                self._num_batches += 1
+                self._num_requests += len(batch)
+                self._num_texts += len(texts)
+                self._max_batch = max(self._max_batch, len(texts))
+                self._total_forward_time += end - start
+                for request in batch:
+                    wait = start - request.enqueue_time
+                    self._total_queue_wait += wait
+                    self._max_queue_wait = max(self._max_queue_wait, wait)
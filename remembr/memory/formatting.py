@@ -0,0 +1,192 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English captions)."""
+    return len(text) // 4 + 1
+
+
+def format_timestamps(times: Sequence[float]) -> List[str]:
+    """Vectorized strftime('%Y-%m-%d %H:%M:%S', localtime(t)) over an array of epoch seconds."""
+    times = np.floor(np.asarray(times, dtype=np.float64)).astype(np.int64)
+    if len(times) == 0:
+        return []
+
+    # one UTC offset for the whole batch unless a DST change falls inside it
+    offset = time.localtime(int(times.min())).tm_gmtoff
+    if time.localtime(int(times.max())).tm_gmtoff != offset:
+        return [time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(t))) for t in times]
+
+    stamps = np.datetime_as_string((times + offset).astype('datetime64[s]'), unit='s')
+    return [s.replace('T', ' ') for s in stamps.tolist()]
+
+
+def format_positions(positions: Sequence[Sequence[float]]) -> List[str]:
+    """Vectorized str(np.array(p).round(3).tolist()) over a list of positions."""
+    if len(positions) == 0:
+        return []
+    return [str(p) for p in np.round(np.asarray(positions, dtype=np.float64), 3).tolist()]
+
+
+class MemoryFormatter:
+    """
+    Renders retrieved memories into the text given to the LLM.
+
+    Times and positions of uncached memories are formatted in one vectorized
+    pass, rendered lines are cached per memory id, and the output is joined in
+    one go. With max_tokens, entries are kept in rank order until the budget is
+    reached and the lowest-ranked remainder is collapsed into a summary line.
+    """
+
+    def __init__(self, cache_size: int = 50000, token_len: Callable[[str], int] = estimate_tokens):
+        self.cache_size = cache_size
+        self.token_len = token_len
+        self._cache = OrderedDict()
+
+    def _render(self, times, positions, captions, thetas) -> List[str]:
+        stamps = format_timestamps(times)
+        poses = format_positions(positions)
+
+        lines = []
+        for i, (t, p, caption) in enumerate(zip(stamps, poses, captions)):
+            if thetas is None:
+                s = f"At time={t}, the robot was at an average position of {p}. "
+            else:
+                s = f"At time={t}, the robot was at an average position of {p} with an average orientation of {thetas[i]} radians. "
+            s += f"The robot saw the following: {caption}\n\n"
+            lines.append(s)
+        return lines
+
+    def lines(
+        self,
+        times: Sequence[float],
+        positions: Sequence[Sequence[float]],
+        captions: Sequence[str],
+        thetas: Optional[Sequence[float]] = None,
+        ids: Optional[Sequence[Hashable]] = None,
+    ) -> List[str]:
+        """Rendered line per memory, in input order."""
+        # the key holds everything that is rendered, so a cached line always matches its memory
+        rounded = np.round(np.asarray(positions, dtype=np.float64), 3).tolist() if len(captions) else []
+        keys = []
+        for i in range(len(captions)):
+            memory_id = ids[i] if ids is not None else None
+            theta = None if thetas is None else thetas[i]
+            keys.append((memory_id, captions[i], float(times[i]), tuple(rounded[i]), theta, thetas is not None))
+
+        lines = [self._cache.get(key) for key in keys]
+        missing = [i for i, line in enumerate(lines) if line is None]
+        if missing:
+            rendered = self._render(
+                [times[i] for i in missing],
+                [positions[i] for i in missing],
+                [captions[i] for i in missing],
+                None if thetas is None else [thetas[i] for i in missing],
+            )
+            for i, line in zip(missing, rendered):
+                lines[i] = line
+                self._cache[keys[i]] = line
+
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return lines
+
+    def format(
+        self,
+        times: Sequence[float],
+        positions: Sequence[Sequence[float]],
+        captions: Sequence[str],
+        thetas: Optional[Sequence[float]] = None,
+        ids: Optional[Sequence[Hashable]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Render memories, best-ranked first.
+
+        Args:
+            times: Absolute epoch times in seconds
+            positions: (x, y, z) positions
+            captions: Captions
+            thetas: Optional orientations, only rendered when given
+            ids: Optional memory ids used as cache keys
+            max_tokens: Optional budget for the whole string
+
+        Returns:
+            The rendered memories
+        """
+        lines = self.lines(times, positions, captions, thetas, ids)
+        if max_tokens is None:
+            return "".join(lines)
+
+        # reserve room for the line describing what was left out
+        budget = max_tokens - self.token_len(self._summary(len(lines), times[0], times[-1])) if lines else max_tokens
+        used = 0
+        kept = 0
+        for line in lines:
+            n = self.token_len(line)
+            if used + n > budget:
+                break
+            used += n
+            kept += 1
+
+        if kept == len(lines):
+            return "".join(lines)
+
+        dropped = list(range(kept, len(lines)))
+        summary = self._summary(len(dropped), min(times[i] for i in dropped), max(times[i] for i in dropped))
+        return "".join(lines[:kept]) + summary
+
+    @staticmethod
+    def _summary(num_dropped: int, start: float, end: float) -> str:
+        start, end = format_timestamps([start, end])
+        return f"({num_dropped} lower-ranked memories between {start} and {end} were left out to save space.)\n\n"
+
+
+default_formatter = MemoryFormatter()
+
+
+def _doc_time(time_field: Any) -> float:
+    # Milvus stores time as a [t, 0] vector
+    return time_field[0] if np.ndim(time_field) > 0 else time_field
+
+
+def documents_to_string(docs: List[Any], ref_time: Optional[float] = None, max_tokens: Optional[int] = None,
+                        formatter: MemoryFormatter = default_formatter) -> str:
+    """Format langchain Documents returned by the Milvus vector stores."""
+    times = [_doc_time(doc.metadata['time']) + (ref_time or 0) for doc in docs]
+    return formatter.format(
+        times,
+        [doc.metadata['position'] for doc in docs],
+        [doc.page_content for doc in docs],
+        ids=[doc.metadata.get('id') for doc in docs],
+        max_tokens=max_tokens,
+    )
+
+
+def dicts_to_string(docs: List[dict], max_tokens: Optional[int] = None,
+                    formatter: MemoryFormatter = default_formatter) -> str:
+    """Format caption dicts as stored in the preprocessed caption files."""
+    return formatter.format(
+        [_doc_time(doc['time']) for doc in docs],
+        [doc['position'] for doc in docs],
+        [doc['caption'] for doc in docs],
+        ids=[doc.get('id') for doc in docs],
+        max_tokens=max_tokens,
+    )
+
+
+def items_to_string(items: List[Any], max_tokens: Optional[int] = None,
+                    formatter: MemoryFormatter = default_formatter) -> str:
+    """Format MemoryItems, including their orientation."""
+    return formatter.format(
+        [item.time for item in items],
+        [item.position for item in items],
+        [item.caption for item in items],
+        thetas=[item.theta for item in items],
+        max_tokens=max_tokens,
+    )
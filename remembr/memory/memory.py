@@ -1,5 +1,9 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import List, Optional, Union
+import contextvars
 import inspect 
+import ast
 
 @dataclass
 class MemoryItem:
@@ -21,8 +25,68 @@ class MemoryItem:
             self.caption = ''
 
 
+def parse_position(query) -> Optional[list]:
+    """Return query as an [x, y, z] list if it is a position (also as a string), else None."""
+    if isinstance(query, str):
+        try:
+            query = ast.literal_eval(query.strip())
+        except (ValueError, SyntaxError):
+            return None
+    if isinstance(query, (list, tuple)) and len(query) == 3:
+        try:
+            return [float(v) for v in query]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class MemoryIndex:
+    """
+    A derived structure over the memories (visits, places, keyword index, ...).
+
+    Memory backends call add() for every inserted memory, in insertion order,
+    and reset() when their contents are dropped.
+    """
+
+    # whether add() needs the text embedding, so backfills can skip loading them
+    needs_embeddings = True
+    # whether the memories stored before the index was added are fed to it
+    needs_backfill = True
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+
+# working memories of the sessions open in the current context, by id of their Memory
+_sessions = contextvars.ContextVar("remembr_memory_sessions", default={})
+
+
 class Memory:
 
+    @contextmanager
+    def session(self):
+        """
+        Give the current context (a query, and the threads it copies its context
+        into) its own working memory, so concurrent queries on one memory do not
+        see each other's retrieved documents.
+
+        Returns:
+            the (initially empty) working memory list of the session
+        """
+        working_memory = []
+        token = _sessions.set({**_sessions.get(), id(self): working_memory})
+        try:
+            yield working_memory
+        finally:
+            _sessions.reset(token)
+
+    def session_working_memory(self) -> Optional[list]:
+        """The working memory of the session open in the current context, None outside of a session."""
+        return _sessions.get().get(id(self))
+
     def insert(self, item: MemoryItem):
         raise NotImplementedError
 
@@ -35,9 +99,25 @@ class Memory:
     def search_by_time(self, hms_time_query: str) -> list[MemoryItem]:
         raise NotImplementedError
 
-    def search_by_text(self, query: str) -> list[MemoryItem]:
+    def search_by_text(self, query: Union[str, List[str]]) -> list[MemoryItem]:
+        raise NotImplementedError
+
+    def search_visits(self, query: Union[str, tuple]) -> str:
+        raise NotImplementedError
+
+    def search_places(self, query: str) -> str:
+        raise NotImplementedError
+
+    def search_objects(self, query: str) -> str:
         raise NotImplementedError
 
+    def search_timeline(self, query: str) -> str:
+        raise NotImplementedError
+
+    def get_digest(self) -> str:
+        """Aggregate statistics about the memories. Empty if the backend does not keep any."""
+        return ""
+
     def memory_to_string(self, memory_list: list[MemoryItem]) -> str:
         raise NotImplementedError
 
@@ -2,6 +2,7 @@ from typing import List, Optional
 import argparse
 from remembr.memory.memory import MemoryItem
 from remembr.memory.milvus_memory import MilvusMemory
+from remembr.memory.object_extractor import extract_objects
 from remembr.captioners.vila_captioner import VILACaptioner
 from PIL import Image
 
@@ -13,6 +14,7 @@ class MemoryBuilder:
     This class handles:
     - Connecting to Milvus database
     - Generating captions from images using VILA
+    - Extracting object mentions from captions for the object sighting table
     - Creating and inserting MemoryItems
 
     """
@@ -27,6 +29,7 @@ class MemoryBuilder:
         num_video_frames: int = 6,
         temperature: float = 0.2,
         max_new_tokens: int = 512,
+        embedder=None,
     ):
         """
         Initialize the memory builder.
@@ -40,12 +43,14 @@ class MemoryBuilder:
             num_video_frames: Number of images to process at once
             temperature: Temperature for caption generation
             max_new_tokens: Maximum tokens for captions
+            embedder: Optional shared embedder (e.g. a BatchedEmbedder)
         """
         # Initialize memory database
         self.memory = MilvusMemory(
             db_collection_name=collection_name,
             db_ip=db_ip,
-            db_port=db_port
+            db_port=db_port,
+            embedder=embedder,
         )
         
         # Initialize VILA captioner
@@ -101,9 +106,11 @@ class MemoryBuilder:
             theta=theta
         )
         
+        objects = extract_objects(caption)
+
         # Insert into database
-        self.memory.insert(memory_item)
-        print(f"Inserted memory at time {time}, position {position}")
+        self.memory.insert(memory_item, objects=objects)
+        print(f"Inserted memory at time {time}, position {position} with objects {[obj for obj, _ in objects]}")
     
     def reset_memory(self, drop_collection: bool = False):
         """Reset the memory database."""
@@ -1,12 +1,26 @@
 from dataclasses import dataclass, asdict
 
 import datetime, time
+import json
+import os
+import re
+import threading
 from time import strftime, localtime
-from typing import Any, List, Optional, Tuple
+from typing import Any, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 import numpy as np
 
-from remembr.memory.memory import Memory, MemoryItem
+from remembr.memory.memory import Memory, MemoryIndex, MemoryItem, parse_position
+from remembr.memory.visit_index import VisitIndex
+from remembr.memory.place_index import PlaceIndex
+from remembr.memory.bm25_index import BM25Index, reciprocal_rank_fusion
+from remembr.memory.object_index import ObjectSightingIndex
+from remembr.memory.timeline_index import TimelineIndex
+from remembr.memory.stats_index import MemoryStatsIndex
+from remembr.memory.mmr import maximal_marginal_relevance
+from remembr.memory.formatting import documents_to_string
+from remembr.utils.tracing import traced
+from remembr.utils.deadline import remaining_time
 
 from langchain_community.vectorstores import Milvus
 from langchain_huggingface import HuggingFaceEmbeddings
@@ -16,6 +30,9 @@ from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Colle
 
 FIXED_SUBTRACT=1721761000 # this is just a large value that brings us close to 1970
 
+# derived indexes of a collection are saved to INDEX_ROOT/<collection name> unless an index_dir is given
+INDEX_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "remembr", "indexes")
+
 
 
 class MilvusWrapper:
@@ -73,6 +90,25 @@ class MilvusWrapper:
     def insert(self, data_list):
         res = self.collection.insert(data_list)
 
+    def iter_batches(self, output_fields, batch_size=1000):
+        """Yield the rows of the collection with the given fields, batch_size rows at a time."""
+        self.collection.load()
+        iterator = self.collection.query_iterator(batch_size=batch_size, output_fields=output_fields)
+        try:
+            while True:
+                batch = iterator.next()
+                if len(batch) == 0:
+                    break
+                yield batch
+        finally:
+            iterator.close()
+
+    def query_ids(self, ids, output_fields):
+        """Return the rows with the given ids, in the order of ids."""
+        rows = self.collection.query(expr=f"id in {json.dumps(list(ids))}", output_fields=output_fields)
+        by_id = {row['id']: row for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
     def search(self, data):
 
         self.collection.load()
@@ -105,21 +141,77 @@ class MilvusWrapper:
 class MilvusMemory(Memory):
 
 
-    def __init__(self, db_collection_name: str, db_ip='127.0.0.1', db_port=19530, time_offset=FIXED_SUBTRACT):
+    def __init__(self, db_collection_name: str, db_ip='127.0.0.1', db_port=19530, time_offset=FIXED_SUBTRACT, embedder=None,
+                 use_mmr=False, mmr_fetch_k=20, mmr_lambda=0.5, mmr_time_scale=10.0, mmr_position_scale=2.0,
+                 reranker=None, max_result_tokens=None, use_bm25=False, rrf_k=60, index_dir=None, index_save_interval=100):
 
         self.db_collection_name = db_collection_name
         self.db_ip = db_ip
         self.db_port = db_port
         self.time_offset = time_offset
 
-        self.embedder = HuggingFaceEmbeddings(model_name='mixedbread-ai/mxbai-embed-large-v1')
+        # optional maximal-marginal-relevance re-ranking of text searches
+        self.use_mmr = use_mmr
+        self.mmr_fetch_k = mmr_fetch_k
+        self.mmr_lambda = mmr_lambda
+        self.mmr_time_scale = mmr_time_scale
+        self.mmr_position_scale = mmr_position_scale
+
+        # optional re-ranking stage (e.g. a CrossEncoderReranker) after the dense search
+        self.reranker = reranker
+
+        # optional token budget for the documents returned by each search
+        self.max_result_tokens = max_result_tokens
+
+        # an embedder can be shared across memories and agents (e.g. a BatchedEmbedder)
+        if embedder is None:
+            embedder = HuggingFaceEmbeddings(model_name='mixedbread-ai/mxbai-embed-large-v1')
+        self.embedder = embedder
+
+        # optional keyword (BM25) search fused with the dense text search
+        self.use_bm25 = use_bm25
+        self.rrf_k = rrf_k
+
+        # where derived indexes are persisted
+        if index_dir is None:
+            index_dir = os.path.join(INDEX_ROOT, db_collection_name)
+        self.index_dir = index_dir
+        self.index_save_interval = index_save_interval
+        self._inserts_since_save = 0
+        # serializes writes to index_dir, taken before (never while holding) _index_lock
+        self._save_lock = threading.Lock()
 
         self.working_memory = []
 
+        # derived indexes, updated on insert and backfilled lazily from the collection
+        self.indexes = []
+        self._stale_indexes = []
+        self._index_lock = threading.RLock()
+
+        self.visit_index = VisitIndex()
+        self.add_index(self.visit_index)
+        self.place_index = PlaceIndex()
+        self.add_index(self.place_index)
+        self.bm25_index = BM25Index()
+        if self.use_bm25:
+            self.add_index(self.bm25_index)
+        self.object_index = ObjectSightingIndex()
+        self.add_index(self.object_index)
+        self.timeline_index = TimelineIndex()
+        self.add_index(self.timeline_index)
+        self.stats_index = MemoryStatsIndex()
+        self.add_index(self.stats_index)
+
         self.reset(drop_collection=False)
 
 
-    def insert(self, item: MemoryItem, text_embedding=None):
+    def insert(self, item: MemoryItem, text_embedding=None, objects=None):
+        """
+        Args:
+            item: The memory to store
+            text_embedding: Precomputed caption embedding, computed here if None
+            objects: Precomputed (object, phrase) mentions, extracted from the caption if None
+        """
 
         memory_dict = asdict(item)
         memory_dict['id'] = str(time.time())
@@ -133,6 +225,133 @@ class MilvusMemory(Memory):
 
         self.milv_wrapper.insert([memory_dict])
 
+        # stale indexes will pick this memory up from the collection when they are backfilled
+        with self._index_lock:
+            for index in self.indexes:
+                if index in self._stale_indexes:
+                    continue
+                if index is self.object_index:
+                    index.add(memory_dict['id'], item, objects=objects)
+                else:
+                    index.add(memory_dict['id'], item, text_embedding)
+
+            self._inserts_since_save += 1
+            save = self._inserts_since_save >= self.index_save_interval
+
+        # appends the memories inserted since the last save, outside of the index lock
+        if save:
+            self.save_indexes()
+
+    ### Derived indexes
+
+    def add_index(self, index: MemoryIndex):
+        """Keep index up to date with this memory. Existing memories are fed to it on first use. Adding it again does nothing."""
+        with self._index_lock:
+            if index in self.indexes:
+                return
+            self.indexes.append(index)
+            if index.needs_backfill:
+                self._stale_indexes.append(index)
+
+    def remove_index(self, index: MemoryIndex):
+        """Stop updating index."""
+        with self._index_lock:
+            if index in self.indexes:
+                self.indexes.remove(index)
+            if index in self._stale_indexes:
+                self._stale_indexes.remove(index)
+
+    def iterate_memories(self, with_embeddings=True, batch_size=1000):
+        """
+        All stored memories in time order, as (id, MemoryItem, text_embedding) tuples.
+
+        Only the ids and times of the whole collection are loaded to sort it; the
+        rows themselves are fetched batch_size at a time, so the embeddings are
+        never all in memory at once.
+        """
+        output_fields = ['id', 'caption', 'time', 'position', 'theta']
+        if with_embeddings:
+            output_fields.append('text_embedding')
+
+        order = [(row['time'][0], row['id']) for batch in self.milv_wrapper.iter_batches(['id', 'time'], batch_size)
+                 for row in batch]
+        order.sort()
+
+        for start in range(0, len(order), batch_size):
+            ids = [memory_id for _, memory_id in order[start:start + batch_size]]
+            for row in self.milv_wrapper.query_ids(ids, output_fields):
+                item = MemoryItem(
+                    caption=row['caption'],
+                    time=row['time'][0] + self.time_offset,
+                    position=list(row['position']),
+                    theta=row['theta'],
+                )
+                yield row['id'], item, row.get('text_embedding')
+
+    def _ensure_indexes(self, indexes: Optional[List[MemoryIndex]] = None):
+        """Backfill the given (default: all) indexes that are not up to date yet."""
+        with self._index_lock:
+            stale = [index for index in (self.indexes if indexes is None else indexes) if index in self._stale_indexes]
+            if not stale:
+                return
+
+            # embeddings are the bulk of each row, only fetch them if some index uses them
+            with_embeddings = any(index.needs_embeddings for index in stale)
+            for index in stale:
+                index.reset()
+            for memory_id, item, text_embedding in self.iterate_memories(with_embeddings=with_embeddings):
+                for index in stale:
+                    index.add(memory_id, item, text_embedding)
+            for index in stale:
+                self._stale_indexes.remove(index)
+
+        if self.bm25_index in stale:
+            self.save_indexes(everything=True)
+
+    def _bm25_path(self) -> str:
+        return os.path.join(self.index_dir, "bm25.jsonl")
+
+    def save_indexes(self, everything: bool = False):
+        """
+        Persist the BM25 index to index_dir, so it does not have to be rebuilt on restart.
+
+        Args:
+            everything: Rewrite the saved index instead of appending the memories inserted since the last save
+        """
+        if self.bm25_index not in self.indexes:
+            return
+        with self._save_lock:
+            with self._index_lock:
+                self._inserts_since_save = 0
+                if self.bm25_index in self._stale_indexes:
+                    return
+                start, docs = self.bm25_index.unsaved_documents(everything)
+            self.bm25_index.write(self._bm25_path(), start, docs)
+
+    def _load_indexes(self):
+        if self.bm25_index not in self.indexes:
+            return
+        with self._index_lock:
+            # only trust a saved index that covers exactly the memories in the collection
+            if self.bm25_index.load(self._bm25_path()) and len(self.bm25_index) == self.milv_wrapper.collection.num_entities:
+                self._stale_indexes.remove(self.bm25_index)
+            else:
+                self.bm25_index.reset()
+
+    @property
+    def working_memory(self) -> list:
+        """Documents retrieved so far, per session (see Memory.session) or shared outside of one."""
+        session = self.session_working_memory()
+        return self._working_memory if session is None else session
+
+    @working_memory.setter
+    def working_memory(self, value: list):
+        session = self.session_working_memory()
+        if session is None:
+            self._working_memory = value
+        elif value is not session:
+            session[:] = value
+
     def get_working_memory(self) -> list[MemoryItem]:
         return self.working_memory
 
@@ -143,14 +362,26 @@ class MilvusMemory(Memory):
 
         self.milv_wrapper = MilvusWrapper(self.db_collection_name, self.db_ip, self.db_port, drop_collection=drop_collection)
 
-        text_vector_db = Milvus(
+        with self._index_lock:
+            if drop_collection:
+                for index in self.indexes:
+                    index.reset()
+                self._stale_indexes = []
+            else:
+                self._stale_indexes = [index for index in self.indexes if index.needs_backfill]
+                self._load_indexes()
+
+        if drop_collection:
+            self.save_indexes(everything=True)
+
+        self.text_vector_db = Milvus(
             self.embedder,
             connection_args={"host": self.db_ip, "port": self.db_port},
             collection_name=self.db_collection_name,
             vector_field='text_embedding',
             text_field='caption',
         )
-        self.text_retriever = text_vector_db.as_retriever(search_kwargs={"k": 5})
+        self.text_retriever = self.text_vector_db.as_retriever(search_kwargs={"k": 5})
 
 
         self.position_vector_db = Milvus(
@@ -170,6 +401,7 @@ class MilvusMemory(Memory):
         )
 
 
+    @traced("memory.search_by_position")
     def search_by_position(self, query: tuple) -> str:
         # docs = pos_db.similarity_search_by_vector(np.array(query))
         docs = similarity_search_with_score_by_vector(self.position_vector_db, np.array(query).astype(float))
@@ -181,10 +413,8 @@ class MilvusMemory(Memory):
         """Look up things online."""
         return docs
 
-    def search_by_time(self, hms_time: str) -> str:
-
-        # Input is time like 08:20:30
-        # need to convert to searchable time
+    def hms_to_timestamp(self, hms_time: str) -> float:
+        """Convert an H:M:S time (on the day of the memories) or a full m/d/Y H:M:S time to epoch seconds."""
         t = localtime(self.time_offset)
         mdy_date = strftime('%m/%d/%Y', t)
         template = "%m/%d/%Y %H:%M:%S"
@@ -200,8 +430,14 @@ class MilvusMemory(Memory):
         if not res: # convert to the right format then
             hms_time = mdy_date + ' ' + hms_time
 
-        query = time.mktime(datetime.datetime.strptime(hms_time,template).timetuple()) - self.time_offset
-        # convert from hms_time to something searchable
+        return time.mktime(datetime.datetime.strptime(hms_time,template).timetuple())
+
+    @traced("memory.search_by_time")
+    def search_by_time(self, hms_time: str) -> str:
+
+        # Input is time like 08:20:30
+        # need to convert to searchable time
+        query = self.hms_to_timestamp(hms_time) - self.time_offset
 
 
         docs = similarity_search_with_score_by_vector(self.time_vector_db, np.array([query, 0]))
@@ -215,10 +451,35 @@ class MilvusMemory(Memory):
 
 
 
-    def search_by_text(self, query: str) -> str:
+    @traced("memory.search_by_text")
+    def search_by_text(self, query: Union[str, List[str]], k: int = 5) -> str:
+
+        # a list of paraphrases is embedded in one batch and searched as one nq>1 request
+        queries = [query] if isinstance(query, str) else [q for q in query if q]
+        if len(queries) == 0:
+            return ""
+
+        embeddings = self.embedder.embed_documents(queries)
+        fetch_k = k
+        if self.use_mmr:
+            fetch_k = max(fetch_k, self.mmr_fetch_k)
+        if self.reranker is not None:
+            fetch_k = max(fetch_k, self.reranker.fetch_k)
+        results = similarity_search_by_vectors(self.text_vector_db, embeddings, k=fetch_k)
+        if self.use_bm25:
+            docs = self.fuse_keyword_results(queries, results, fetch_k)
+        else:
+            docs = merge_results_by_id(results)
+
+        # each query contributes up to k unique memories
+        num_results = k * len(queries)
+        if self.reranker is not None:
+            # when diversifying afterwards, leave MMR some of the re-ranked candidates to choose from
+            docs = self.reranker.rerank(queries, docs, k=2 * num_results if self.use_mmr else num_results)
+        if self.use_mmr:
+            docs = self.diversify(embeddings, docs, num_results)
+        docs = docs[:num_results]
 
-        docs = self.text_retriever.invoke(query)
-        
         self.working_memory += docs
 
         docs = self.memory_to_string(docs)
@@ -227,27 +488,226 @@ class MilvusMemory(Memory):
         return docs
     
 
+    @traced("memory.search_visits")
+    def search_visits(self, query: Union[str, tuple, list]) -> str:
+        """Visits to a position (x,y,z) or to places matching a text description."""
+        visits = self.find_visits(query)
+        with self._index_lock:
+            return self.visit_index.visits_to_string(visits)
+
+    def find_visits(self, query: Union[str, tuple, list]) -> list:
+        self._ensure_indexes()
+
+        # embed outside of the lock, inserts wait for the index reads only
+        position = parse_position(query)
+        embedding = None if position is not None else self.embedder.embed_query(str(query))
+        with self._index_lock:
+            if position is not None:
+                return self.visit_index.visits_near(position)
+            return self.visit_index.visits_matching(embedding)
+
+    @traced("memory.search_places")
+    def search_places(self, query: str, k_places: int = 3, k_memories: int = 5) -> str:
+        """Match the query against aggregated places first, then their member memories."""
+        self._ensure_indexes()
+        embedding = self.embedder.embed_query(query)
+        with self._index_lock:
+            return self.place_index.search_to_string(embedding, k_places, k_memories)
+
+    def fuse_keyword_results(self, queries: List[str], results: List[List[Tuple[Document, float]]], fetch_k: int) -> List[Document]:
+        """
+        Fuse the dense results with BM25 keyword results using reciprocal rank fusion.
+
+        Every query contributes one dense and one keyword ranking. Memories that
+        only the keyword search found are fetched from the collection by id.
+        """
+        self._ensure_indexes([self.bm25_index])
+
+        rankings = []
+        docs_by_id = {}
+        for query, result in zip(queries, results):
+            rankings.append([doc.metadata['id'] for doc, _ in result])
+            for doc, _ in result:
+                docs_by_id.setdefault(doc.metadata['id'], doc)
+            with self._index_lock:
+                keyword_hits = self.bm25_index.search(query, k=fetch_k)
+            rankings.append([memory_id for memory_id, _ in keyword_hits])
+
+        fused = reciprocal_rank_fusion(rankings, k=self.rrf_k)[:fetch_k * len(queries)]
+
+        missing = [memory_id for memory_id in fused if memory_id not in docs_by_id]
+        for doc in self.get_documents_by_id(missing):
+            docs_by_id[doc.metadata['id']] = doc
+
+        return [docs_by_id[memory_id] for memory_id in fused if memory_id in docs_by_id]
+
+    def get_documents_by_id(self, ids: List[str]) -> List[Document]:
+        """Fetch memories as Documents, with the same metadata as search results."""
+        if len(ids) == 0:
+            return []
+        db = self.text_vector_db
+        self.milv_wrapper.collection.load()
+        rows = self.milv_wrapper.collection.query(expr=f"id in {json.dumps(list(ids))}", output_fields=db.fields[:],
+                                                  timeout=remaining_time())
+
+        docs = []
+        for row in rows:
+            vector = row.get(db._vector_field)
+            doc = db._parse_document(row)
+            doc.metadata.setdefault(db._vector_field, vector)
+            docs.append(doc)
+        return docs
+
+    ### Object sightings
+
+    def object_first_seen(self, query: str):
+        self._ensure_indexes([self.object_index])
+        with self._index_lock:
+            return self.object_index.first_seen(query)
+
+    def object_last_seen(self, query: str):
+        self._ensure_indexes([self.object_index])
+        with self._index_lock:
+            return self.object_index.last_seen(query)
+
+    def object_count(self, query: str) -> dict:
+        self._ensure_indexes([self.object_index])
+        with self._index_lock:
+            return self.object_index.count(query)
+
+    @traced("memory.search_objects")
+    def search_objects(self, query: str) -> str:
+        """When an object was first and last seen, and how many times, from the sighting table."""
+        self._ensure_indexes([self.object_index])
+        with self._index_lock:
+            return self.object_index.sightings_to_string(query)
+
+    ### Aggregate statistics
+
+    def get_digest(self, num_places: int = 3) -> str:
+        """Aggregate facts about all memories (time span, distance, area, top places) for the agent prompt."""
+        self._ensure_indexes([self.stats_index])
+        with self._index_lock:
+            return self.stats_index.digest(num_places)
+
+    ### Timeline summaries
+
+    @traced("memory.search_timeline")
+    def search_timeline(self, query: str, k: int = 2) -> str:
+        """
+        Timeline summaries for a time range ('13:00:00 - 17:30:00') or, for any
+        other query, the best hour, 10-minute and minute summaries for it.
+        """
+        summaries = self.find_timeline_summaries(query, k=k)
+        with self._index_lock:
+            return self.timeline_index.summaries_to_string(summaries)
+
+    def find_timeline_summaries(self, query: str, k: int = 2) -> list:
+        self._ensure_indexes([self.timeline_index])
+
+        times = re.findall(r"\d{1,2}:\d{2}(?::\d{2})?", str(query))
+        if len(times) == 2:
+            start, end = (self.hms_to_timestamp(t if t.count(':') == 2 else t + ':00') for t in times)
+            with self._index_lock:
+                return self.timeline_index.summaries_between(start, end)
+
+        embedding = self.embedder.embed_query(str(query))
+        with self._index_lock:
+            levels = self.timeline_index.search(embedding, k=k)
+            return [summary for level in levels for summary in level]
+
+    def diversify(self, query_embeddings, docs: List[Document], k: int) -> List[Document]:
+        """Select a diverse top-k from an over-fetched candidate list with MMR."""
+        docs = [doc for doc in docs if doc.metadata.get('text_embedding') is not None]
+        if len(docs) <= k:
+            return docs
+
+        candidate_embeddings = np.array([doc.metadata['text_embedding'] for doc in docs])
+        times = np.array([np.atleast_1d(doc.metadata['time'])[0] for doc in docs])
+        positions = np.array([doc.metadata['position'] for doc in docs])
+
+        selected = maximal_marginal_relevance(
+            np.array(query_embeddings), candidate_embeddings, k,
+            lambda_mult=self.mmr_lambda,
+            times=times,
+            positions=positions,
+            time_scale=self.mmr_time_scale,
+            position_scale=self.mmr_position_scale,
+        )
+        return [docs[i] for i in selected]
+
+
     ### Doc formatting for the last LLM
-    def memory_to_string(self, memory_list: list[MemoryItem], ref_time: float=None):
+    def memory_to_string(self, memory_list: list[MemoryItem], ref_time: float=None, max_tokens: Optional[int]=None):
         if ref_time == None:
             ref_time = self.time_offset
+        if max_tokens is None:
+            max_tokens = self.max_result_tokens
+
+        return documents_to_string(memory_list, ref_time=ref_time, max_tokens=max_tokens)
+
+
+def merge_results_by_id(results: List[List[Tuple[Document, float]]]) -> List[Document]:
+    """Merge per-query results, keeping the best (smallest L2) score per memory id."""
+    best = {}
+    for result in results:
+        for doc, score in result:
+            key = doc.metadata.get('id', doc.page_content)
+            if key not in best or score < best[key][1]:
+                best[key] = (doc, score)
+
+    return [doc for doc, _ in sorted(best.values(), key=lambda pair: pair[1])]
 
-        out_string = ""
-        for doc in memory_list:
-            if len(doc.metadata['time']) == 2:
-                t = doc.metadata['time'][0]
-            else:
-                t = doc.metadata['time']
-            
-            if ref_time:
-                t += ref_time
-            t = localtime(t)
-            t = strftime('%Y-%m-%d %H:%M:%S', t)
 
-            s = f"At time={t}, the robot was at an average position of {np.array(doc.metadata['position']).round(3).tolist()}."
-            s += f"The robot saw the following: {doc.page_content}\n\n"
-            out_string += s
-        return out_string
+def similarity_search_by_vectors(
+        db,
+        embeddings: List[List[float]],
+        k: int = 4,
+        param: Optional[dict] = None,
+        expr: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search several vectors in a single Milvus request (nq=len(embeddings)).
+
+        Same arguments as similarity_search_with_score_by_vector, but returns one
+        list of (doc, score) pairs per query vector. The score is also stored in
+        doc.metadata['score'].
+        """
+        if db.col is None:
+            print("No existing collection to search.")
+            return [[] for _ in embeddings]
+
+        if param is None:
+            param = db.search_params
+
+        output_fields = db.fields[:]
+        # a tool call's time limit (see remembr.utils.deadline) bounds the search
+        timeout = db.timeout or timeout or remaining_time()
+        res = db.col.search(
+            data=list(embeddings),
+            anns_field=db._vector_field,
+            param=param,
+            limit=k,
+            expr=expr,
+            output_fields=output_fields,
+            timeout=timeout,
+            **kwargs,
+        )
+
+        ret = []
+        for hits in res:
+            pairs = []
+            for result in hits:
+                data = {x: result.entity.get(x) for x in output_fields}
+                vector = data.get(db._vector_field)
+                doc = db._parse_document(data)
+                # keep the vector even if the langchain version strips it, it is needed for re-ranking
+                doc.metadata.setdefault(db._vector_field, vector)
+                doc.metadata['score'] = result.score
+                pairs.append((doc, result.score))
+            ret.append(pairs)
+        return ret
 
 
 # NOTE: This version of the code returns the vector
@@ -289,7 +749,8 @@ def similarity_search_with_score_by_vector(
         # Determine result metadata fields with PK.
         output_fields = pos_db.fields[:]
         # output_fields.remove(pos_db._vector_field) # NOTE: Only thing removed
-        timeout = pos_db.timeout or timeout
+        # a tool call's time limit (see remembr.utils.deadline) bounds the search
+        timeout = pos_db.timeout or timeout or remaining_time()
         # Perform the search.
         res = pos_db.col.search(
             data=[embedding],
@@ -306,6 +767,7 @@ def similarity_search_with_score_by_vector(
         for result in res[0]:
             data = {x: result.entity.get(x) for x in output_fields}
             doc = pos_db._parse_document(data)
+            doc.metadata['score'] = result.score
             pair = (doc, result.score)
             ret.append(pair)
 
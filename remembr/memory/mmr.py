@@ -0,0 +1,93 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def redundancy_matrix(
+    candidate_embeddings: np.ndarray,
+    times: Optional[np.ndarray] = None,
+    positions: Optional[np.ndarray] = None,
+    time_scale: float = 10.0,
+    position_scale: float = 2.0,
+    time_weight: float = 0.5,
+    position_weight: float = 0.5,
+) -> np.ndarray:
+    """
+    Pairwise similarity between candidates, in [0, 1] up to embedding noise.
+
+    Cosine similarity of the caption embeddings is blended with how close two
+    memories are in time and space, so that captions from the same few seconds
+    or the same spot count as redundant even when they are worded differently.
+    """
+    emb = _normalize(np.asarray(candidate_embeddings, dtype=np.float32))
+    sim = emb @ emb.T
+    total_weight = 1.0
+
+    if times is not None and time_weight > 0:
+        times = np.asarray(times, dtype=np.float64)
+        dt = np.abs(times[:, None] - times[None, :])
+        sim = sim + time_weight * np.exp(-dt / time_scale)
+        total_weight += time_weight
+
+    if positions is not None and position_weight > 0:
+        positions = np.asarray(positions, dtype=np.float64)
+        dist = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=-1)
+        sim = sim + position_weight * np.exp(-dist / position_scale)
+        total_weight += position_weight
+
+    return sim / total_weight
+
+
+def maximal_marginal_relevance(
+    query_embeddings: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    times: Optional[np.ndarray] = None,
+    positions: Optional[np.ndarray] = None,
+    **redundancy_kwargs,
+) -> List[int]:
+    """
+    Pick a relevant but diverse subset of candidates.
+
+    Args:
+        query_embeddings: (d,) or (nq, d) query embedding(s). With several queries
+            a candidate's relevance is its best similarity over the queries.
+        candidate_embeddings: (n, d) candidate embeddings
+        k: Number of candidates to select
+        lambda_mult: 1 is pure relevance, 0 is pure diversity
+        times: Optional (n,) candidate times in seconds
+        positions: Optional (n, 3) candidate positions in meters
+        redundancy_kwargs: Scales and weights passed to redundancy_matrix
+
+    Returns:
+        Indices of the selected candidates in selection order
+    """
+    candidate_embeddings = np.asarray(candidate_embeddings, dtype=np.float32)
+    n = len(candidate_embeddings)
+    if n == 0 or k <= 0:
+        return []
+
+    queries = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+    relevance = (_normalize(candidate_embeddings) @ queries.T).max(axis=1)
+    redundancy = redundancy_matrix(candidate_embeddings, times, positions, **redundancy_kwargs)
+
+    selected = [int(np.argmax(relevance))]
+    max_redundancy = redundancy[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_redundancy, redundancy[best], out=max_redundancy)
+
+    return selected
@@ -0,0 +1,109 @@
+import re
+from typing import List, Tuple
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*|[.,;:!?()\"]")
+
+DETERMINERS = frozenset("""
+a an the some two three four five six seven eight nine ten several many few another
+his her their its this that these those one multiple various numerous
+""".split())
+
+# "a group of people" is about the people, not the group
+QUANTIFIERS = frozenset("""
+group groups lot lots couple number variety pair pairs row rows line lines bunch set sets pile piles stack stacks
+""".split())
+
+BREAK_WORDS = frozenset("""
+of to in on at by for with from into onto over under near behind beside between through across along around
+above below inside outside next against toward towards up down out off while as than like and or but nor so
+is are was were be been being has have had do does did can could will would should may might must
+that which who whom whose where when what how there here it they them he she we you i
+also very just not no then
+shows show appears appear features depicts contains includes captures seems looks stands walks sits moves
+""".split())
+
+# nouns that describe the video rather than something in it
+GENERIC_NOUNS = frozenset("""
+image images video videos scene scenes view views frame frames picture background foreground camera footage
+side sides time times moment area areas part parts way thing things one kind type front middle left right top bottom
+""".split())
+
+# nouns that look like verbs to the rules below
+ING_ED_NOUNS = frozenset("building buildings ceiling clothing railing railings painting paintings parking crossing bed sled shed".split())
+
+MAX_PHRASE_WORDS = 4
+
+
+# plurals ending in -ses that drop the -es (most others, like houses or vases, only drop the -s)
+SES_PLURALS = frozenset("buses gases lenses bonuses campuses canvases atlases circuses walruses".split())
+
+
+def singularize(word: str) -> str:
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zzes", "sses")) or word in SES_PLURALS:
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _is_verb_like(word: str) -> bool:
+    if word in ING_ED_NOUNS:
+        return False
+    return (word.endswith("ing") and len(word) > 5) or (word.endswith("ed") and len(word) > 4)
+
+
+def extract_objects(caption: str) -> List[Tuple[str, str]]:
+    """
+    Object mentions in a caption as (object, phrase) pairs, e.g. ('cone', 'orange cone').
+
+    A small rule-based noun-phrase chunker: a phrase starts after a determiner
+    or number and runs until a preposition, verb, conjunction or punctuation.
+    Its last word (singularized) is the object, the whole phrase keeps the
+    modifiers such as colours. Each object is reported once per caption.
+    """
+    tokens = _WORD_RE.findall(caption.lower())
+
+    objects = []
+    seen = set()
+    i = 0
+    while i < len(tokens):
+        if tokens[i] not in DETERMINERS and not tokens[i].isdigit():
+            i += 1
+            continue
+
+        i += 1
+        phrase = []
+        while i < len(tokens) and len(phrase) < MAX_PHRASE_WORDS:
+            word = tokens[i]
+            if not word[0].isalnum() or word in BREAK_WORDS or word in DETERMINERS or _is_verb_like(word):
+                break
+            phrase.append(word)
+            i += 1
+            # skip over "group of", "a couple of", ...
+            if word in QUANTIFIERS and i < len(tokens) and tokens[i] == "of":
+                phrase = []
+                i += 1
+
+        if not phrase:
+            continue
+        head = singularize(phrase[-1])
+        if head in GENERIC_NOUNS or head.isdigit() or head in seen:
+            continue
+        seen.add(head)
+        objects.append((head, " ".join(phrase[:-1] + [head])))
+
+    return objects
+
+
+def normalize_object_query(query: str) -> Tuple[str, List[str]]:
+    """Split a query like 'the orange cones' into its object ('cone') and modifiers (['orange'])."""
+    words = [w for w in _WORD_RE.findall(query.lower())
+             if w[0].isalnum() and w not in DETERMINERS and w not in BREAK_WORDS]
+    if not words:
+        return "", []
+    return singularize(words[-1]), words[:-1]
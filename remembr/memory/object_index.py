@@ -0,0 +1,140 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.object_extractor import extract_objects, normalize_object_query
+from remembr.memory.formatting import format_timestamps, format_positions
+
+
+@dataclass
+class Sighting:
+    object: str
+    phrase: str
+    memory_id: str
+    time: float
+    position: list
+
+
+class ObjectSightingIndex(MemoryIndex):
+    """
+    Table of object sightings, one row per (object, memory).
+
+    Objects are pulled out of each caption at insert time (see
+    object_extractor) and stored in SQLite with indexes on object and time,
+    so first-seen, last-seen and count questions are a single indexed query
+    instead of several rounds of text retrieval.
+    """
+
+    needs_embeddings = False
+
+    def __init__(self, path: str = ":memory:", episode_gap: float = 30.0):
+        """
+        Args:
+            path: SQLite database file, in memory by default
+            episode_gap: Sightings further apart than this (in seconds) count as separate times seen
+        """
+        self.path = path
+        self.episode_gap = episode_gap
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sightings ("
+            "object TEXT NOT NULL, phrase TEXT NOT NULL, memory_id TEXT NOT NULL, "
+            "time REAL NOT NULL, x REAL, y REAL, z REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sightings_object ON sightings (object, time)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sightings_time ON sightings (time)")
+        self._conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sightings")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT memory_id) FROM sightings").fetchone()[0]
+
+    ### Building
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None,
+            objects: Optional[Sequence[Tuple[str, str]]] = None):
+        """Add the objects of one memory. objects are extracted from the caption unless given."""
+        if objects is None:
+            objects = extract_objects(item.caption)
+        x, y, z = (list(item.position) + [0.0, 0.0, 0.0])[:3]
+        rows = [(obj, phrase, memory_id, item.time, x, y, z) for obj, phrase in objects]
+        with self._lock:
+            self._conn.executemany("INSERT INTO sightings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    ### Queries
+
+    def sightings(self, query: str, order: str = "ASC", limit: Optional[int] = None) -> List[Sighting]:
+        """
+        Sightings of the object named in query, in time order.
+
+        Modifiers in the query ('orange cone') narrow the match down to phrases
+        containing them, unless that leaves nothing, then any cone matches.
+        """
+        obj, modifiers = normalize_object_query(query)
+        if not obj:
+            return []
+
+        base = "SELECT object, phrase, memory_id, time, x, y, z FROM sightings WHERE object = ?"
+        suffix = f" ORDER BY time {'DESC' if order.upper() == 'DESC' else 'ASC'}"
+        if limit is not None:
+            suffix += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = []
+            if modifiers:
+                sql = base + "".join(" AND phrase LIKE ?" for _ in modifiers) + suffix
+                rows = self._conn.execute(sql, [obj] + [f"%{m}%" for m in modifiers]).fetchall()
+            if not rows:
+                rows = self._conn.execute(base + suffix, (obj,)).fetchall()
+
+        return [Sighting(object=row[0], phrase=row[1], memory_id=row[2], time=row[3], position=list(row[4:7]))
+                for row in rows]
+
+    def first_seen(self, query: str) -> Optional[Sighting]:
+        sightings = self.sightings(query, order="ASC", limit=1)
+        return sightings[0] if sightings else None
+
+    def last_seen(self, query: str) -> Optional[Sighting]:
+        sightings = self.sightings(query, order="DESC", limit=1)
+        return sightings[0] if sightings else None
+
+    def count(self, query: str) -> dict:
+        """
+        Returns:
+            dict with the number of memories mentioning the object and the number
+            of separate episodes (sightings more than episode_gap seconds apart)
+        """
+        times = np.array([s.time for s in self.sightings(query)])
+        if len(times) == 0:
+            return {'num_memories': 0, 'num_episodes': 0}
+        return {
+            'num_memories': len(times),
+            'num_episodes': int(1 + np.sum(np.diff(times) > self.episode_gap)),
+        }
+
+    def sightings_to_string(self, query: str) -> str:
+        sightings = self.sightings(query)
+        if not sightings:
+            return f"No sightings of '{query}' were recorded. Try retrieve_from_text with a related description."
+
+        counts = self.count(query)
+        first, last = sightings[0], sightings[-1]
+        first_time, last_time = format_timestamps([first.time, last.time])
+        first_pos, last_pos = format_positions([first.position, last.position])
+
+        out_string = f"The robot saw {first.object} ('{query}') {counts['num_episodes']} separate times, "
+        out_string += f"mentioned in {counts['num_memories']} memories.\n"
+        out_string += f"It was first seen at time={first_time} at position {first_pos} ({first.phrase}).\n"
+        out_string += f"It was last seen at time={last_time} at position {last_pos} ({last.phrase}).\n\n"
+        return out_string
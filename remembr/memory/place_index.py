@@ -0,0 +1,262 @@
+import bisect
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.formatting import default_formatter, format_positions
+
+
+@dataclass
+class Place:
+    centroid: list
+    embedding: np.ndarray
+    num_visits: int
+    captions: list
+    member_indices: list = field(default_factory=list)
+
+
+@dataclass
+class _PlaceStats:
+    """Running aggregates of one union-find root, merged when places are."""
+    embedding_sum: Optional[np.ndarray]
+    position_sum: np.ndarray
+    times: list                     # member times, sorted
+    members: list                   # member indices, in the order of times
+    num_visits: int = 1
+    place: Optional[Place] = None   # rendered Place, None after a change
+
+
+class PlaceIndex(MemoryIndex):
+    """
+    Incrementally clusters memories into places.
+
+    Positions are binned into a grid of cell_size meters. Cells with at least
+    min_points memories are core cells, and neighbouring core cells are merged
+    (DBSCAN-style, with a union-find) as long as the merged place stays within
+    max_extent meters. Other cells join an adjacent core place or stand alone.
+
+    Each place keeps a normalized mean caption embedding, a visit count and a
+    few representative captions, so a question can first be matched against a
+    few hundred places and then drilled down into their member memories. The
+    embedding sum, members and visit count of every place are kept up to date
+    on insert and merged on union, so an insert only re-renders its own place.
+    """
+
+    def __init__(self, cell_size: float = 2.0, min_points: int = 3, max_extent: float = 15.0,
+                 visit_gap: float = 60.0, num_captions: int = 3):
+        self.cell_size = cell_size
+        self.min_points = min_points
+        self.max_extent = max_extent
+        self.visit_gap = visit_gap
+        self.num_captions = num_captions
+        self.reset()
+
+    def reset(self):
+        # per-memory table
+        self.ids = []
+        self.items = []
+        # normalized embeddings, float16 to keep the table small, grown by doubling
+        self._embedding_array = None
+
+        # grid and union-find over cells
+        self.cells: Dict[Tuple[int, int], int] = {}   # number of memories per cell
+        self._parent: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._bbox: Dict[Tuple[int, int], np.ndarray] = {}   # per root, [min_x, min_y, max_x, max_y]
+        self._stats: Dict[Tuple[int, int], _PlaceStats] = {}  # per root
+
+        self._places = None
+
+    ### Building
+
+    def _cell(self, position) -> Tuple[int, int]:
+        return (int(np.floor(position[0] / self.cell_size)), int(np.floor(position[1] / self.cell_size)))
+
+    def _find(self, cell):
+        root = cell
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # path compression
+        while self._parent[cell] != root:
+            self._parent[cell], cell = root, self._parent[cell]
+        return root
+
+    def _union(self, a, b):
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return
+        bbox = np.concatenate([np.minimum(self._bbox[ra][:2], self._bbox[rb][:2]),
+                               np.maximum(self._bbox[ra][2:], self._bbox[rb][2:])])
+        if np.any(bbox[2:] - bbox[:2] > self.max_extent):
+            return
+        self._parent[rb] = ra
+        self._bbox[ra] = bbox
+
+        # merge the aggregates of rb into ra
+        a_stats, b_stats = self._stats[ra], self._stats.pop(rb)
+        if a_stats.embedding_sum is None:
+            a_stats.embedding_sum = b_stats.embedding_sum
+        elif b_stats.embedding_sum is not None:
+            a_stats.embedding_sum += b_stats.embedding_sum
+        a_stats.position_sum += b_stats.position_sum
+        merged = list(heapq.merge(zip(a_stats.times, a_stats.members), zip(b_stats.times, b_stats.members)))
+        a_stats.times = [t for t, _ in merged]
+        a_stats.members = [index for _, index in merged]
+        # a new visit starts whenever the robot was away for more than visit_gap
+        a_stats.num_visits = int(1 + np.sum(np.diff(a_stats.times) > self.visit_gap))
+        a_stats.place = None
+        self._places = None
+
+    def _is_core(self, cell) -> bool:
+        return self.cells.get(cell, 0) >= self.min_points
+
+    def _store_embedding(self, index: int, text_embedding: Optional[list]) -> Optional[np.ndarray]:
+        if text_embedding is None:
+            return None
+        embedding = np.asarray(text_embedding, dtype=np.float32)
+        embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+        if self._embedding_array is None:
+            self._embedding_array = np.zeros((max(index + 1, 1024), len(embedding)), dtype=np.float16)
+        elif index >= len(self._embedding_array):
+            grown = np.zeros((max(2 * len(self._embedding_array), index + 1), self._embedding_array.shape[1]), dtype=np.float16)
+            grown[:len(self._embedding_array)] = self._embedding_array
+            self._embedding_array = grown
+        self._embedding_array[index] = embedding
+        return embedding
+
+    def _add_to_stats(self, stats: _PlaceStats, index: int, item: MemoryItem, embedding: Optional[np.ndarray]):
+        if embedding is not None:
+            stats.embedding_sum = embedding.copy() if stats.embedding_sum is None else stats.embedding_sum + embedding
+        stats.position_sum += np.asarray(item.position, dtype=np.float64)[:3]
+
+        # memories mostly arrive in time order, so this is usually an append
+        if not stats.times:
+            stats.num_visits = 1
+        pos = bisect.bisect_right(stats.times, item.time)
+        before = stats.times[pos - 1] if pos > 0 else None
+        after = stats.times[pos] if pos < len(stats.times) else None
+        if before is not None and after is not None and after - before > self.visit_gap:
+            stats.num_visits -= 1
+        if before is not None and item.time - before > self.visit_gap:
+            stats.num_visits += 1
+        if after is not None and after - item.time > self.visit_gap:
+            stats.num_visits += 1
+        stats.times.insert(pos, item.time)
+        stats.members.insert(pos, index)
+        stats.place = None
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        index = len(self.items)
+        self.ids.append(memory_id)
+        self.items.append(item)
+        embedding = self._store_embedding(index, text_embedding)
+        self._places = None
+
+        cell = self._cell(item.position)
+        if cell not in self.cells:
+            self.cells[cell] = 0
+            self._parent[cell] = cell
+            x0, y0 = cell[0] * self.cell_size, cell[1] * self.cell_size
+            self._bbox[cell] = np.array([x0, y0, x0 + self.cell_size, y0 + self.cell_size])
+            self._stats[cell] = _PlaceStats(embedding_sum=None, position_sum=np.zeros(3), times=[], members=[], num_visits=0)
+        self.cells[cell] += 1
+        self._add_to_stats(self._stats[self._find(cell)], index, item, embedding)
+
+        neighbours = [(cell[0] + dx, cell[1] + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        if self.cells[cell] == 1 and not self._is_core(cell):
+            # a new border cell joins the largest adjacent core place
+            cores = [n for n in neighbours if self._is_core(n)]
+            if cores:
+                self._union(max(cores, key=lambda n: self.cells[n]), cell)
+        if self.cells[cell] == self.min_points:
+            # the cell just became core, merge it with neighbouring core cells and unclaimed border cells
+            for neighbour in neighbours:
+                if neighbour not in self.cells:
+                    continue
+                if self._is_core(neighbour) or self._find(neighbour) == neighbour:
+                    self._union(cell, neighbour)
+
+    ### Aggregates
+
+    def embedding_matrix(self) -> np.ndarray:
+        """Normalized float16 embeddings of all memories (zeros where there was none), without copying."""
+        if self._embedding_array is None:
+            return np.zeros((len(self.items), 0), dtype=np.float16)
+        return self._embedding_array[:len(self.items)]
+
+    def _render(self, stats: _PlaceStats) -> Place:
+        members = np.array(stats.members)
+        if stats.embedding_sum is not None:
+            mean = stats.embedding_sum / max(np.linalg.norm(stats.embedding_sum), 1e-12)
+            sims = self.embedding_matrix()[members].astype(np.float32) @ mean
+            top = members[np.argsort(-sims)[:self.num_captions]]
+        else:
+            mean = np.zeros(self.embedding_matrix().shape[1], dtype=np.float32)
+            top = members[:self.num_captions]
+        return Place(
+            centroid=(stats.position_sum / len(members)).tolist(),
+            embedding=mean,
+            num_visits=stats.num_visits,
+            captions=[self.items[i].caption for i in top],
+            member_indices=list(stats.members),
+        )
+
+    def places(self) -> List[Place]:
+        """Current places; only the places that changed since the last call are rendered again."""
+        if self._places is not None:
+            return self._places
+
+        places = []
+        for stats in self._stats.values():
+            if stats.place is None:
+                stats.place = self._render(stats)
+            places.append(stats.place)
+
+        self._places = places
+        return places
+
+    ### Queries
+
+    def search(self, query_embedding: Sequence[float], k_places: int = 3, k_memories: int = 5):
+        """
+        Place-level search followed by a drill-down into member memories.
+
+        Returns:
+            (places, member indices per place), best place first
+        """
+        places = self.places()
+        if not places:
+            return [], []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        place_sims = np.stack([place.embedding for place in places]) @ query
+        top_places = [places[i] for i in np.argsort(-place_sims)[:k_places]]
+
+        embeddings = self.embedding_matrix()
+        members = []
+        for place in top_places:
+            indices = np.array(place.member_indices)
+            sims = embeddings[indices].astype(np.float32) @ query
+            members.append(indices[np.argsort(-sims)[:k_memories]].tolist())
+        return top_places, members
+
+    def search_to_string(self, query_embedding: Sequence[float], k_places: int = 3, k_memories: int = 5) -> str:
+        places, members = self.search(query_embedding, k_places, k_memories)
+        if not places:
+            return "No places have been recorded yet."
+
+        out_string = ""
+        for place, centroid, indices in zip(places, format_positions([p.centroid for p in places]), members):
+            out_string += f"Place around {centroid}, visited {place.num_visits} times over {len(place.member_indices)} memories. "
+            out_string += "It usually looks like: " + " | ".join(place.captions) + "\n"
+            out_string += "Most relevant memories at this place:\n"
+            out_string += default_formatter.format(
+                [self.items[i].time for i in indices],
+                [self.items[i].position for i in indices],
+                [self.items[i].caption for i in indices],
+                ids=[self.ids[i] for i in indices],
+            )
+        return out_string
@@ -0,0 +1,145 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Union
+
+import numpy as np
+
+
+def item_text(item: Any) -> str:
+    """Caption of a langchain Document or a MemoryItem."""
+    if hasattr(item, 'page_content'):
+        return item.page_content
+    return item.caption
+
+
+class CrossEncoderReranker:
+    """
+    Re-ranks dense retrieval candidates with a small CPU cross-encoder.
+
+    (query, caption) pairs are scored in batches and their scores are kept in an
+    LRU cache, so repeated or overlapping searches only score new pairs. If
+    scoring would not fit in latency_budget_ms, the dense order is returned
+    unchanged. Works on langchain Documents and MemoryItems, so any memory
+    backend can call it on its own candidate list.
+    """
+
+    def __init__(
+        self,
+        model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2',
+        device: str = 'cpu',
+        batch_size: int = 32,
+        fetch_k: int = 20,
+        latency_budget_ms: float = 200.0,
+        cache_size: int = 10000,
+        model=None,
+    ):
+        """
+        Args:
+            model_name: sentence-transformers cross-encoder to load
+            device: Device to run the cross-encoder on
+            batch_size: Number of pairs scored per forward pass
+            fetch_k: How many dense candidates a memory should fetch for re-ranking
+            latency_budget_ms: Maximum time spent scoring before falling back to the dense order
+            cache_size: Maximum number of cached pair scores
+            model: Optional already-loaded model with a predict(pairs) method
+        """
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, device=device)
+        self.model = model
+        self.batch_size = batch_size
+        self.fetch_k = fetch_k
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._seconds_per_pair = None  # running estimate used to predict the cost of a call
+
+        self.num_calls = 0
+        self.num_fallbacks = 0
+
+    def _cache_get(self, key):
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+
+    def _cache_put(self, key, score):
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def score(self, queries: List[str], texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Score every (query, text) pair. Returns a (len(queries), len(texts)) array,
+        or None if the latency budget ran out.
+        """
+        start = time.perf_counter()
+        scores = np.zeros((len(queries), len(texts)), dtype=np.float32)
+
+        missing = []
+        for qi, query in enumerate(queries):
+            for ti, text in enumerate(texts):
+                cached = self._cache_get((query, text))
+                if cached is None:
+                    missing.append((qi, ti))
+                else:
+                    scores[qi, ti] = cached
+
+        if self._seconds_per_pair is not None and len(missing) * self._seconds_per_pair > self.latency_budget:
+            return None
+
+        for b in range(0, len(missing), self.batch_size):
+            if time.perf_counter() - start > self.latency_budget:
+                return None
+
+            batch = missing[b:b + self.batch_size]
+            batch_start = time.perf_counter()
+            batch_scores = self.model.predict([(queries[qi], texts[ti]) for qi, ti in batch])
+            per_pair = (time.perf_counter() - batch_start) / len(batch)
+            if self._seconds_per_pair is None:
+                self._seconds_per_pair = per_pair
+            else:
+                self._seconds_per_pair = 0.8 * self._seconds_per_pair + 0.2 * per_pair
+
+            for (qi, ti), s in zip(batch, batch_scores):
+                scores[qi, ti] = float(s)
+                self._cache_put((queries[qi], texts[ti]), float(s))
+
+        return scores
+
+    def rerank(
+        self,
+        query: Union[str, List[str]],
+        items: List[Any],
+        k: Optional[int] = None,
+        text_fn: Callable[[Any], str] = item_text,
+    ) -> List[Any]:
+        """
+        Re-order items by cross-encoder score, best first.
+
+        Args:
+            query: One query, or several paraphrases (an item's score is its best over them)
+            items: Candidates in dense order
+            k: Number of items to return. All of them if None.
+            text_fn: Maps an item to the text that is scored
+
+        Returns:
+            The top-k items, or the first k in dense order if over the latency budget
+        """
+        if k is None:
+            k = len(items)
+        if len(items) == 0:
+            return []
+
+        self.num_calls += 1
+        queries = [query] if isinstance(query, str) else list(query)
+        scores = self.score(queries, [text_fn(item) for item in items])
+        if scores is None:
+            self.num_fallbacks += 1
+            return items[:k]
+
+        # stable sort keeps the dense order between ties
+        order = np.argsort(-scores.max(axis=0), kind='stable')
+        return [items[i] for i in order[:k]]
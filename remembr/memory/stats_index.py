@@ -0,0 +1,105 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.formatting import format_timestamps, format_positions
+
+
+class MemoryStatsIndex(MemoryIndex):
+    """
+    Running aggregate facts about the memories: time span, distance travelled,
+    bounding box, number of segments and the most visited places. Updated in
+    O(1) per insert.
+
+    Places here are grid cells of cell_size meters; a cell gets a new visit
+    when the robot comes back to it after visit_gap seconds. Unlike the
+    PlaceIndex this needs no embeddings, so the digest never triggers an
+    embedding backfill.
+    """
+
+    needs_embeddings = False
+
+    def __init__(self, cell_size: float = 5.0, visit_gap: float = 60.0):
+        self.cell_size = cell_size
+        self.visit_gap = visit_gap
+        self.reset()
+
+    def reset(self):
+        self.num_segments = 0
+        self.first_time = None
+        self.last_time = None
+        self.path_length = 0.0
+        self.bbox_min = None
+        self.bbox_max = None
+        self._last_position = None
+        # cell -> [number of visits, last time, position sum, number of memories, longest caption]
+        self._cells: Dict[Tuple[int, int], list] = {}
+        # rendered digest, cleared by every insert
+        self._digest = None
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        position = np.asarray(item.position, dtype=np.float64)
+
+        self.num_segments += 1
+        self.first_time = item.time if self.first_time is None else min(self.first_time, item.time)
+        self.last_time = item.time if self.last_time is None else max(self.last_time, item.time)
+
+        if self._last_position is not None:
+            self.path_length += float(np.linalg.norm(position - self._last_position))
+        self._last_position = position
+
+        if self.bbox_min is None:
+            self.bbox_min, self.bbox_max = position.copy(), position.copy()
+        else:
+            self.bbox_min = np.minimum(self.bbox_min, position)
+            self.bbox_max = np.maximum(self.bbox_max, position)
+
+        cell = (int(np.floor(position[0] / self.cell_size)), int(np.floor(position[1] / self.cell_size)))
+        stats = self._cells.get(cell)
+        if stats is None:
+            self._cells[cell] = [1, item.time, position.copy(), 1, item.caption]
+        else:
+            if abs(item.time - stats[1]) > self.visit_gap:
+                stats[0] += 1
+            stats[1] = item.time
+            stats[2] += position
+            stats[3] += 1
+            if len(item.caption) > len(stats[4]):
+                stats[4] = item.caption
+
+        self._digest = None
+
+    def top_places(self, num_places: int) -> List[Tuple[list, int, str]]:
+        """The most visited cells as (centroid, number of visits, caption)."""
+        cells = sorted(self._cells.values(), key=lambda stats: (-stats[0], -stats[3]))[:num_places]
+        return [((stats[2] / stats[3]).tolist(), stats[0], stats[4]) for stats in cells]
+
+    def digest(self, num_places: int = 3) -> str:
+        """
+        Short text digest of the statistics, rendered once per batch of inserts.
+
+        Args:
+            num_places: Number of most visited places to list
+        """
+        if self._digest is not None and self._digest[0] == num_places:
+            return self._digest[1]
+
+        if self.num_segments == 0:
+            return "The robot has no memories yet.\n"
+
+        first, last = format_timestamps([self.first_time, self.last_time])
+        bbox_min, bbox_max = format_positions([self.bbox_min, self.bbox_max])
+
+        out_string = f"The memories span from {first} to {last} ({(self.last_time - self.first_time) / 60:.2f} minutes).\n"
+        out_string += f"The robot travelled {self.path_length:.1f} meters in total over {self.num_segments} memory segments.\n"
+        out_string += f"All positions lie in the bounding box from {bbox_min} to {bbox_max}.\n"
+
+        top_places = self.top_places(num_places)
+        if top_places:
+            out_string += "The most visited places are:\n"
+            for (_, num_visits, caption), centroid in zip(top_places, format_positions([c for c, _, _ in top_places])):
+                out_string += f"- around {centroid}, visited {num_visits} times: {caption}\n"
+
+        self._digest = (num_places, out_string)
+        return out_string
@@ -7,7 +7,8 @@ from langchain_core.documents import Document
 import numpy as np
 
 
-from remembr.memory.memory import Memory, MemoryItem
+from remembr.memory.memory import Memory, MemoryIndex, MemoryItem
+from remembr.memory.formatting import items_to_string
 from remembr.captioners.captioner import Captioner
 
 from langchain_community.vectorstores import Milvus
@@ -20,12 +21,33 @@ class TextMemory(Memory):
 
     def __init__(self):
         self.memory = []
+        self.indexes = []
 
     def insert(self, item: MemoryItem, text_embedding=None):
         self.memory.append(item)
+        if isinstance(item, MemoryItem):
+            for index in self.indexes:
+                index.add(str(len(self.memory) - 1), item, text_embedding)
+
+    def add_index(self, index: MemoryIndex):
+        """Keep index up to date with this memory, including the memories already stored. Adding it again does nothing."""
+        if index in self.indexes:
+            return
+        self.indexes.append(index)
+        if index.needs_backfill:
+            for i, item in enumerate(self.memory):
+                if isinstance(item, MemoryItem):
+                    index.add(str(i), item)
+
+    def remove_index(self, index: MemoryIndex):
+        """Stop updating index."""
+        if index in self.indexes:
+            self.indexes.remove(index)
 
     def reset(self):
         self.memory = []
+        for index in self.indexes:
+            index.reset()
 
     def get_working_memory(self) -> list[MemoryItem]:
         if type(self.memory[0]) == str:
@@ -37,15 +59,8 @@ class TextMemory(Memory):
 
   
 
-    def memory_to_string(self, memory_item_list: list[MemoryItem]) -> str:
-        out_string = ""
-        for doc in memory_item_list:
-            t = doc.time
-            
-            t = localtime(t)
-            t = strftime('%Y-%m-%d %H:%M:%S', t)
-
-            s = f"At time={t}, the robot was at an average position of {np.array(doc.position).round(3).tolist()} with an average orientation of {doc.theta} radians. "
-            s += f"The robot saw the following: {doc.caption}\n\n"
-            out_string += s
-        return out_string
+    def memory_to_string(self, memory_item_list: list[MemoryItem], max_tokens: Optional[int] = None) -> str:
+        if isinstance(memory_item_list, str):
+            # optimal context is inserted as an already formatted string
+            return memory_item_list
+        return items_to_string(memory_item_list, max_tokens=max_tokens)
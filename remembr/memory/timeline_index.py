@@ -0,0 +1,247 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.formatting import format_timestamps, format_positions
+
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+LEVEL_NAMES = {60: "minute", 600: "10 minutes", 3600: "hour"}
+
+
+@dataclass
+class TimelineSummary:
+    level: int
+    start: float
+    end: float
+    text: str
+    embedding: Optional[np.ndarray]
+    centroid: list
+    num_memories: int
+    children: list = field(default_factory=list)    # finer summaries, empty at the finest level
+    memory_ids: list = field(default_factory=list)
+
+
+class _Bucket:
+    """An open time bucket at one level, collecting memories or finer summaries."""
+
+    def __init__(self, key: int):
+        self.key = key
+        self.texts = []
+        self.embeddings = []
+        self.times = []
+        self.positions = []
+        self.weights = []
+        self.children = []
+        self.memory_ids = []
+
+
+class TimelineIndex(MemoryIndex):
+    """
+    Rolling summaries of the timeline per minute, per 10 minutes and per hour.
+
+    Memories are bucketed by time as they arrive. When a bucket closes, its
+    summary becomes a member of the bucket one level up, so every level is
+    built incrementally from the one below. Each summary keeps its time span,
+    average position, a mean caption embedding and a short extractive text
+    (the sentences closest to that mean), or the output of summarizer if one
+    is given. Searches start at the hours and descend into the best children.
+    """
+
+    def __init__(self, levels: Sequence[int] = (60, 600, 3600), num_sentences: int = 3,
+                 summarizer: Optional[Callable[[List[str]], str]] = None):
+        """
+        Args:
+            levels: Bucket lengths in seconds, finest first
+            num_sentences: Sentences kept in an extractive summary
+            summarizer: Optional function (e.g. an LLM call) turning member texts into a
+                summary. It is only called when a bucket closes.
+        """
+        self.levels = sorted(levels)
+        self.num_sentences = num_sentences
+        self.summarizer = summarizer
+        self.reset()
+
+    def reset(self):
+        self.summaries: Dict[int, List[TimelineSummary]] = {level: [] for level in self.levels}
+        self._open: Dict[int, Optional[_Bucket]] = {level: None for level in self.levels}
+        self._materialized = None
+
+    ### Building
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        self._materialized = None
+
+        # close the buckets this memory no longer falls into, finest first, feeding each summary upwards
+        for i, level in enumerate(self.levels):
+            bucket = self._open[level]
+            if bucket is not None and bucket.key != int(item.time // level):
+                self._close(i)
+
+        bucket = self._open_bucket(self.levels[0], item.time)
+        embedding = None
+        if text_embedding is not None:
+            embedding = np.asarray(text_embedding, dtype=np.float32)
+            embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+        bucket.texts.append(item.caption)
+        bucket.embeddings.append(embedding)
+        bucket.times.append(item.time)
+        bucket.positions.append(list(item.position))
+        bucket.weights.append(1)
+        bucket.memory_ids.append(memory_id)
+
+    def _open_bucket(self, level: int, t: float) -> _Bucket:
+        if self._open[level] is None:
+            self._open[level] = _Bucket(int(t // level))
+        return self._open[level]
+
+    def _close(self, i: int):
+        level = self.levels[i]
+        summary = self._summarize(level, self._open[level], final=True)
+        self._open[level] = None
+        self.summaries[level].append(summary)
+        if i + 1 < len(self.levels):
+            self._add_child(self.levels[i + 1], summary)
+
+    def _add_child(self, level: int, summary: TimelineSummary):
+        bucket = self._open_bucket(level, summary.start)
+        bucket.texts.append(summary.text)
+        bucket.embeddings.append(summary.embedding)
+        bucket.times.extend([summary.start, summary.end])
+        bucket.positions.append(summary.centroid)
+        bucket.weights.append(summary.num_memories)
+        bucket.children.append(summary)
+
+    def _summarize(self, level: int, bucket: _Bucket, final: bool) -> TimelineSummary:
+        weights = np.asarray(bucket.weights, dtype=np.float64)
+        centroid = (np.asarray(bucket.positions, dtype=np.float64) * weights[:, None]).sum(axis=0) / weights.sum()
+
+        embedding = None
+        if all(e is not None for e in bucket.embeddings):
+            embeddings = np.stack(bucket.embeddings)
+            embedding = (embeddings * weights[:, None]).sum(axis=0)
+            embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+
+        if final and self.summarizer is not None:
+            text = self.summarizer(bucket.texts)
+        else:
+            text = self._extractive_summary(bucket.texts, bucket.embeddings, embedding)
+
+        return TimelineSummary(
+            level=level,
+            start=min(bucket.times),
+            end=max(bucket.times),
+            text=text,
+            embedding=embedding,
+            centroid=centroid.tolist(),
+            num_memories=int(weights.sum()),
+            children=list(bucket.children),
+            memory_ids=list(bucket.memory_ids),
+        )
+
+    def _extractive_summary(self, texts: List[str], embeddings: list, mean: Optional[np.ndarray]) -> str:
+        if mean is None:
+            order = np.argsort([-len(text) for text in texts], kind='stable')
+        else:
+            order = np.argsort(-(np.stack(embeddings) @ mean), kind='stable')
+
+        sentences = []
+        seen = set()
+        for i in order:
+            sentence = _SENTENCE_RE.split(texts[i].strip(), maxsplit=1)[0]
+            if sentence.lower() in seen:
+                continue
+            seen.add(sentence.lower())
+            sentences.append(sentence)
+            if len(sentences) == self.num_sentences:
+                break
+        return " ".join(sentences)
+
+    def timeline(self) -> Dict[int, List[TimelineSummary]]:
+        """Summaries per level, including the (partial) buckets that are still open."""
+        if self._materialized is not None:
+            return self._materialized
+
+        materialized = {level: list(self.summaries[level]) for level in self.levels}
+        pending = None
+        for level in self.levels:
+            bucket = self._open[level]
+            if bucket is None:
+                if pending is not None:
+                    bucket = _Bucket(int(pending.start // level))
+                else:
+                    continue
+            if pending is not None:
+                # the open child is summarized in a copy, so the bucket itself stays untouched
+                copy = _Bucket(bucket.key)
+                for name in ('texts', 'embeddings', 'times', 'positions', 'weights', 'children', 'memory_ids'):
+                    setattr(copy, name, list(getattr(bucket, name)))
+                bucket = copy
+                bucket.texts.append(pending.text)
+                bucket.embeddings.append(pending.embedding)
+                bucket.times.extend([pending.start, pending.end])
+                bucket.positions.append(pending.centroid)
+                bucket.weights.append(pending.num_memories)
+                bucket.children.append(pending)
+            pending = self._summarize(level, bucket, final=False)
+            materialized[level].append(pending)
+
+        self._materialized = materialized
+        return materialized
+
+    ### Queries
+
+    def search(self, query_embedding: Sequence[float], k: int = 2, min_level: Optional[int] = None) -> List[List[TimelineSummary]]:
+        """
+        Coarse-to-fine search: the best k summaries at the coarsest level, then the
+        best k among their children, and so on down to min_level.
+
+        Returns:
+            one list of summaries per level, coarsest first
+        """
+        timeline = self.timeline()
+        min_level = self.levels[0] if min_level is None else min_level
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        results = []
+        candidates = timeline[self.levels[-1]]
+        for level in reversed(self.levels):
+            candidates = [s for s in candidates if s.embedding is not None]
+            if not candidates or level < min_level:
+                break
+            sims = np.stack([s.embedding for s in candidates]) @ query
+            best = sorted((candidates[i] for i in np.argsort(-sims)[:k]), key=lambda s: s.start)
+            results.append(best)
+            candidates = [child for s in best for child in s.children]
+        return results
+
+    def summaries_between(self, start: float, end: float, max_summaries: int = 12) -> List[TimelineSummary]:
+        """Summaries overlapping [start, end] at the finest level that needs at most max_summaries."""
+        timeline = self.timeline()
+        selected = []
+        for level in self.levels:
+            selected = [s for s in timeline[level] if s.end >= start and s.start <= end]
+            if len(selected) <= max_summaries:
+                break
+        return selected[:max_summaries]
+
+    @staticmethod
+    def summaries_to_string(summaries: List[TimelineSummary]) -> str:
+        if not summaries:
+            return "No timeline summaries were found for this query."
+
+        starts = format_timestamps([s.start for s in summaries])
+        ends = format_timestamps([s.end for s in summaries])
+        centroids = format_positions([s.centroid for s in summaries])
+
+        out_string = ""
+        for summary, start, end, centroid in zip(summaries, starts, ends, centroids):
+            out_string += f"[{LEVEL_NAMES.get(summary.level, f'{summary.level} seconds')}] From {start} to {end}, "
+            out_string += f"the robot was around {centroid} on average ({summary.num_memories} memories). "
+            out_string += f"Summary: {summary.text}\n\n"
+        return out_string
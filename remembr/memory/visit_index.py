@@ -0,0 +1,158 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from remembr.memory.memory import MemoryIndex, MemoryItem
+from remembr.memory.formatting import format_timestamps, format_positions
+
+
+@dataclass
+class Visit:
+    start: float
+    end: float
+    centroid: list
+    caption: str
+    memory_ids: list = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class VisitIndex(MemoryIndex):
+    """
+    Segments the trajectory into visits: contiguous stays within a region.
+
+    Memories are consumed in time order. A memory extends the current visit if
+    it is within radius meters of the visit's centroid and no more than max_gap
+    seconds after it. With topic_threshold set, a memory whose caption embedding
+    is that similar to the visit's mean embedding also extends the visit, so a
+    walk down one long corridor stays one visit. Each visit records its start,
+    end, centroid and a representative caption (the one closest to the mean
+    embedding, or the longest one without embeddings). The longest caption is
+    kept incrementally; the embedding-based choice is made once per visit, when
+    it is closed or first read, not on every insert.
+    """
+
+    def __init__(self, radius: float = 3.0, max_gap: float = 30.0, topic_threshold: Optional[float] = None):
+        self.radius = radius
+        self.max_gap = max_gap
+        self.topic_threshold = topic_threshold
+        self.reset()
+
+    def reset(self):
+        self.visits = []
+        self._embedding_sums = []   # per visit, None without embeddings
+        self._current_embeddings = []
+        self._current_captions = []
+        # whether the caption of the open visit has to be chosen again before it is read
+        self._caption_stale = False
+
+    ### Building
+
+    def add(self, memory_id: str, item: MemoryItem, text_embedding: Optional[list] = None):
+        position = np.asarray(item.position, dtype=np.float64)
+        embedding = None
+        if text_embedding is not None:
+            embedding = np.asarray(text_embedding, dtype=np.float32)
+            embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+
+        if self.visits and self._continues(self.visits[-1], len(self.visits) - 1, item.time, position, embedding):
+            visit = self.visits[-1]
+            n = len(visit.memory_ids)
+            visit.centroid = ((np.asarray(visit.centroid) * n + position) / (n + 1)).tolist()
+            visit.start = min(visit.start, item.time)
+            visit.end = max(visit.end, item.time)
+            visit.memory_ids.append(memory_id)
+            if embedding is not None and self._embedding_sums[-1] is not None:
+                self._embedding_sums[-1] += embedding
+            if len(item.caption) > len(visit.caption):
+                visit.caption = item.caption
+        else:
+            self._close_visit()
+            self.visits.append(Visit(start=item.time, end=item.time, centroid=position.tolist(),
+                                     caption=item.caption, memory_ids=[memory_id]))
+            self._embedding_sums.append(None if embedding is None else embedding.copy())
+
+        self._current_captions.append(item.caption)
+        self._current_embeddings.append(embedding)
+        self._caption_stale = True
+
+    def _continues(self, visit: Visit, visit_idx: int, t: float, position: np.ndarray, embedding) -> bool:
+        if t - visit.end > self.max_gap:
+            return False
+        if np.linalg.norm(position - np.asarray(visit.centroid)) <= self.radius:
+            return True
+        if self.topic_threshold is not None and embedding is not None and self._embedding_sums[visit_idx] is not None:
+            mean = self._embedding_sums[visit_idx]
+            return float(embedding @ mean) / max(np.linalg.norm(mean), 1e-12) >= self.topic_threshold
+        return False
+
+    def _update_caption(self):
+        """Choose the caption of the open visit closest to its mean embedding (the longest one is already kept)."""
+        if not self._caption_stale or not self.visits:
+            return
+        mean = self._embedding_sums[-1]
+        if mean is not None and all(e is not None for e in self._current_embeddings):
+            sims = np.stack(self._current_embeddings) @ mean
+            self.visits[-1].caption = self._current_captions[int(np.argmax(sims))]
+        self._caption_stale = False
+
+    def _close_visit(self):
+        self._update_caption()
+        self._current_embeddings = []
+        self._current_captions = []
+
+    def build(self, ids: Sequence[str], items: Sequence[MemoryItem], embeddings: Optional[Sequence] = None):
+        """Build the index offline from a full history (sorted by time here)."""
+        self.reset()
+        order = np.argsort([item.time for item in items], kind='stable')
+        for i in order:
+            self.add(ids[i], items[i], None if embeddings is None else embeddings[i])
+
+    ### Queries
+
+    def visits_near(self, position: Sequence[float], radius: Optional[float] = None) -> List[Visit]:
+        """Visits whose centroid is within radius of position, in time order."""
+        if not self.visits:
+            return []
+        self._update_caption()
+        radius = self.radius if radius is None else radius
+        centroids = np.array([visit.centroid for visit in self.visits])
+        dist = np.linalg.norm(centroids - np.asarray(position, dtype=np.float64), axis=1)
+        return [self.visits[i] for i in np.nonzero(dist <= radius)[0]]
+
+    def visits_matching(self, query_embedding: Sequence[float], threshold: float = 0.6, k: int = 10) -> List[Visit]:
+        """Visits whose mean caption embedding is similar to the query, in time order."""
+        indices = [i for i, s in enumerate(self._embedding_sums) if s is not None]
+        if not indices:
+            return []
+        self._update_caption()
+        means = np.stack([self._embedding_sums[i] for i in indices])
+        means = means / np.maximum(np.linalg.norm(means, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        sims = means @ (query / max(np.linalg.norm(query), 1e-12))
+
+        best = np.argsort(-sims)[:k]
+        selected = sorted(indices[i] for i in best if sims[i] >= threshold)
+        return [self.visits[i] for i in selected]
+
+    @staticmethod
+    def visits_to_string(visits: List[Visit]) -> str:
+        if not visits:
+            return "No visits were found for this query."
+
+        starts = format_timestamps([visit.start for visit in visits])
+        ends = format_timestamps([visit.end for visit in visits])
+        centroids = format_positions([visit.centroid for visit in visits])
+
+        out_string = ""
+        for visit, start, end, centroid in zip(visits, starts, ends, centroids):
+            out_string += f"From {start} to {end} ({visit.duration / 60:.2f} minutes), the robot stayed around {centroid}. "
+            out_string += f"The robot saw the following: {visit.caption}\n\n"
+
+        total = sum(visit.duration for visit in visits)
+        out_string += f"In total, the robot spent {total / 60:.2f} minutes over {len(visits)} visits. "
+        out_string += f"It first entered at {starts[0]} and last entered at {starts[-1]}, leaving at {ends[-1]}.\n\n"
+        return out_string
@@ -27,6 +27,7 @@ sys.path.append(sys.path[0] + '/..')
 from agents.remembr_agent import ReMEmbRAgent
 from agents.non_agent import NonAgent
 from agents.vlm_non_agent import VLMNonAgent
+from agents.question_router import QuestionRouter
 
 from memory.memory import MemoryItem
 from memory.milvus_memory import MilvusMemory
@@ -34,6 +35,7 @@ from memory.text_memory import TextMemory
 from memory.video_memory import VideoMemory, ImageMemoryItem
 
 from tools.tools import format_docs
+from remembr.utils.tracing import tracer
 
 
 def parse_json(string):
@@ -123,6 +125,8 @@ def answer_squad_question(model, question, qa_instance):
             elapsed = end_time - start_time
 
             parsed = asdict(response)
+            # per-query statistics (llm_calls, iterations, latency), not part of the answer
+            stats = parsed.pop('stats', None) or {}
 
             out_error = evaluate_output(qa_instance, parsed)
             print("Time elapsed", elapsed)
@@ -137,6 +141,7 @@ def answer_squad_question(model, question, qa_instance):
         return_dict.update(parsed)
         return_dict['error'] = out_error
         return_dict['elapsed'] = elapsed
+        return_dict.update(stats)
 
         return return_dict
 
@@ -213,7 +218,8 @@ def load_memory(args, qa_instance, use_milvus=True, use_optimal_context=False, i
             entity = MemoryItem.from_dict(entity)
 
         if use_milvus:
-            memory.insert(entity, text_embedding=item['text_embedding'])
+            # object mentions are only in caption files preprocessed with the extraction stage
+            memory.insert(entity, text_embedding=item['text_embedding'], objects=item.get('objects'))
         else:
             memory.insert(entity)
 
@@ -229,9 +235,14 @@ def main(args):
 
     use_milvus = False
     use_optimal_context = False
+
+    if args.trace_file is not None:
+        tracer.enable()
     if 'remembr' in args.model:
         base_llm = args.model.split('+')[-1]
         agent = ReMEmbRAgent(llm_type=base_llm, num_ctx=args.num_ctx, temperature=args.temperature)
+        if args.fast_path:
+            agent.router = QuestionRouter(embedder=agent.embeddings)
         use_milvus = True
 
     elif 'optimal' in args.model:
@@ -241,6 +252,14 @@ def main(args):
     elif 'vlm' in args.model:
         agent = VLMNonAgent(llm_type='gpt-4o')
 
+    elif args.map_reduce:
+        # every chunk fits in a small context, so num_ctx does not grow with the history
+        agent = NonAgent(llm_type=args.model, num_ctx=args.chunk_tokens + 4096, temperature=args.temperature,
+                         mode='map_reduce', chunk_tokens=args.chunk_tokens, max_workers=args.map_workers)
+    elif args.context_tokens is not None:
+        # packed history only needs room for the budget plus the prompt and answer
+        agent = NonAgent(llm_type=args.model, num_ctx=args.context_tokens + 4096, temperature=args.temperature,
+                         context_tokens=args.context_tokens)
     else:
         agent = NonAgent(llm_type=args.model, num_ctx=args.num_ctx*4, temperature=args.temperature)
 
@@ -347,6 +366,13 @@ def main(args):
         # to_save = json.dumps(out_json, indent=4)
         json.dump(out_json, f, indent=4)
 
+    if args.trace_file is not None:
+        if args.trace_file.endswith('.otlp.json'):
+            tracer.export_otlp(args.trace_file)
+        else:
+            tracer.export_json(args.trace_file)
+        print("Wrote trace to", args.trace_file)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
                         prog='Long Horizon Robot QA',
@@ -363,6 +389,8 @@ if __name__ == "__main__":
     parser.add_argument("--out_dir", type=str, default="./out/")
 
     parser.add_argument("--postfix", type=str, default='_0')
+    parser.add_argument("--trace_file", type=str, default=None,
+                        help="Trace queries and write the spans here (OTLP/JSON if the name ends in .otlp.json)")
 
 
     # all model args
@@ -372,11 +400,16 @@ if __name__ == "__main__":
     # llm-specific args
     parser.add_argument("--temperature", type=float, default=0.7)
     parser.add_argument("--num_ctx", type=int, default=8192*8)
+    parser.add_argument("--context_tokens", type=int, default=None, help="Token budget for the packed caption history of non-agent baselines")
+    parser.add_argument("--map_reduce", action='store_true', help="Answer non-agent baselines chunk by chunk, then reduce")
+    parser.add_argument("--chunk_tokens", type=int, default=6000)
+    parser.add_argument("--map_workers", type=int, default=4)
 
     # remembr specific args
     parser.add_argument("--window_size", type=int, default=5)
     parser.add_argument("--db_name", type=str, default='test')
     parser.add_argument("--db_ip", type=str, default='127.0.0.1')
+    parser.add_argument("--fast_path", action='store_true', help="Answer single-hop questions with one retrieval and the generate step")
 
 
     args = parser.parse_args()
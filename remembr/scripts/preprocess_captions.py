@@ -12,6 +12,8 @@ import sys
 sys.path.append(sys.path[0] + '/..')
 from captioners.vila_captioner import VILACaptioner
 from utils.util import get_frames
+from utils.embedding_pipeline import EmbeddingStage
+from memory.object_extractor import extract_objects
 import pickle as pkl
 from PIL import Image as PILImage
 
@@ -68,6 +70,9 @@ def run_video_in_segs(args):
 
     outputs = []
 
+    # embeddings are computed on a separate worker while VILA keeps captioning
+    embedding_stage = EmbeddingStage(embedder, batch_size=args.embed_batch_size, queue_size=args.embed_queue_size)
+
     for i, file_names in tqdm.tqdm(enumerate(segments), total=len(segments)):
 
         images = []
@@ -105,34 +110,24 @@ def run_video_in_segs(args):
         filename_start = os.path.basename(file_names[0])
         filename_end = os.path.basename(file_names[1])
 
+        embedding_stage.submit(out_text)
 
-        text_embedding = embedder.embed_query(out_text)
-
-        
         entity = {
             'id': file_names[0],
             'position': position.mean(axis=0),
             'theta': 3.14, # TEMPORARY: We are not using rotation information yet, so just leaving a placeholder
             'time': timestamp.mean(),
             'caption': out_text,
+            'objects': extract_objects(out_text),
             'file_start': filename_start,
             'file_end': filename_end,
-            'text_embedding': text_embedding
         }
 
         outputs.append(entity)
 
-
-        entity = {
-            'id': file_names[0],
-            'position': position.mean(axis=0),
-            'theta': 3.14,
-            'time': timestamp.mean(),
-            'caption': out_text,
-            'text_embedding': text_embedding
-        }
-
-
+    # submission order matches the order of outputs
+    for entity, text_embedding in zip(outputs, embedding_stage.close()):
+        entity['text_embedding'] = text_embedding
 
     # now save the outputs into a json
     with open(os.path.join(captions_location, f'captions_{args.captioner_name}_{args.seconds_per_caption}_secs.json'), 'w') as f:
@@ -168,6 +163,8 @@ if __name__ == "__main__":
     parser.add_argument("--captioner_name", type=str, default="Llama-3-VILA1.5-8b")
 
     parser.add_argument("--seconds_per_caption", type=int, default=3)
+    parser.add_argument("--embed_batch_size", type=int, default=16)
+    parser.add_argument("--embed_queue_size", type=int, default=256)
 
     parser.add_argument("--video-file", type=str, default=None)
     parser.add_argument("--num-video-frames", type=int, default=6)
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# load this directory
+sys.path.append(sys.path[0] + '/..')
+from utils.embedding_pipeline import embed_texts_parallel, DEFAULT_EMBEDDING_MODEL
+
+
+def reembed_captions(args):
+
+    with open(args.in_file, 'r') as f:
+        outputs = json.load(f)
+
+    captions = [entity['caption'] for entity in outputs]
+
+    start_time = time.time()
+    embeddings = embed_texts_parallel(
+        captions,
+        model_name=args.model_name,
+        num_workers=args.num_workers,
+        device=args.device,
+        chunk_size=args.chunk_size,
+    )
+    print(f"Embedded {len(captions)} captions in {time.time() - start_time:.1f}s")
+
+    for entity, text_embedding in zip(outputs, embeddings):
+        entity['text_embedding'] = text_embedding
+
+    out_file = args.out_file if args.out_file is not None else args.in_file
+    os.makedirs(os.path.dirname(os.path.abspath(out_file)), exist_ok=True)
+    with open(out_file, 'w') as f:
+        json.dump(outputs, f)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Re-embeds an existing caption file with a (new) embedding model on a process pool')
+    parser.add_argument("--in_file", type=str, required=True)
+    parser.add_argument("--out_file", type=str, default=None, help="Defaults to overwriting in_file")
+    parser.add_argument("--model_name", type=str, default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Worker processes, each loads a copy of the model. Defaults to min(4, number of cores)")
+    parser.add_argument("--device", type=str, default='cpu', help="Device the workers load the model on")
+    parser.add_argument("--chunk_size", type=int, default=32)
+    args = parser.parse_args()
+
+    reembed_captions(args)
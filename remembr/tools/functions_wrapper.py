@@ -1,4 +1,5 @@
 import json
+import time
 import uuid
 from operator import itemgetter
 from typing import (
@@ -9,6 +10,7 @@ from typing import (
     Literal,
     Optional,
     Sequence,
+    Tuple,
     Type,
     TypedDict,
     TypeVar,
@@ -36,6 +38,11 @@ import langchain_openai
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models import BaseLanguageModel
 
+from remembr.utils.tracing import token_usage, tracer
+from remembr.utils.partial_json import parse_complete_json
+from remembr.utils.llm_calls import count_llm_call
+from remembr.utils.streaming import TokenQueueHandler
+
 
 
 DEFAULT_SYSTEM_TEMPLATE = """You have access to the following tools:
@@ -124,6 +131,13 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
 
     tool_system_prompt_template: str = DEFAULT_SYSTEM_TEMPLATE
     use_gpt: bool = False
+    # stream the underlying LLM and report each token to the callbacks (on_llm_new_token),
+    # when a TokenQueueHandler (i.e. stream_query) is listening
+    stream_tokens: bool = True
+    # tool list with the default response function and its system message, per set of bound tools
+    tool_prompt_cache: Dict[Tuple[str, ...], Tuple[List[Dict], BaseMessage]] = {}
+    # constrain the output to the tool call JSON schema on backends that support it (NIM guided_json)
+    constrained_decoding: bool = True
     llm: Any = None
 
     def __init__(self, llm) -> None:
@@ -314,35 +328,45 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
                     "matching function in `functions`."
                 )
             del kwargs["function_call"]
-        if len(functions) > 0 and _is_pydantic_class(functions[0]):
-            functions = [convert_to_ollama_tool(fn) for fn in functions]
-        functions.insert(0, DEFAULT_RESPONSE_FUNCTION)
-        system_message_prompt_template = SystemMessagePromptTemplate.from_template(
-            self.tool_system_prompt_template
-        )
-        system_message = system_message_prompt_template.format(
-            tools=json.dumps(functions, indent=2)
-        )
+        functions, system_message = self._tool_prompt(functions)
+        llm_kwargs = self._decoding_kwargs(functions)
+
+        with tracer.span("llm", model=str(getattr(self.llm, 'model', None) or getattr(self.llm, 'model_name', '')),
+                         num_messages=len(messages) + 1) as span:
+            start = time.perf_counter()
+            if self.stream_tokens and run_manager is not None and \
+                    any(isinstance(handler, TokenQueueHandler) for handler in run_manager.handlers):
+                chat_generation_content = ""
+                response_message = None
+                for chunk in self.llm.stream([system_message] + messages, **llm_kwargs):
+                    if response_message is None:
+                        span.set(ttft_ms=(time.perf_counter() - start) * 1000)
+                    # the last chunk carries the token counts
+                    response_message = chunk
+                    chat_generation_content += chunk.content
+                    run_manager.on_llm_new_token(chunk.content)
+            else:
+                response_message = self.llm.invoke([system_message] + messages, **llm_kwargs)
+                chat_generation_content = response_message.content
+            if tracer.enabled:
+                span.set(response_chars=len(chat_generation_content), **token_usage(response_message))
+        count_llm_call()
 
-        response_message = self.llm.invoke([system_message] + messages)
-        chat_generation_content = response_message.content
+        try:
+            return self._parse_tool_calls(chat_generation_content, functions)
+        except ValueError:
+            # the caller has to repeat the whole call
+            count_llm_call(wasted=True)
+            raise
 
+    def _parse_tool_calls(self, chat_generation_content: Any, functions: List[Dict]) -> ChatResult:
         if not isinstance(chat_generation_content, str):
             raise ValueError("OllamaFunctions does not support non-string output.")
-        
 
-        # if it contains ```json, let's parse that out. NOTE THIS IS HACKY
-        # This only executes for the Command-R model
-        try:
-            if "```json" in chat_generation_content:
-                parser = JsonOutputParser()
-                parsed_chat_result = parser.invoke(chat_generation_content)
-                # chat_generation_content = chat_generation_content.replace("\'", "\"")
-            else:
-                parsed_chat_result = json.loads(chat_generation_content)
-
-        except json.JSONDecodeError:
-            # import pdb; pdb.set_trace()
+        # one parser for every backend: code fences (Command-R) and surrounding text are
+        # stripped, Python literals are accepted, truncated output is rejected and retried
+        parsed_chat_result = parse_complete_json(chat_generation_content)
+        if parsed_chat_result is None:
             raise ValueError(
                 f"""Model did not respond with valid JSON. 
                 Please try again. 
@@ -358,6 +382,11 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
         tool_calls = []
 
         for tool in parsed_chat_result:
+            if not isinstance(tool, dict) or "tool" not in tool:
+                raise ValueError(
+                    f"Failed to parse a function call from output: "
+                    f"{chat_generation_content}"
+                )
             called_tool_name = tool["tool"]
             called_tool = next(
                 (fn for fn in functions if fn["name"] == called_tool_name), None
@@ -388,8 +417,6 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
                 elif "response" in tool:
                     response = tool["response"]
                 else:
-                    # print("*"*10, "No tool being used. Assuming this is a conversation response without a tool wrap", "*"*10)
-                    import pdb; pdb.set_trace()
                     raise ValueError(
                         f"Failed to parse a response from output: "
                         f"{chat_generation_content}"
@@ -398,13 +425,14 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
                     generations=[
                         ChatGeneration(
                             message=AIMessage(
-                                content=str(response),
+                                # keep structured responses as JSON, not as a Python repr
+                                content=response if isinstance(response, str) else json.dumps(response),
                             )
                         )
                     ]
                 )
 
-            called_tool_arguments = tool["tool_input"]
+            called_tool_arguments = tool.get("tool_input")
 
             tool_call = ToolCall(
                 name=called_tool_name,
@@ -424,6 +452,55 @@ class FunctionsWrapper(BaseChatModel, BaseLanguageModel):
             generations=[ChatGeneration(message=response_message_with_functions)]
         )
 
+    def _decoding_kwargs(self, functions: List[Dict]) -> Dict[str, Any]:
+        """
+        Backend arguments that constrain the output to a call of one of the functions.
+
+        NIM endpoints take a JSON schema (guided_json): a list of one or more tool
+        calls, or a single call when the only function is the default response
+        (the generate step). Ollama models are already created with format="json",
+        which keeps the output valid JSON; other backends get no constraint.
+        """
+        if not self.constrained_decoding or type(self.llm).__name__ != "ChatNVIDIA":
+            return {}
+        call = {
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "enum": [fn["name"] for fn in functions]},
+                "tool_input": {"type": "object"},
+            },
+            "required": ["tool", "tool_input"],
+        }
+        if all(fn["name"] == DEFAULT_RESPONSE_FUNCTION["name"] for fn in functions):
+            schema = call
+        else:
+            schema = {"type": "array", "items": call, "minItems": 1}
+        return {"nvext": {"guided_json": schema}}
+
+    def _tool_prompt(self, functions: List) -> Tuple[List[Dict], BaseMessage]:
+        """
+        The functions (with the default response function first) and the system
+        message listing them. Both are built once per set of tools and reused, so
+        the system message is byte-identical on every call.
+        """
+        key = tuple(fn.__name__ if _is_pydantic_class(fn) else fn["name"] for fn in functions)
+        cached = self.tool_prompt_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if len(functions) > 0 and _is_pydantic_class(functions[0]):
+            functions = [convert_to_ollama_tool(fn) for fn in functions]
+        # a new list, the bound list must not grow on every call
+        functions = [DEFAULT_RESPONSE_FUNCTION] + list(functions)
+        system_message_prompt_template = SystemMessagePromptTemplate.from_template(
+            self.tool_system_prompt_template
+        )
+        system_message = system_message_prompt_template.format(
+            tools=json.dumps(functions, indent=2)
+        )
+        self.tool_prompt_cache[key] = (functions, system_message)
+        return functions, system_message
+
     @property
     def _llm_type(self) -> str:
         return "ollama_functions"
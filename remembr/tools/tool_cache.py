@@ -0,0 +1,86 @@
+import ast
+import datetime
+import re
+import threading
+from typing import Any, Callable, Hashable
+
+from remembr.memory.memory import parse_position
+
+
+REPEAT_TEMPLATE = "This is a repeat of an earlier {tool} call with the same arguments ({args}). " \
+                  "Its results were already provided above, so use them or search for something different."
+
+
+def _normalize_position(x: Any, decimals: int) -> Hashable:
+    if isinstance(x, str):
+        try:
+            x = ast.literal_eval(x.strip())
+        except (ValueError, SyntaxError):
+            return x.strip().lower()
+    try:
+        return tuple(round(float(v), decimals) for v in x)
+    except (TypeError, ValueError):
+        return str(x)
+
+
+def _normalize_time(x: Any) -> Hashable:
+    x = str(x).strip()
+    # the LLM sometimes sends a full date as well, only the H:M:S part is searched
+    for template in ("%m/%d/%Y %H:%M:%S", "%H:%M:%S", "%H:%M"):
+        try:
+            return datetime.datetime.strptime(x, template).strftime("%H:%M:%S")
+        except ValueError:
+            continue
+    return x.lower()
+
+
+def _normalize_text(x: Any) -> Hashable:
+    if isinstance(x, (list, tuple)):
+        # results are merged by id, so the order of the queries does not matter
+        return tuple(sorted({_normalize_text(q) for q in x}))
+    return re.sub(r"\s+", " ", str(x).strip().lower())
+
+
+def normalize_tool_args(tool_name: str, x: Any, position_decimals: int = 1) -> Hashable:
+    """Canonical, hashable form of a retrieval tool argument."""
+    if 'position' in tool_name or parse_position(x) is not None:
+        return _normalize_position(x, position_decimals)
+    if 'time' in tool_name:
+        return _normalize_time(x)
+    return _normalize_text(x)
+
+
+class ToolCallCache:
+    """
+    Caches retrieval tool results for one query session.
+
+    Calls are keyed on the tool name plus normalized arguments (rounded
+    positions, canonical H:M:S times, lower-cased text). A repeated call is
+    answered with a short note instead of the same documents, so neither the
+    database nor the prompt pays for it twice. Safe to call from the
+    parallel tool executor's threads.
+    """
+
+    def __init__(self, position_decimals: int = 1):
+        self.position_decimals = position_decimals
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.results = {}
+            self.num_hits = 0
+            self.num_misses = 0
+
+    def call(self, tool_name: str, x: Any, func: Callable[[Any], str]) -> str:
+        key = (tool_name, normalize_tool_args(tool_name, x, self.position_decimals))
+        with self._lock:
+            if key in self.results:
+                self.num_hits += 1
+                return REPEAT_TEMPLATE.format(tool=tool_name, args=x)
+            self.num_misses += 1
+
+        result = func(x)
+        with self._lock:
+            self.results[key] = result
+        return result
@@ -0,0 +1,127 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from remembr.utils.deadline import deadline
+from remembr.utils.tracing import tracer
+
+
+TIMEOUT_TEMPLATE = "The {tool} call with arguments {args} did not finish within {timeout:.0f} seconds, so no results are available. " \
+                   "Try a different or more specific query."
+ERROR_TEMPLATE = "Error: the {tool} call with arguments {args} failed: {error}. Please fix your mistakes."
+
+
+class ParallelToolExecutor:
+    """
+    Runs all tool calls of one agent step concurrently.
+
+    A drop-in replacement for langgraph's ToolNode: invoke(state) takes the
+    tool calls of the last AIMessage and returns one ToolMessage per call, in
+    the order of the calls. Calls run on a bounded thread pool, so a step that
+    asks for text, position and time lookups costs about one retrieval of
+    latency instead of three. A call that runs longer than timeout seconds, or
+    waits that long for a free worker, is answered with a note instead of
+    blocking the step. The time limit is also passed down to the Milvus
+    searches of the call (see remembr.utils.deadline), so they give up their
+    worker; should max_workers calls still hang, the pool is replaced so they
+    cannot starve later calls.
+    """
+
+    def __init__(self, tools: list, max_workers: int = 4, timeout: Optional[float] = 30.0):
+        """
+        Args:
+            tools: The langchain tools that can be called
+            max_workers: Maximum number of tool calls running at the same time
+            timeout: Time limit per call in seconds, counted from when the call starts running, None to wait indefinitely
+        """
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        # calls of the current pool still running past their time limit
+        self._pool_lock = threading.Lock()
+        self._num_hung = 0
+
+    def call(self, tool_call: dict) -> str:
+        """Run one tool call in the calling thread. Errors are raised, not turned into messages."""
+        tool = self.tools_by_name.get(tool_call['name'])
+        if tool is None:
+            raise ValueError(f"{tool_call['name']} is not a valid tool, try one of {list(self.tools_by_name)}")
+        with tracer.span("tool." + tool_call['name'], args=str(tool_call['args'])) as span:
+            content = str(tool.invoke(tool_call['args']))
+            span.set(result_chars=len(content))
+            return content
+
+    def _timed_call(self, start_times: list, i: int, tool_call: dict) -> str:
+        start_times[i] = time.monotonic()
+        with deadline(self.timeout):
+            return self.call(tool_call)
+
+    def _hung(self, pool: ThreadPoolExecutor, future):
+        """Count a call that is still running past its time limit, replace the pool once all its workers are."""
+        with self._pool_lock:
+            if pool is not self.pool:
+                return
+            self._num_hung += 1
+            if self._num_hung >= self.max_workers:
+                print(f"[WARNING] {self._num_hung} tool calls are hung, replacing the tool thread pool")
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+                self._num_hung = 0
+                pool.shutdown(wait=False)
+                return
+        future.add_done_callback(lambda _: self._unhung(pool))
+
+    def _unhung(self, pool: ThreadPoolExecutor):
+        with self._pool_lock:
+            if pool is self.pool:
+                self._num_hung -= 1
+
+    def _result(self, future, start_times: list, i: int, submitted: float) -> str:
+        """Wait for call i until timeout seconds after it started (or was submitted, while it is queued)."""
+        if self.timeout is None:
+            return future.result()
+        while True:
+            started = start_times[i]
+            deadline = (submitted if started is None else started) + self.timeout
+            try:
+                return future.result(timeout=max(deadline - time.monotonic(), 0.0))
+            except FutureTimeoutError:
+                # it left the queue while we waited, so it gets its full time limit from there
+                if started is None and start_times[i] is not None:
+                    continue
+                raise
+
+    def run(self, tool_calls: List[dict]) -> List[ToolMessage]:
+        submitted = time.monotonic()
+        start_times = [None] * len(tool_calls)
+        pool = self.pool
+        # each call runs in a copy of the caller's context, so its spans nest under the action node
+        futures = [pool.submit(contextvars.copy_context().run, self._timed_call, start_times, i, tool_call)
+                   for i, tool_call in enumerate(tool_calls)]
+
+        messages = []
+        for i, (tool_call, future) in enumerate(zip(tool_calls, futures)):
+            try:
+                content = self._result(future, start_times, i, submitted)
+            except FutureTimeoutError:
+                if not future.cancel():
+                    self._hung(pool, future)
+                content = TIMEOUT_TEMPLATE.format(tool=tool_call['name'], args=tool_call['args'], timeout=self.timeout)
+            except Exception as e:
+                content = ERROR_TEMPLATE.format(tool=tool_call['name'], args=tool_call['args'], error=repr(e))
+            messages.append(ToolMessage(content=content, name=tool_call['name'], tool_call_id=tool_call['id']))
+        return messages
+
+    def invoke(self, state: dict) -> dict:
+        message = state["messages"][-1]
+        if not isinstance(message, AIMessage):
+            raise ValueError("The last message must be an AIMessage with tool calls")
+        return {"messages": self.run(message.tool_calls)}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
@@ -8,40 +8,14 @@ import time, datetime
 from typing import Any, Iterable, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
+from remembr.memory.formatting import documents_to_string, dicts_to_string
+
 ### Doc formatting for the last LLM
-def format_document(docs, ref_time=None):
-    out_string = ""
-    for doc in docs:
-        if len(doc.metadata['time']) == 2:
-            t = doc.metadata['time'][0]
-        else:
-            t = doc.metadata['time']
-        
-        if ref_time:
-            t += ref_time
-        t = localtime(t)
-        t = strftime('%Y-%m-%d %H:%M:%S', t)
-
-        s = f"At time={t}, the robot was at an average position of {np.array(doc.metadata['position']).round(3).tolist()}. "
-        s += f"The robot saw the following: {doc.page_content}\n\n"
-        out_string += s
-    return out_string
-
-def format_docs(docs):
-    out_string = ""
-    for doc in docs:
-        if len(doc['time']) == 2:
-            t = doc['time'][0]
-        else:
-            t = doc['time']
-
-        t = localtime(t)
-        t = strftime('%Y-%m-%d %H:%M:%S', t)
-
-        s = f"At time={t}, the robot was at an average position of {np.array(doc['position']).round(3).tolist()}. "
-        s += f"The robot saw the following: {doc['caption']}\n\n"
-        out_string += s
-    return out_string
+def format_document(docs, ref_time=None, max_tokens=None):
+    return documents_to_string(docs, ref_time=ref_time, max_tokens=max_tokens)
+
+def format_docs(docs, max_tokens=None):
+    return dicts_to_string(docs, max_tokens=max_tokens)
 
 
 
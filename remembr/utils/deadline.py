@@ -0,0 +1,34 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+# monotonic time by which the work running in the current context has to finish
+_deadline = contextvars.ContextVar("remembr_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Give the work in this block (and the threads that copy its context) a time limit.
+
+    Blocking calls that support a timeout, such as Milvus searches, read it
+    with remaining_time() so they give up instead of holding their thread.
+    """
+    if seconds is None:
+        yield
+        return
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left until the deadline of the current context, None without one."""
+    end = _deadline.get()
+    if end is None:
+        return None
+    return max(end - time.monotonic(), 0.001)
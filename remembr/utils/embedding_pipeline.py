@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+
+DEFAULT_EMBEDDING_MODEL = 'mixedbread-ai/mxbai-embed-large-v1'
+
+# every worker process loads its own model copy (~1.3 GB for mxbai-embed-large)
+MAX_DEFAULT_WORKERS = 4
+
+_STOP = object()
+
+
+class EmbeddingStage:
+    """
+    Embeds captions on a background worker so the captioner never waits on it.
+
+    Captions are handed over with submit() through a bounded queue. The worker
+    drains whatever is pending (up to batch_size) into one embed_documents call.
+    close() waits for the queue to drain and returns embeddings in submission order.
+    """
+
+    def __init__(self, embedder, batch_size: int = 16, queue_size: int = 256):
+        """
+        Args:
+            embedder: Any langchain Embeddings
+            batch_size: Maximum number of captions embedded in one call
+            queue_size: Maximum number of captions waiting to be embedded. submit()
+                only blocks once the embedder has fallen this far behind.
+        """
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._results = {}
+        self._error = None
+        self._num_submitted = 0
+
+        self._worker = threading.Thread(target=self._run, name='EmbeddingStage', daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> int:
+        """Queue a caption for embedding and return its index in the output."""
+        index = self._num_submitted
+        self._queue.put((index, text))
+        self._num_submitted += 1
+        return index
+
+    def close(self) -> List[List[float]]:
+        """Wait for all submitted captions and return their embeddings in order."""
+        self._queue.put(_STOP)
+        self._worker.join()
+        if self._error is not None:
+            raise self._error
+        return [self._results[i] for i in range(self._num_submitted)]
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            # take everything that is already waiting, without blocking for more
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if _STOP in batch:
+                batch.remove(_STOP)
+                stop = True
+            if not batch or self._error is not None:
+                continue
+
+            indices = [i for i, _ in batch]
+            texts = [text for _, text in batch]
+            try:
+                embeddings = self.embedder.embed_documents(texts)
+            except Exception as e:
+                self._error = e
+                continue
+            for i, embedding in zip(indices, embeddings):
+                self._results[i] = embedding
+
+
+### Process pool re-embedding
+
+_worker_embedder = None
+
+def _init_worker(model_name: str, threads_per_worker: int, device: str):
+    global _worker_embedder
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    # split the cores between the processes, so they do not oversubscribe them
+    torch.set_num_threads(threads_per_worker)
+    _worker_embedder = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device})
+
+def _embed_chunk(texts: List[str]) -> List[List[float]]:
+    return _worker_embedder.embed_documents(texts)
+
+
+def embed_texts_parallel(
+    texts: List[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    num_workers: Optional[int] = None,
+    chunk_size: int = 32,
+    device: str = 'cpu',
+) -> List[List[float]]:
+    """
+    Embed texts on a process pool, one model copy per process.
+
+    Args:
+        texts: Texts to embed
+        model_name: HuggingFace embedding model to load in every worker
+        num_workers: Number of processes. Defaults to min(MAX_DEFAULT_WORKERS, number of cores),
+            since every process holds a copy of the model.
+        chunk_size: Number of texts sent to a worker at a time
+        device: Device every worker loads its model on
+
+    Returns:
+        Embeddings in the same order as texts
+    """
+    num_cores = os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = min(MAX_DEFAULT_WORKERS, num_cores)
+    num_workers = max(1, min(num_workers, len(texts)))
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    embeddings = []
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(model_name, max(1, num_cores // num_workers), device),
+    ) as pool:
+        # map preserves chunk order
+        for chunk_embeddings in pool.map(_embed_chunk, chunks):
+            embeddings.extend(chunk_embeddings)
+    return embeddings
@@ -0,0 +1,78 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Tuple
+
+
+class LLMCallStats:
+    """Number of LLM calls, and of those whose output could not be used and had to be repeated."""
+
+    def __init__(self):
+        self.calls = 0
+        self.wasted = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls: int = 0, wasted: int = 0):
+        with self._lock:
+            self.calls += calls
+            self.wasted += wasted
+
+    def as_dict(self) -> dict:
+        return {'llm_calls': self.calls, 'wasted_llm_calls': self.wasted}
+
+
+# process-wide totals
+totals = LLMCallStats()
+
+# stats of the query running in the current context
+_query_stats = contextvars.ContextVar("remembr_llm_call_stats", default=None)
+
+
+@contextmanager
+def track_llm_calls():
+    """
+    Count the LLM calls made in the current context (and the threads that copy it).
+
+    Returns:
+        the LLMCallStats of the block
+    """
+    stats = LLMCallStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def count_llm_call(wasted: bool = False):
+    """Record an LLM call, or (wasted=True) that the output of the last one was unusable."""
+    calls, wasted = (0, 1) if wasted else (1, 0)
+    totals.add(calls, wasted)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.add(calls, wasted)
+
+
+def invoke_until_parsed(invoke: Callable[[], str], parse: Callable[[str], Optional[Any]],
+                        max_attempts: int = 3) -> Tuple[Optional[Any], str]:
+    """
+    Call the LLM until its output parses, at most max_attempts times.
+
+    Args:
+        invoke: Makes one LLM call and returns the output text
+        parse: Returns the parsed output, or None if it is unusable
+        max_attempts: Retry budget, including the first call
+
+    Returns:
+        (parsed output or None if every attempt failed, last output text)
+    """
+    output = ""
+    for attempt in range(max_attempts):
+        output = invoke()
+        count_llm_call()
+        parsed = parse(output)
+        if parsed is not None:
+            return parsed, output
+        count_llm_call(wasted=True)
+        print(f"Could not parse the LLM output (attempt {attempt + 1}/{max_attempts}): {output[:200]}")
+    return None, output
@@ -0,0 +1,231 @@
+import ast
+import json
+import re
+from typing import Any, Optional
+
+
+_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+ANSWER_KEYS = ["type", "text", "binary", "position", "orientation", "time", "duration"]
+# an answer without these is incomplete and asked for again
+REQUIRED_ANSWER_KEYS = ["time", "text", "binary", "position"]
+
+
+def _close_json(text: str) -> str:
+    """Close any string, object and list left open at the end of text."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+
+    if in_string:
+        if escaped:
+            # drop an unfinished escape sequence
+            text = text[:-1]
+        text += '"'
+    return text + ''.join(reversed(stack))
+
+
+def parse_partial_json(text: str, max_trim: int = 32) -> Optional[Any]:
+    """
+    Parse possibly incomplete JSON, e.g. an LLM response that is still streaming.
+    Only for showing partial results, complete outputs go through parse_complete_json.
+
+    Code fences and text before the first '{' or '[' are skipped, open strings
+    and brackets are closed, and a dangling key, ':' or ',' at the end is
+    trimmed off until the rest parses. Python literals (None, single quotes)
+    are accepted as a last resort. Returns None if nothing could be parsed yet.
+    """
+    text = _FENCE_RE.sub("", text)
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return None
+    text = text[min(starts):].rstrip()
+
+    for trim in range(min(max_trim, len(text)) + 1):
+        candidate = _close_json(text[:len(text) - trim].rstrip().rstrip(',:'))
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+        if trim == 0:
+            try:
+                return ast.literal_eval(candidate)
+            except (ValueError, SyntaxError):
+                pass
+    return None
+
+
+def parse_complete_json(text: str) -> Optional[Any]:
+    """
+    Parse a complete LLM output: code fences and text around the outermost
+    object or list are stripped, then it must be valid JSON or, as a fallback,
+    a Python literal. Truncated output is not repaired, so it can be retried.
+    Returns None if it does not parse.
+    """
+    text = _FENCE_RE.sub("", text).strip()
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind('}' if text[start] == '{' else ']')
+    if end < start:
+        return None
+    text = text[start:end + 1]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def unwrap_response(parsed: Any) -> Any:
+    """Unwrap {"tool": "__conversational_response", "tool_input": {"response": ...}} to the response."""
+    while isinstance(parsed, dict):
+        if isinstance(parsed.get("tool_input"), dict) and "response" in parsed["tool_input"]:
+            parsed = parsed["tool_input"]["response"]
+        elif parsed.get("tool") == "__conversational_response" and "response" in parsed:
+            parsed = parsed["response"]
+        else:
+            break
+    return parsed
+
+
+# characters after which a streamed value may have changed in a way worth showing
+_DELIMITER_RE = re.compile(r'[",}\]\n]')
+
+
+class StreamingAnswerParser:
+    """
+    Incrementally parses the answer fields of a streamed generate response.
+
+    feed() takes the next chunk of text and returns the answer fields whose
+    value changed, so callers can show a growing 'text' answer as it arrives.
+    The string/bracket state needed to close the partial JSON is updated with
+    each chunk only, and the buffer is only parsed again after a delimiter
+    (quote, comma, closing bracket, newline) or min_parse_chars new characters.
+    """
+
+    def __init__(self, keys=ANSWER_KEYS, min_parse_chars: int = 64):
+        self.keys = keys
+        self.min_parse_chars = min_parse_chars
+        self.buffer = ""
+        self.fields = {}
+        self._unparsed = 0
+        # scanner state: start and end of the top-level JSON value, open brackets, open string
+        self._start = None
+        self._end = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def _scan(self, offset: int):
+        for i in range(offset, len(self.buffer)):
+            if self._end is not None:
+                return
+            char = self.buffer[i]
+            if self._start is None:
+                if char in '{[':
+                    self._start = i
+                    self._stack.append('}' if char == '{' else ']')
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append('}' if char == '{' else ']')
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if not self._stack:
+                    self._end = i + 1
+
+    def _parse(self) -> Optional[Any]:
+        if self._start is None:
+            return None
+        if self._end is not None:
+            return parse_partial_json(self.buffer[self._start:self._end])
+
+        text = self.buffer[self._start:]
+        if self._in_string:
+            candidate = (text[:-1] if self._escaped else text) + '"'
+        else:
+            candidate = text.rstrip().rstrip(',:')
+        try:
+            return json.loads(candidate + ''.join(reversed(self._stack)))
+        except json.JSONDecodeError:
+            # e.g. a dangling key, the full parser trims it off
+            return parse_partial_json(text)
+
+    def feed(self, chunk: str) -> dict:
+        offset = len(self.buffer)
+        self.buffer += chunk
+        self._scan(offset)
+
+        self._unparsed += len(chunk)
+        if self._unparsed < self.min_parse_chars and not _DELIMITER_RE.search(chunk):
+            return {}
+        self._unparsed = 0
+
+        parsed = unwrap_response(self._parse())
+        if not isinstance(parsed, dict):
+            return {}
+
+        changed = {}
+        for key in self.keys:
+            if key in parsed and parsed[key] != self.fields.get(key):
+                changed[key] = parsed[key]
+        self.fields.update(changed)
+        return changed
+
+
+def parse_answer(text: str, keys=ANSWER_KEYS, required=REQUIRED_ANSWER_KEYS) -> Optional[dict]:
+    """
+    Parse a complete answer response (see parse_complete_json), unwrapped from a
+    __conversational_response call. The other answer fields are filled with None.
+
+    Args:
+        text: The LLM output
+        keys: The answer fields
+        required: Fields the answer must have; without them it is rejected so the caller can retry
+
+    Returns:
+        the answer dict, or None if the text holds no complete answer object
+    """
+    parsed = unwrap_response(parse_complete_json(text))
+    if not isinstance(parsed, dict) or not any(key in parsed for key in keys):
+        return None
+    if any(key not in parsed for key in required):
+        return None
+    for key in keys:
+        parsed.setdefault(key, None)
+    return parsed
+
+
+def text_answer(text: str, keys=ANSWER_KEYS) -> dict:
+    """An answer dict holding only text, for responses that are not JSON at all."""
+    answer = {key: None for key in keys}
+    answer['type'] = 'text'
+    answer['text'] = text
+    return answer
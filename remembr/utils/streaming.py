@@ -0,0 +1,52 @@
+import queue
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+@dataclass
+class StreamEvent:
+    """
+    One event of a streamed agent query.
+
+    type is one of:
+        llm_start    an LLM call started in node (a retried node starts again)
+        token        a token generated by the LLM in node ('agent' or 'generate')
+        tool_start   a tool call decided by the agent (or the 'router'), content is {'name', 'args'}
+        tool_result  the output of a tool call, content is {'name', 'content'}
+        answer_delta answer fields that changed while the answer streams, content is a dict
+        node         a graph node finished, content is its state update
+        answer       the final AgentOutput
+        error        the query failed, content is the exception
+    """
+    type: str
+    node: Optional[str] = None
+    content: Any = None
+
+
+class TokenQueueHandler(BaseCallbackHandler):
+    """Forwards LLM tokens, tagged with the graph node that produced them, into a queue."""
+
+    def __init__(self, events: queue.Queue):
+        self.events = events
+        self._nodes: Dict[UUID, Optional[str]] = {}
+
+    def _remember_node(self, run_id: UUID, metadata: Optional[dict]):
+        node = (metadata or {}).get('langgraph_node')
+        self._nodes[run_id] = node
+        self.events.put(StreamEvent(type='llm_start', node=node))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs):
+        self._remember_node(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs):
+        self._remember_node(run_id, metadata)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        if token:
+            self.events.put(StreamEvent(type='token', node=self._nodes.get(run_id), content=token))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._nodes.pop(run_id, None)
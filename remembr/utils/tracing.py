@@ -0,0 +1,253 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+_current_span = contextvars.ContextVar("remembr_current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "OK"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'status': self.status,
+        }
+
+
+class _NoopSpan:
+    """Returned while tracing is off, so callers can set attributes unconditionally."""
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.span = Span(
+            name=self.name,
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent is not None else None,
+            start_ns=time.time_ns(),
+            attributes=self.attributes,
+        )
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.status = "ERROR"
+            self.span.attributes['exception'] = repr(exc)
+        _current_span.reset(self.token)
+        self.tracer._record(self.span)
+        return False
+
+
+class _NoopContext:
+
+    def __enter__(self):
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_CONTEXT = _NoopContext()
+
+
+class Tracer:
+    """
+    Minimal span tracer for queries, graph nodes, LLM calls and memory searches.
+
+    Off by default: span() then returns a shared no-op context and costs one
+    attribute check. When enabled, spans nest through a contextvar (copy the
+    context into worker threads to keep the nesting) and are kept in memory
+    until exported as plain JSON spans or an OTLP/JSON file that OpenTelemetry
+    collectors and viewers can load.
+    """
+
+    def __init__(self, enabled: bool = False, max_spans: int = 100000):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return _NOOP_CONTEXT
+        return _SpanContext(self, name, attributes)
+
+    def current_span(self):
+        span = _current_span.get()
+        return span if span is not None and self.enabled else NOOP_SPAN
+
+    def _record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                self.spans = self.spans[-self.max_spans:]
+
+    ### Reports
+
+    def trace(self, trace_id: str) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.trace_id == trace_id]
+
+    def latency_breakdown(self, trace_id: str) -> dict:
+        """
+        Returns:
+            dict with the total duration of the trace and, per span name, the
+            number of spans and their summed duration in milliseconds
+        """
+        spans = self.trace(trace_id)
+        breakdown = {}
+        for span in spans:
+            entry = breakdown.setdefault(span.name, {'count': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += span.duration_ms
+        roots = [span for span in spans if span.parent_id is None]
+        return {
+            'total_ms': sum(span.duration_ms for span in roots),
+            'spans': breakdown,
+        }
+
+    ### Export
+
+    def export_json(self, path: str):
+        """Write all spans as a JSON list."""
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(spans, f, indent=2, default=str)
+
+    def export_otlp(self, path: str, service_name: str = "remembr"):
+        """Write all spans in the OTLP/JSON format (as produced by the OpenTelemetry file exporter)."""
+        with self._lock:
+            spans = list(self.spans)
+
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span.attributes.items()],
+                'status': {'code': 2 if span.status == "ERROR" else 1},
+            }
+            if span.parent_id is not None:
+                otlp_span['parentSpanId'] = span.parent_id
+            otlp_spans.append(otlp_span)
+
+        data = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'remembr'}, 'spans': otlp_spans}],
+        }]}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def token_usage(message) -> Dict[str, int]:
+    """
+    Prompt and completion token counts reported with an LLM response (or its
+    last streamed chunk): usage_metadata for OpenAI-style backends,
+    prompt_eval_count/eval_count in the response metadata for Ollama.
+
+    Returns:
+        dict with prompt_tokens and/or completion_tokens, empty if the backend reported neither
+    """
+    usage = getattr(message, 'usage_metadata', None) or {}
+    metadata = getattr(message, 'response_metadata', None) or {}
+    counts = {}
+    prompt_tokens = usage.get('input_tokens', metadata.get('prompt_eval_count'))
+    completion_tokens = usage.get('output_tokens', metadata.get('eval_count'))
+    if prompt_tokens is not None:
+        counts['prompt_tokens'] = int(prompt_tokens)
+    if completion_tokens is not None:
+        counts['completion_tokens'] = int(completion_tokens)
+    return counts
+
+
+# shared tracer, off until enable() is called
+tracer = Tracer()
+
+
+def traced(name: Optional[str] = None):
+    """Decorator that runs the function in a span of the shared tracer."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator